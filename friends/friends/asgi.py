@@ -1,7 +1,24 @@
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'friends.settings')
 
-application = get_asgi_application()
+
+class AsyncURLConfASGIHandler(ASGIHandler):
+    '''
+    Resolves the requests with `settings.ASGI_URLCONF`, which routes the
+    read-only endpoints to the async views.
+    '''
+
+    def create_request(self, scope, body_file):
+        request, error_response = super().create_request(scope, body_file)
+        if request is not None:
+            request.urlconf = settings.ASGI_URLCONF
+        return request, error_response
+
+
+django.setup(set_prefix=False)
+application = AsyncURLConfASGIHandler()
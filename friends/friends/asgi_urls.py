@@ -0,0 +1,34 @@
+from django.urls import include, path
+
+from friends import urls
+from users.async_views import (AsyncFriendsView, AsyncSubscribersView,
+                               AsyncSubscriptionsView, AsyncUserDetailView,
+                               AsyncUsersView)
+
+# The async views answer GET requests and hand everything else to the
+# viewsets of the same paths.
+sync_views = {url.name: url.callback for url in urls.router.urls}
+
+async_api_urls = [
+    path('users/', AsyncUsersView.as_view(
+        sync_view=sync_views['users-list']
+    ), name='users-list'),
+    path('users/<int:user_id>/', AsyncUserDetailView.as_view(
+        sync_view=sync_views['users-detail']
+    ), name='users-detail'),
+    path('users/<int:user_id>/subscribers/', AsyncSubscribersView.as_view(
+        sync_view=sync_views['subscribers-list']
+    ), name='subscribers-list'),
+    path('users/<int:user_id>/subscriptions/',
+         AsyncSubscriptionsView.as_view(
+             sync_view=sync_views['subscriptions-list']
+         ), name='subscriptions-list'),
+    path('users/<int:user_id>/friends/', AsyncFriendsView.as_view(
+        sync_view=sync_views['friends-list']
+    ), name='friends-list'),
+]
+
+urlpatterns = [
+    path('api/', include(async_api_urls)),
+    *urls.urlpatterns,
+]
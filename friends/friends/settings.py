@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -24,6 +25,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'users.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -35,6 +37,8 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'friends.urls'
 
+ASGI_URLCONF = 'friends.asgi_urls'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -56,11 +60,42 @@ WSGI_APPLICATION = 'friends.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'users.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
+# Run by `users.sqlite` on every new SQLite connection, None keeps the
+# SQLite defaults.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'mmap_size': 256 * 1024 * 1024,
+    # Negative sizes are in KiB.
+    'cache_size': -64 * 1024,
+    'busy_timeout': 5000,
+}
+
+# PostgreSQL replaces SQLite when `POSTGRES_DB` is set, the variables
+# are those of the official `postgres` image.
+if os.environ.get('POSTGRES_DB'):
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ['POSTGRES_DB'],
+        'USER': os.environ.get('POSTGRES_USER', 'postgres'),
+        'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+        'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+        'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+        # `QuerySet.iterator()` streams rows through server-side
+        # cursors, which a transaction pooler such as PgBouncer breaks.
+        'DISABLE_SERVER_SIDE_CURSORS': (
+            os.environ.get('POSTGRES_DISABLE_SERVER_SIDE_CURSORS') == '1'
+        ),
+    }
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -94,16 +129,41 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'users.pagination.UserListPagination',
     'PAGE_SIZE': 100,
 }
 
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'tokens': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tokens',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+RELATIONSHIP_CACHE = None
+
+FOLLOW_GRAPH = None
+
+TOKEN_CACHE = {
+    'CACHE_ALIAS': 'tokens',
+    'TIMEOUT': 60,
+}
+
+REQUEST_METRICS = {
+    'SAMPLE_RATE': 1.0,
+}
+
+
 LOGGING = {
     'version': 1,
     'handlers': {
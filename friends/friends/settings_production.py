@@ -0,0 +1,75 @@
+'''
+Settings of the production server started by `gunicorn.conf.py`.
+
+Enable with `DJANGO_SETTINGS_MODULE=friends.settings_production`,
+`DJANGO_SECRET_KEY` is required. `REDIS_URL` enables the token cache,
+shared by all workers.
+'''
+import os
+
+from friends.settings import *  # noqa: F401,F403
+from friends.settings import CACHES, DATABASES
+
+SECRET_KEY = os.environ['DJANGO_SECRET_KEY']
+
+DEBUG = False
+
+ALLOWED_HOSTS = os.environ.get(
+    'DJANGO_ALLOWED_HOSTS', 'localhost,127.0.0.1'
+).split(',')
+
+
+# Every WSGI worker keeps its connection between requests and checks
+# it before reusing it after an error. Under ASGI every request runs
+# its queries in a thread of its own, persistent connections would be
+# left open by each of them: they are closed after every request.
+SERVER_INTERFACE = os.environ.get('SERVER_INTERFACE', 'wsgi')
+
+DATABASES = {
+    'default': {
+        **DATABASES['default'],
+        'CONN_MAX_AGE': (
+            0 if SERVER_INTERFACE == 'asgi'
+            else int(os.environ.get('DJANGO_CONN_MAX_AGE', 600))
+        ),
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+
+
+# A token deleted on logout must stop authenticating on every worker
+# at once, which a cache private to the process cannot do. Tokens are
+# cached in Redis when it is configured and read from the database
+# otherwise.
+REDIS_URL = os.environ.get('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        **CACHES,
+        'tokens': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+    }
+else:
+    TOKEN_CACHE = None
+
+
+# A sample of the requests is enough for the histograms, recording
+# every request costs a query wrapper and a lock per response.
+REQUEST_METRICS = {
+    'SAMPLE_RATE': float(os.environ.get('DJANGO_METRICS_SAMPLE_RATE', 0.01)),
+}
+
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'}
+    },
+    'root': {
+        'handlers': ['console'],
+        'level': 'WARNING',
+    },
+}
@@ -2,8 +2,8 @@ from django.contrib import admin
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from users.views import (FriendsViewSet, SubscribersViewSet,
-                         SubscriptionsViewSet, UserViewSet)
+from users.views import (FriendsViewSet, MetricsView, MutualFriendsViewSet,
+                         SubscribersViewSet, SubscriptionsViewSet, UserViewSet)
 
 router = DefaultRouter()
 
@@ -14,10 +14,13 @@ router.register(r'users/(?P<user_id>\d+)/subscriptions', SubscriptionsViewSet,
                 basename='subscriptions')
 router.register(r'users/(?P<user_id>\d+)/friends', FriendsViewSet,
                 basename='friends')
+router.register(r'users/(?P<user_id>\d+)/mutual-friends/(?P<other_id>\d+)',
+                MutualFriendsViewSet, basename='mutual-friends')
 
 api_urls = [
     path('', include(router.urls)),
     path('auth/', include('djoser.urls.authtoken')),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 ]
 
 urlpatterns = [
@@ -0,0 +1,45 @@
+'''
+Gunicorn configuration of the production server.
+
+Gunicorn reads this file from the working directory, so `gunicorn`
+alone starts the service with the `DJANGO_SETTINGS_MODULE` of the
+environment (`friends.settings_production` in the Docker image).
+Environment variables:
+    WEB_CONCURRENCY: worker processes, two per CPU core plus one by
+        default.
+    SERVER_INTERFACE: `wsgi` (default) or `asgi`. The ASGI application
+        serves the read-only endpoints with the async views and runs on
+        uvicorn workers.
+    GUNICORN_BIND: address to listen on, `0.0.0.0:8000` by default.
+'''
+import os
+
+
+def get_cpu_count() -> int:
+    # The cores the container may run on, not all cores of the host.
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+workers = int(os.environ.get('WEB_CONCURRENCY', get_cpu_count() * 2 + 1))
+
+if os.environ.get('SERVER_INTERFACE', 'wsgi') == 'asgi':
+    wsgi_app = 'friends.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'friends.wsgi:application'
+    worker_class = 'sync'
+
+# Django is imported once by the master and shared by the forked
+# workers. No connection is opened while loading the application.
+preload_app = True
+
+# Recycle workers to bound the growth of long-lived processes.
+max_requests = 10000
+max_requests_jitter = 1000
+
+timeout = 30
+graceful_timeout = 30
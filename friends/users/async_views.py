@@ -0,0 +1,256 @@
+import time
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.db.models.query import QuerySet
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.utils.translation import gettext_lazy as _
+from django.views import View
+from rest_framework import exceptions
+from rest_framework.authentication import get_authorization_header
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+
+from users.authentication import check_token, get_token_cache
+from users.pagination import AsyncPageNumberPagination, UserListPagination
+from users.serializers import UserSerializer
+from users.services import (SubscriptionQuerySet,
+                            annotate_follower_and_following_on_request_user,
+                            get_list_validators, get_relationship_stamps,
+                            get_subscription_query_engine)
+
+User = get_user_model()
+
+
+async def authenticate(request):
+    '''
+    Async counterpart of `TokenAuthentication.authenticate`.
+
+    Returns the user of the `Authorization: Token <key>` header, None
+    without the header. Raises the errors of `TokenAuthentication`.
+    Shares the `TokenCache` of `CachedTokenAuthentication`.
+    '''
+    auth = get_authorization_header(request).split()
+    if not auth or auth[0].lower() != b'token':
+        return None
+    if len(auth) == 1:
+        raise exceptions.AuthenticationFailed(
+            _('Invalid token header. No credentials provided.')
+        )
+    if len(auth) > 2:
+        raise exceptions.AuthenticationFailed(
+            _('Invalid token header. '
+              'Token string should not contain spaces.')
+        )
+    try:
+        key = auth[1].decode()
+    except UnicodeError:
+        raise exceptions.AuthenticationFailed(
+            _('Invalid token header. '
+              'Token string should not contain invalid characters.')
+        )
+    cache = get_token_cache()
+    token = None if cache is None else await cache.aget(key)
+    if token is None:
+        token = check_token(
+            await Token.objects.select_related('user').filter(
+                key=key
+            ).afirst()
+        )
+        if cache is not None:
+            await cache.aset(token)
+    return token.user
+
+
+def serialize_user(user) -> dict:
+    '''Output of `UserSerializer` for a user annotated by the views.'''
+    return {
+        'id': user.id,
+        'username': user.username,
+        'friendship_status': UserSerializer.get_status_by_flags(
+            getattr(user, 'is_follower', False),
+            getattr(user, 'is_following', False),
+        ),
+    }
+
+
+class AsyncUserView(View):
+    '''
+    Base of the async read paths served by the ASGI application.
+
+    GET requests are answered with the async ORM, the response body is
+    byte for byte the one of the DRF viewset. Other methods, the
+    browsable API and the keyset pagination mode are handed to
+    `sync_view`, the viewset the path belongs to under WSGI.
+
+    Friendship statuses always come from the `is_follower` and
+    `is_following` annotations, the relationship cache is not used.
+    '''
+    sync_view = None
+    allow_anonymous = False
+    renderer = JSONRenderer()
+
+    async def dispatch(self, request, *args, **kwargs):
+        if not self.is_async_request(request):
+            return await sync_to_async(self.sync_view)(
+                request, *args, **kwargs
+            )
+        return await self.get(request, *args, **kwargs)
+
+    async def get(self, request, *args, **kwargs):
+        try:
+            request.user = await authenticate(request) or AnonymousUser()
+            if request.user.is_anonymous and not self.allow_anonymous:
+                raise exceptions.NotAuthenticated()
+            return await self.get_response(request, **kwargs)
+        except exceptions.APIException as exc:
+            response = self.render({'detail': exc.detail}, exc.status_code)
+            if exc.status_code == 401:
+                response['WWW-Authenticate'] = 'Token'
+            return response
+
+    async def get_response(self, request, **kwargs) -> HttpResponse:
+        return self.render(await self.get_data(request, **kwargs))
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # Same as the DRF views, session requests are not used here.
+        view.csrf_exempt = True
+        return view
+
+    def is_async_request(self, request) -> bool:
+        cursor_mode = (
+            request.GET.get(UserListPagination.pagination_query_param)
+            == UserListPagination.cursor_pagination_value
+        )
+        return (request.method == 'GET'
+                and not cursor_mode
+                and 'format' not in request.GET
+                and request.accepts('application/json'))
+
+    async def get_data(self, request, **kwargs):
+        raise NotImplementedError
+
+    def annotate_relationships(self, queryset: QuerySet) -> QuerySet:
+        queryset = queryset.only('id', 'username')
+        if self.request.user.is_anonymous:
+            return queryset
+        return annotate_follower_and_following_on_request_user(
+            queryset, self.request.user
+        )
+
+    def render(self, data, status=200) -> HttpResponse:
+        started = time.perf_counter()
+        response = HttpResponse(self.renderer.render(data),
+                                content_type='application/json',
+                                status=status)
+        response.metrics_render_duration = time.perf_counter() - started
+        return response
+
+
+class AsyncUserListView(AsyncUserView):
+    '''Paginated user list, the `list` action of the viewsets.'''
+    pagination_class = AsyncPageNumberPagination
+
+    async def get_data(self, request, **kwargs):
+        queryset = await self.get_queryset(**kwargs)
+        paginator = self.pagination_class()
+        users = await paginator.apaginate_queryset(
+            self.annotate_relationships(queryset.order_by('id')), request
+        )
+        return paginator.get_paginated_data(
+            [serialize_user(user) for user in users]
+        )
+
+    async def get_queryset(self, **kwargs) -> QuerySet:
+        raise NotImplementedError
+
+    async def get_user_or_404(self, user_id: int) -> User:
+        if not await User.objects.filter(id=user_id).aexists():
+            raise exceptions.NotFound()
+        return User(id=user_id)
+
+
+class AsyncUsersView(AsyncUserListView):
+    allow_anonymous = True
+
+    async def get_queryset(self, **kwargs):
+        return User.objects.all()
+
+
+class AsyncUserDetailView(AsyncUserView):
+    async def get_data(self, request, user_id):
+        user = await self.annotate_relationships(
+            User.objects.filter(id=user_id)
+        ).afirst()
+        if user is None:
+            raise exceptions.NotFound()
+        return serialize_user(user)
+
+
+class AsyncUserRelationsView(AsyncUserListView):
+    '''
+    Relationship list of the user of the url, answers conditional
+    requests with the validators of `UserRelationsViewSet`.
+    '''
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # Relationship stamps read by the validators of this request.
+        self.stamps = {}
+
+    async def get_response(self, request, user_id):
+        user_ids = [user_id]
+        self.stamps = await sync_to_async(get_relationship_stamps)(
+            [*user_ids, request.user.id]
+        )
+        validators = get_list_validators(
+            self.stamps, user_ids, request.user.id,
+            (request.get_full_path(), self.renderer.media_type),
+        )
+        if validators is None:
+            return await super().get_response(request, user_id=user_id)
+        response = get_conditional_response(request, *validators)
+        if response is None:
+            response = await super().get_response(request, user_id=user_id)
+        etag, last_modified = validators
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True)
+        return response
+
+    def get_subscriptions(self, user: User) -> SubscriptionQuerySet:
+        # The graph and the cache engines load from the database with
+        # queries, which may not run in the event loop: read the lists
+        # with SQL.
+        return SubscriptionQuerySet(user, get_subscription_query_engine(
+            relationship_cache=False, follow_graph=False
+        ))
+
+    async def get_user_or_404(self, user_id: int) -> User:
+        # Only existing users have a stamp.
+        if user_id in self.stamps:
+            return User(id=user_id)
+        return await super().get_user_or_404(user_id)
+
+
+class AsyncSubscribersView(AsyncUserRelationsView):
+    async def get_queryset(self, user_id):
+        user = await self.get_user_or_404(user_id)
+        return self.get_subscriptions(user).get_user_subscribers()
+
+
+class AsyncSubscriptionsView(AsyncUserRelationsView):
+    async def get_queryset(self, user_id):
+        user = await self.get_user_or_404(user_id)
+        return self.get_subscriptions(user).get_user_subscriptions()
+
+
+class AsyncFriendsView(AsyncUserRelationsView):
+    async def get_queryset(self, user_id):
+        user = await self.get_user_or_404(user_id)
+        return self.get_subscriptions(user).get_user_friends()
@@ -0,0 +1,140 @@
+from functools import lru_cache
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import BaseCache, caches
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+
+class TokenCache:
+    '''
+    Token key -> token (with its user) mapping kept in a Django cache.
+
+    Entries live `TIMEOUT` seconds and the size of the cache is bounded
+    by the configured alias (`MAX_ENTRIES` of `LocMemCache`,
+    `maxmemory` of Redis, ...). The key of the user's token is stored
+    under the user id as well, so a saved user is invalidated without
+    a query.
+
+    A local memory alias is private to the process: a token deleted
+    by another worker is seen there only after `TIMEOUT`. Use a shared
+    alias when logout has to apply everywhere at once.
+
+    Options:
+        CACHE_ALIAS: alias in `settings.CACHES`, `default` by default.
+        TIMEOUT: entry lifetime in seconds, 60 by default.
+        KEY_PREFIX: prefix of the cache keys.
+    '''
+
+    def __init__(self, **options) -> None:
+        self.options = options
+        self.cache: BaseCache = caches[options.get('CACHE_ALIAS', 'default')]
+        self.timeout: int = options.get('TIMEOUT', 60)
+        self.key_prefix: str = options.get('KEY_PREFIX', 'token')
+
+    def get(self, key: str) -> Optional[Token]:
+        return self.cache.get(self._token_key(key))
+
+    async def aget(self, key: str) -> Optional[Token]:
+        return await self.cache.aget(self._token_key(key))
+
+    def set(self, token: Token) -> None:
+        self.cache.set_many(self._entries(token), self.timeout)
+
+    async def aset(self, token: Token) -> None:
+        await self.cache.aset_many(self._entries(token), self.timeout)
+
+    def invalidate(self, keys: Iterable[str] = (),
+                   user_ids: Iterable[int] = ()) -> None:
+        cache_keys = [self._token_key(key) for key in keys]
+        user_keys = [self._user_key(user_id) for user_id in user_ids]
+        if user_keys:
+            cache_keys += user_keys
+            cache_keys += [
+                self._token_key(key)
+                for key in self.cache.get_many(user_keys).values()
+            ]
+        if cache_keys:
+            self.cache.delete_many(cache_keys)
+
+    def _entries(self, token: Token) -> dict:
+        return {
+            self._token_key(token.key): token,
+            self._user_key(token.user_id): token.key,
+        }
+
+    def _token_key(self, key: str) -> str:
+        return f'{self.key_prefix}:{key}'
+
+    def _user_key(self, user_id: int) -> str:
+        return f'{self.key_prefix}:user:{user_id}'
+
+
+@lru_cache(maxsize=None)
+def get_token_cache() -> Optional[TokenCache]:
+    '''
+    Return the cache configured by `settings.TOKEN_CACHE`.
+
+    Returns None when the setting is empty, which disables caching.
+    '''
+    config = getattr(settings, 'TOKEN_CACHE', None)
+    if not config:
+        return None
+    return TokenCache(**config)
+
+
+@receiver(setting_changed)
+def reset_token_cache(setting, **kwargs):
+    if setting in ('TOKEN_CACHE', 'CACHES'):
+        get_token_cache.cache_clear()
+
+
+def invalidate_tokens(keys: Iterable[str] = (),
+                      user_ids: Iterable[int] = ()) -> None:
+    """Drop cached tokens by key and by the id of their user."""
+    cache = get_token_cache()
+    if cache is None:
+        return
+    keys, user_ids = list(keys), list(user_ids)
+    cache.invalidate(keys, user_ids)
+    # A request may have cached the pre-commit state in the meantime.
+    transaction.on_commit(lambda: cache.invalidate(keys, user_ids))
+
+
+def check_token(token: Optional[Token]) -> Token:
+    '''Raise the errors of `TokenAuthentication` for a looked up token.'''
+    if token is None:
+        raise exceptions.AuthenticationFailed(_('Invalid token.'))
+    if not token.user.is_active:
+        raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+    return token
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    '''
+    `TokenAuthentication` answering repeated keys from `TokenCache`.
+
+    Only tokens of active users are cached. Entries are dropped when
+    the token is deleted (`token/logout/`) and when its user is saved
+    or deleted, see `users.signals`.
+    '''
+
+    def authenticate_credentials(self, key):
+        cache = get_token_cache()
+        if cache is None:
+            return super().authenticate_credentials(key)
+        token = cache.get(key)
+        if token is None:
+            token = check_token(
+                self.get_model().objects.select_related('user').filter(
+                    key=key
+                ).first()
+            )
+            cache.set(token)
+        return token.user, token
@@ -0,0 +1,35 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = ('DEFERRED', 'EXCLUSIVE', 'IMMEDIATE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    '''
+    SQLite backend accepting the `transaction_mode` option of Django 5.1.
+
+    `'transaction_mode': 'IMMEDIATE'` in `OPTIONS` takes the write lock
+    when a transaction begins. A deferred transaction that reads before
+    it writes fails with "database is locked" as soon as another
+    connection writes, an immediate one waits for the lock up to the
+    busy timeout instead.
+    '''
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        transaction_mode = kwargs.pop('transaction_mode', None)
+        if (transaction_mode is not None
+                and transaction_mode.upper() not in TRANSACTION_MODES):
+            raise ImproperlyConfigured(
+                f'settings.DATABASES[{self.alias!r}]["OPTIONS"]'
+                f'["transaction_mode"] must be one of '
+                f'{", ".join(TRANSACTION_MODES)}.'
+            )
+        self.transaction_mode = transaction_mode
+        return kwargs
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode is None:
+            super()._start_transaction_under_autocommit()
+        else:
+            self.cursor().execute(f'BEGIN {self.transaction_mode}')
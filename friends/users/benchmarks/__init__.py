@@ -0,0 +1,7 @@
+'''
+Performance benchmarks of the service.
+
+Every module of the package registers its benchmarks with
+`users.benchmarks.base.register`; run them with
+`python manage.py benchmark <name> ...`.
+'''
@@ -0,0 +1,135 @@
+import random
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from users.benchmarks.base import register, summarize_latencies
+from users.metrics import record_queries
+from users.snapshots import get_synthetic_graph
+
+DEFAULT_MIX = (
+    'users-list=1,users-detail=2,users-counters=1,subscribers-list=2,'
+    'subscriptions-list=2,friends-list=2,users-relationships=1,'
+    'users-subscribe=1'
+)
+
+Request = Tuple[str, str, dict]
+
+
+class ApiWorkload:
+    '''
+    Builds the requests of the mix for random clients and targets.
+
+    Every name of the mix is a route name of `friends/urls.py`.
+    `users-subscribe` alternates between subscribing and unsubscribing
+    so the graph keeps its shape during the run.
+    '''
+
+    def __init__(self, user_ids: List[int], rng: random.Random) -> None:
+        self.user_ids = user_ids
+        self.rng = rng
+        self.subscribed = set()
+
+    def build(self, name: str, client_id: int) -> Request:
+        target = self.rng.choice(self.user_ids)
+        if name == 'users-list':
+            return 'get', reverse(name), {}
+        if name in ('users-detail', 'users-counters', 'subscribers-list',
+                    'subscriptions-list', 'friends-list'):
+            return 'get', reverse(name, args=(target,)), {}
+        if name == 'users-relationships':
+            ids = self.rng.sample(self.user_ids, min(100, len(self.user_ids)))
+            return 'post', reverse(name), {'ids': ids}
+        if name == 'users-subscribe':
+            if target == client_id:
+                target = next(user_id for user_id in self.user_ids
+                              if user_id != client_id)
+            url = reverse(name, args=(target,))
+            if (client_id, target) in self.subscribed:
+                self.subscribed.discard((client_id, target))
+                return 'delete', url, {}
+            self.subscribed.add((client_id, target))
+            return 'post', url, {}
+        raise ValueError(f'Unknown endpoint in the request mix: {name}')
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for item in mix.split(','):
+        name, _, weight = item.partition('=')
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+@register('api')
+def api_benchmark(options: dict) -> dict:
+    '''
+    Replay a weighted request mix against a synthetic follow graph.
+
+    Reports latency percentiles, queries per request, response size
+    and throughput per endpoint.
+    '''
+    rng = random.Random(options['seed'])
+    graph_started = time.perf_counter()
+    graph = get_synthetic_graph(
+        options['users'], options['degree'], options['graph'],
+        seed=options['seed'],
+    )
+    graph_seconds = time.perf_counter() - graph_started
+
+    clients = {}
+    for user_id in rng.sample(graph.user_ids,
+                              min(options['clients'], len(graph.user_ids))):
+        client = APIClient()
+        token = Token.objects.create(user_id=user_id)
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        clients[user_id] = client
+
+    mix = parse_mix(options['mix'])
+    names = list(mix)
+    workload = ApiWorkload(graph.user_ids, rng)
+    latencies = defaultdict(list)
+    queries = defaultdict(int)
+    sizes = defaultdict(int)
+    errors = defaultdict(int)
+    for _ in range(options['requests']):
+        name = rng.choices(names, weights=list(mix.values()))[0]
+        client_id = rng.choice(list(clients))
+        method, url, data = workload.build(name, client_id)
+        client = clients[client_id]
+        with record_queries() as counter:
+            started = time.perf_counter()
+            if method == 'get':
+                response = client.get(url)
+            else:
+                response = getattr(client, method)(url, data, format='json')
+            latencies[name].append(time.perf_counter() - started)
+        queries[name] += counter.count
+        sizes[name] += len(response.content)
+        if response.status_code >= 400:
+            errors[name] += 1
+
+    endpoints = {}
+    for name, values in sorted(latencies.items()):
+        endpoints[name] = {
+            **summarize_latencies(values),
+            'queries_per_request': round(queries[name] / len(values), 2),
+            'avg_response_bytes': round(sizes[name] / len(values)),
+            'errors': errors[name],
+        }
+    return {
+        'graph': {
+            'users': len(graph.user_ids),
+            'edges': graph.edges,
+            'distribution': options['graph'],
+            'generation_seconds': round(graph_seconds, 3),
+        },
+        'endpoints': endpoints,
+        'total': summarize_latencies(
+            [value for values in latencies.values() for value in values]
+        ),
+    }
@@ -0,0 +1,176 @@
+import asyncio
+import io
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from friends.asgi import AsyncURLConfASGIHandler
+from users.benchmarks.base import register, summarize_latencies
+from users.snapshots import get_synthetic_graph
+
+READ_ROUTES = ('users-list', 'users-detail', 'subscribers-list',
+               'subscriptions-list', 'friends-list')
+
+Request = Tuple[str, str]
+
+
+def build_requests(user_ids: List[int], tokens: List[str], count: int,
+                   rng: random.Random) -> List[Request]:
+    requests = []
+    for _ in range(count):
+        name = rng.choice(READ_ROUTES)
+        if name == 'users-list':
+            path = reverse(name)
+        else:
+            path = reverse(name, args=(rng.choice(user_ids),))
+        requests.append((path, rng.choice(tokens)))
+    return requests
+
+
+def wsgi_request(application: WSGIHandler, request: Request) -> int:
+    path, token = request
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'QUERY_STRING': '',
+        'SERVER_NAME': 'testserver',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_AUTHORIZATION': f'Token {token}',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    statuses = []
+    response = application(
+        environ, lambda status, headers: statuses.append(status)
+    )
+    try:
+        b''.join(response)
+    finally:
+        response.close()
+    return int(statuses[0].split()[0])
+
+
+async def asgi_request(application: ASGIHandler, request: Request) -> int:
+    path, token = request
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': b'',
+        'root_path': '',
+        'headers': [(b'host', b'testserver'),
+                    (b'authorization', f'Token {token}'.encode())],
+        'client': ('127.0.0.1', 0),
+        'server': ('testserver', 80),
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await application(scope, receive, send)
+    return messages[0]['status']
+
+
+def run_wsgi(application: WSGIHandler, requests: List[Request],
+             concurrency: int) -> dict:
+    def timed_request(request):
+        started = time.perf_counter()
+        status = wsgi_request(application, request)
+        return time.perf_counter() - started, status
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed_request, requests))
+    return summarize_run(results, time.perf_counter() - started)
+
+
+def run_asgi(application: ASGIHandler, requests: List[Request],
+             concurrency: int) -> dict:
+    async def run():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def timed_request(request):
+            async with semaphore:
+                started = time.perf_counter()
+                status = await asgi_request(application, request)
+                return time.perf_counter() - started, status
+
+        return await asyncio.gather(*map(timed_request, requests))
+
+    # A thread of its own gives the event loop a fresh context, so the
+    # requests do not share the database connections of this thread.
+    output = {}
+
+    def serve():
+        started = time.perf_counter()
+        results = asyncio.run(run())
+        output['summary'] = summarize_run(results,
+                                          time.perf_counter() - started)
+
+    thread = threading.Thread(target=serve)
+    thread.start()
+    thread.join()
+    return output['summary']
+
+
+def summarize_run(results: List[Tuple[float, int]], seconds: float) -> dict:
+    return {
+        **summarize_latencies([latency for latency, _ in results]),
+        # Wall clock throughput of the concurrent clients.
+        'throughput_rps': round(len(results) / seconds, 1),
+        'errors': sum(status >= 400 for _, status in results),
+    }
+
+
+@register('asgi')
+def asgi_benchmark(options: dict) -> dict:
+    '''
+    Compare the concurrent throughput of the read endpoints under WSGI,
+    ASGI with the sync viewsets and ASGI with the async views.
+
+    `--clients` requests are in flight at any time, the applications
+    are called in process, so no server or socket is measured.
+    '''
+    graph = get_synthetic_graph(
+        options['users'], options['degree'], options['graph'],
+        seed=options['seed'],
+    )
+    rng = random.Random(options['seed'])
+    tokens = [
+        Token.objects.create(user_id=user_id).key
+        for user_id in rng.sample(graph.user_ids,
+                                  min(options['clients'],
+                                      len(graph.user_ids)))
+    ]
+    requests = build_requests(graph.user_ids, tokens, options['requests'],
+                              rng)
+    concurrency = options['clients']
+    return {
+        'concurrency': concurrency,
+        'wsgi': run_wsgi(WSGIHandler(), requests, concurrency),
+        'asgi_sync_views': run_asgi(ASGIHandler(), requests, concurrency),
+        'asgi_async_views': run_asgi(AsyncURLConfASGIHandler(), requests,
+                                     concurrency),
+    }
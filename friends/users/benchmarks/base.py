@@ -0,0 +1,60 @@
+import math
+import time
+from typing import Callable, Dict, List
+
+from users.metrics import record_queries
+
+Benchmark = Callable[[dict], dict]
+
+BENCHMARKS: Dict[str, Benchmark] = {}
+
+
+def register(name: str) -> Callable[[Benchmark], Benchmark]:
+    '''
+    Register a benchmark under `name`.
+
+    A benchmark takes the command options and returns a JSON
+    serializable dict of results. It runs against the current database,
+    which the `benchmark` command replaces with a fresh test database.
+    '''
+    def decorator(benchmark: Benchmark) -> Benchmark:
+        BENCHMARKS[name] = benchmark
+        return benchmark
+    return decorator
+
+
+def percentile(values: List[float], percent: float) -> float:
+    '''Nearest-rank percentile of `values`.'''
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def summarize_latencies(latencies: List[float]) -> dict:
+    '''Latency percentiles in milliseconds and throughput per second.'''
+    total = sum(latencies)
+    return {
+        'count': len(latencies),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'throughput_rps': round(len(latencies) / total, 1) if total else 0,
+    }
+
+
+def measure(function: Callable[[], object], repeat: int) -> dict:
+    '''Run `function` `repeat` times and summarize time and queries.'''
+    latencies = []
+    queries = 0
+    for _ in range(repeat):
+        with record_queries() as counter:
+            started = time.perf_counter()
+            function()
+            latencies.append(time.perf_counter() - started)
+        queries += counter.count
+    return {
+        **summarize_latencies(latencies),
+        'queries_per_call': round(queries / repeat, 2) if repeat else 0,
+    }
@@ -0,0 +1,118 @@
+import random
+import time
+from typing import Callable, List
+
+from django.db import transaction
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from users.benchmarks.base import measure, register
+from users.benchmarks.queries import get_most_followed_user
+from users.benchmarks.suggestions import RECIPROCITY
+from users.benchmarks.writes import get_client
+from users.events import get_follow_event_settings
+from users.metrics import record_queries
+from users.models import Follow
+from users.snapshots import get_synthetic_graph
+
+# Changes made to the relationships of the user before each feed read.
+CHANGES = (10, 100, 1000)
+
+
+def read_lists(client: APIClient, user_id: int) -> dict:
+    '''Page through the three relationship lists of the user.'''
+    totals = {'items': 0, 'requests': 0, 'bytes': 0}
+    for basename in ('subscribers', 'subscriptions', 'friends'):
+        url = reverse(f'{basename}-list', args=(user_id,))
+        while url:
+            response = client.get(url)
+            data = response.json()
+            totals['items'] += len(data['results'])
+            totals['requests'] += 1
+            totals['bytes'] += len(response.content)
+            url = data['next']
+    return totals
+
+
+def read_changes(client: APIClient, user_id: int, cursor: int) -> dict:
+    '''Read the change feed of the user from `cursor` to its end.'''
+    url = reverse('users-changes', args=(user_id,))
+    limit = get_follow_event_settings()['MAX_PAGE_SIZE']
+    totals = {'items': 0, 'requests': 0, 'bytes': 0}
+    has_more = True
+    while has_more:
+        response = client.get(url, {'since': cursor, 'limit': limit})
+        data = response.json()
+        totals['items'] += len(data['results'])
+        totals['requests'] += 1
+        totals['bytes'] += len(response.content)
+        cursor, has_more = data['cursor'], data['has_more']
+    return totals
+
+
+def measure_sync(read: Callable[[], dict]) -> dict:
+    with record_queries() as queries:
+        started = time.perf_counter()
+        totals = read()
+        seconds = time.perf_counter() - started
+    return {**totals, 'ms': round(seconds * 1000, 3),
+            'queries': queries.count}
+
+
+def toggle_follows(user_id: int, user_ids: List[int], changes: int,
+                   rng: random.Random) -> None:
+    '''Follow or unfollow the user from `changes` random users.'''
+    for follower_id in rng.sample(user_ids, changes):
+        follows = Follow.objects.filter(user=follower_id, following=user_id)
+        # One transaction per change, like the subscribe endpoint.
+        with transaction.atomic():
+            if follows.exists():
+                follows.delete()
+            else:
+                Follow.objects.create(user_id=follower_id,
+                                      following_id=user_id)
+
+
+@register('follow_changes')
+def follow_changes_benchmark(options: dict) -> dict:
+    '''
+    Compare syncing the relationships of the most followed user from
+    the change feed with paging through all of its lists again.
+
+    The feed is read after 10, 100 and 1000 follows or unfollows of
+    the user. Also times a follow with an unfollow, with and without
+    writing the events. Half of the follows of the graph are followed
+    back, so the friends list is not empty.
+    '''
+    graph = get_synthetic_graph(
+        options['users'], options['degree'], options['graph'],
+        reciprocity=RECIPROCITY, seed=options['seed'],
+    )
+    rng = random.Random(options['seed'])
+    user = get_most_followed_user(graph.user_ids)
+    client = get_client(user)
+    others = [user_id for user_id in graph.user_ids if user_id != user.id]
+    results = {'full_listing': measure_sync(
+        lambda: read_lists(client, user.id)
+    )}
+    for changes in CHANGES:
+        if changes > len(others):
+            break
+        cursor = client.get(
+            reverse('users-changes', args=(user.id,))
+        ).json()['cursor']
+        toggle_follows(user.id, others, changes, rng)
+        results[f'changes_{changes}'] = measure_sync(
+            lambda: read_changes(client, user.id, cursor)
+        )
+    other_id = rng.choice(others)
+    events = get_follow_event_settings()
+    for name, enabled in (('write_with_events', True),
+                          ('write_without_events', False)):
+        with override_settings(FOLLOW_EVENTS={**events, 'ENABLED': enabled}):
+            # A follow and an unfollow per call.
+            results[name] = measure(lambda: [
+                toggle_follows(user.id, [other_id], 1, rng) for _ in range(2)
+            ], options['repeat'])
+    return results
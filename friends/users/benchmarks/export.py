@@ -0,0 +1,66 @@
+import time
+import tracemalloc
+
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from users.benchmarks.base import register
+from users.benchmarks.queries import get_most_followed_user
+from users.metrics import record_queries
+from users.snapshots import get_synthetic_graph
+
+
+def walk_pages(client: APIClient, url: str) -> int:
+    users = 0
+    while url:
+        data = client.get(url).json()
+        users += len(data['results'])
+        url = data['next']
+    return users
+
+
+def read_export(client: APIClient, url: str) -> int:
+    users = 0
+    for chunk in client.get(url).streaming_content:
+        users += chunk.count(b'\n')
+    return users
+
+
+@register('export')
+def export_benchmark(options: dict) -> dict:
+    '''
+    Read all subscribers of the most followed user page by page and
+    with the streaming NDJSON export.
+
+    Reports time, queries and the peak of Python memory of each way.
+    '''
+    graph = get_synthetic_graph(
+        options['users'], options['degree'], options['graph'],
+        seed=options['seed'],
+    )
+    user = get_most_followed_user(graph.user_ids)
+    client = APIClient()
+    client.credentials(
+        HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}'
+    )
+    results = {}
+    for name, read, url in (
+        ('pages', walk_pages, reverse('subscribers-list', args=(user.id,))),
+        ('export', read_export,
+         reverse('subscribers-export', args=(user.id,))),
+    ):
+        tracemalloc.start()
+        with record_queries() as queries:
+            started = time.perf_counter()
+            users = read(client, url)
+            seconds = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[name] = {
+            'users': users,
+            'ms': round(seconds * 1000, 3),
+            'queries': queries.count,
+            'peak_memory_kb': round(peak / 1024),
+        }
+    return results
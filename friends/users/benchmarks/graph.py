@@ -0,0 +1,131 @@
+import random
+import time
+import tracemalloc
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count
+
+from users.benchmarks.base import measure, register
+from users.benchmarks.suggestions import RECIPROCITY
+from users.graph import FollowGraph
+from users.models import Follow, Friendship
+from users.services import SubqueryEngine, SubscriptionQuerySet
+from users.snapshots import get_synthetic_graph
+from users.suggestions import get_mutual_friends
+
+User = get_user_model()
+
+
+def measure_set_memory() -> int:
+    '''
+    Bytes allocated by the follows as the `frozenset` rows of the
+    relationship cache, in both directions.
+    '''
+    tracemalloc.start()
+    try:
+        following, followers = defaultdict(set), defaultdict(set)
+        for user_id, following_id in Follow.objects.values_list(
+                'user', 'following').iterator(chunk_size=10000):
+            following[user_id].add(following_id)
+            followers[following_id].add(user_id)
+        rows = {
+            'following': {key: frozenset(ids)
+                          for key, ids in following.items()},
+            'followers': {key: frozenset(ids)
+                          for key, ids in followers.items()},
+        }
+        del following, followers
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del rows
+    return size
+
+
+def get_graph_calls(graph: FollowGraph, user: User, other: User) -> dict:
+    return {
+        'subscribers': lambda: graph.subscribers(user.id),
+        'subscriptions': lambda: graph.subscriptions(user.id),
+        'friends': lambda: graph.friends(user.id),
+        'mutual_friends': lambda: graph.mutual_friends(user.id, other.id),
+        'is_follower': lambda: graph.is_follower(user.id, other.id),
+        'is_following': lambda: graph.is_following(user.id, other.id),
+    }
+
+
+def get_sql_calls(user: User, other: User) -> dict:
+    subscriptions = SubscriptionQuerySet(user, SubqueryEngine())
+    return {
+        'subscribers': lambda: list(subscriptions.get_user_subscribers()
+                                    .values_list('id', flat=True)),
+        'subscriptions': lambda: list(subscriptions.get_user_subscriptions()
+                                      .values_list('id', flat=True)),
+        'friends': lambda: list(subscriptions.get_user_friends()
+                                .values_list('id', flat=True)),
+        'mutual_friends': lambda: list(get_mutual_friends(user, other)
+                                       .values_list('id', flat=True)),
+        'is_follower': lambda: Follow.objects.filter(
+            user=other, following=user
+        ).exists(),
+        'is_following': lambda: Follow.objects.filter(
+            user=user, following=other
+        ).exists(),
+    }
+
+
+@register('follow_graph')
+def follow_graph_benchmark(options: dict) -> dict:
+    '''
+    Measure the memory and the speed of the in-memory follow graph.
+
+    Reports the bytes per follow of the graph arrays next to the
+    `frozenset` rows of the relationship cache, the load time, and
+    every relationship question answered by the graph and by SQL for
+    the user with the most friends and a random user. Half of the
+    follows of the graph are followed back.
+    '''
+    graph = get_synthetic_graph(
+        options['users'], options['degree'], options['graph'],
+        reciprocity=RECIPROCITY, seed=options['seed'],
+    )
+    rng = random.Random(options['seed'])
+    edges = Follow.objects.count()
+    started = time.perf_counter()
+    follow_graph = FollowGraph.from_database()
+    load_seconds = time.perf_counter() - started
+    set_bytes = measure_set_memory()
+    results = {
+        'memory': {
+            'edges': edges,
+            'graph_bytes': follow_graph.nbytes,
+            'graph_bytes_per_edge': round(follow_graph.nbytes / edges, 2),
+            'sets_bytes_per_edge': round(set_bytes / edges, 2),
+            'load_ms': round(load_seconds * 1000, 1),
+        },
+    }
+    hub_id = Friendship.objects.values('user').annotate(
+        total=Count('id')
+    ).order_by('-total').values_list('user', flat=True).first()
+    users = {
+        'hub': User.objects.get(id=hub_id or graph.user_ids[0]),
+        'random': User.objects.get(id=rng.choice(graph.user_ids)),
+    }
+    repeat = options['repeat']
+    for name, user in users.items():
+        other = users['random' if name == 'hub' else 'hub']
+        results[name] = {
+            'graph': {
+                call_name: measure(call, repeat) for call_name, call
+                in get_graph_calls(follow_graph, user, other).items()
+            },
+            'sql': {
+                call_name: measure(call, repeat) for call_name, call
+                in get_sql_calls(user, other).items()
+            },
+        }
+    new_edge = (users['random'].id, users['hub'].id)
+    results['update'] = measure(lambda: (follow_graph.add([new_edge]),
+                                         follow_graph.remove([new_edge])),
+                                repeat)
+    return results
@@ -0,0 +1,134 @@
+import random
+from typing import Dict, List
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count, Q
+from django.db.models.query import QuerySet
+
+from users.benchmarks.base import measure, register
+from users.models import Follow
+from users.services import (JoinEngine, SubqueryEngine, SubscriptionQuerySet,
+                            annotate_follower_and_following_on_request_user)
+from users.snapshots import get_synthetic_graph
+from users.suggestions import (get_expanded_friends, get_friends_of_friends,
+                               get_mutual_friends)
+
+User = get_user_model()
+
+
+def get_relationship_queries(user: User,
+                             request_user: User) -> Dict[str, QuerySet]:
+    '''
+    Querysets of every follow-graph read path, as the views run them.
+
+    `user` is the user whose relations are listed, `request_user` the
+    one the friendship statuses are annotated for.
+    '''
+    subscriptions = SubscriptionQuerySet(user)
+    queries = {
+        'users': User.objects.all(),
+        'subscribers': subscriptions.get_user_subscribers(),
+        'subscriptions': subscriptions.get_user_subscriptions(),
+        'friends': subscriptions.get_user_friends(),
+    }
+    queries = {
+        name: annotate_follower_and_following_on_request_user(
+            queryset.order_by('id'), request_user
+        )[:100]
+        for name, queryset in queries.items()
+    }
+    queries['relationships'] = Follow.objects.filter(
+        Q(user=request_user) | Q(following=request_user)
+    ).values_list('user', 'following')
+    queries['is_follower'] = Follow.objects.filter(
+        user=user, following=request_user
+    )
+    queries['is_following'] = Follow.objects.filter(
+        user=request_user, following=user
+    )
+    queries['mutual_friends'] = get_mutual_friends(
+        user, request_user
+    ).order_by('id')[:100]
+    queries['expanded_friends'] = get_expanded_friends(user.id, 100, 500)
+    friend_ids = list(queries['expanded_friends'])
+    if friend_ids:
+        # Without friends there is nothing to expand, nor to explain.
+        queries['friends_of_friends'] = get_friends_of_friends(
+            user.id, friend_ids
+        )[:100]
+    return queries
+
+
+SUBSCRIPTION_ENGINES = {
+    'subquery': SubqueryEngine,
+    'join': JoinEngine,
+}
+
+
+def get_most_followed_user(user_ids: List[int]) -> User:
+    celebrity_id = Follow.objects.values('following').annotate(
+        total=Count('id')
+    ).order_by('-total').values_list('following', flat=True).first()
+    return User.objects.get(id=celebrity_id or user_ids[0])
+
+
+@register('queries')
+def queries_benchmark(options: dict) -> dict:
+    '''
+    Time every follow-graph query for the most followed user.
+
+    Covers the `SubscriptionQuerySet` sets and the friendship status
+    annotations on a synthetic graph.
+    '''
+    graph = get_synthetic_graph(
+        options['users'], options['degree'], options['graph'],
+        seed=options['seed'],
+    )
+    rng = random.Random(options['seed'])
+    user = get_most_followed_user(graph.user_ids)
+    request_user = User.objects.get(id=rng.choice(graph.user_ids))
+    return {
+        name: measure(lambda queryset=queryset: list(queryset.all()),
+                      options['repeat'])
+        for name, queryset in get_relationship_queries(
+            user, request_user
+        ).items()
+    }
+
+
+@register('subscription_engines')
+def subscription_engines_benchmark(options: dict) -> dict:
+    '''
+    Compare the `SubscriptionQuerySet` engines on the same graph.
+
+    Every set is read whole, and as the first page the views serve, for
+    the most followed user and for a random one.
+    '''
+    graph = get_synthetic_graph(
+        options['users'], options['degree'], options['graph'],
+        seed=options['seed'],
+    )
+    rng = random.Random(options['seed'])
+    users = {
+        'most_followed': get_most_followed_user(graph.user_ids),
+        'random': User.objects.get(id=rng.choice(graph.user_ids)),
+    }
+    results = {}
+    for engine_name, engine_class in SUBSCRIPTION_ENGINES.items():
+        results[engine_name] = {}
+        for user_name, user in users.items():
+            subscriptions = SubscriptionQuerySet(user, engine_class())
+            for set_name, queryset in (
+                ('subscribers', subscriptions.get_user_subscribers()),
+                ('subscriptions', subscriptions.get_user_subscriptions()),
+            ):
+                pages = {
+                    'all': queryset.values_list('id', flat=True),
+                    'page': queryset.order_by('id')[:100],
+                }
+                for page_name, page in pages.items():
+                    results[engine_name][
+                        f'{user_name}.{set_name}.{page_name}'
+                    ] = measure(lambda page=page: list(page.all()),
+                                options['repeat'])
+    return results
@@ -0,0 +1,55 @@
+import random
+
+from django.contrib.auth import get_user_model
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from users.benchmarks.base import measure, register
+from users.serializers import UserSerializer, serialize_user_values
+from users.services import annotate_follower_and_following_on_request_user
+from users.snapshots import get_synthetic_graph
+
+User = get_user_model()
+
+PAGE_ROWS = 10000
+
+
+@register('serializers')
+def serializers_benchmark(options: dict) -> dict:
+    '''
+    Serialize a page of up to 10k users with `UserSerializer` and with
+    the `serialize_user_values` fast path.
+
+    Times the query, the serialization and the JSON rendering of each
+    path and checks that both render the same bytes.
+    '''
+    graph = get_synthetic_graph(
+        max(options['users'], PAGE_ROWS), options['degree'],
+        options['graph'], seed=options['seed'],
+    )
+    request = APIRequestFactory().get('/')
+    request.user = User.objects.get(
+        id=random.Random(options['seed']).choice(graph.user_ids)
+    )
+    users = annotate_follower_and_following_on_request_user(
+        User.objects.order_by('id'), request.user
+    )[:PAGE_ROWS]
+    rows = users.values('id', 'username', 'is_follower', 'is_following')
+    renderer = JSONRenderer()
+
+    def render_serializer():
+        return renderer.render(UserSerializer(
+            users.all(), many=True, context={'request': request}
+        ).data)
+
+    def render_values():
+        return renderer.render(serialize_user_values(rows.all()))
+
+    if render_serializer() != render_values():
+        raise AssertionError('The fast path renders different bytes.')
+    repeat = max(options['repeat'] // 10, 1)
+    return {
+        'rows': len(rows),
+        'serializer': measure(render_serializer, repeat),
+        'values': measure(render_values, repeat),
+    }
@@ -0,0 +1,202 @@
+import os
+import random
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.db import connection
+from rest_framework.authtoken.models import Token
+
+from users.benchmarks.asgi import Request, build_requests, summarize_run
+from users.benchmarks.base import register
+from users.snapshots import get_synthetic_graph
+
+STARTUP_TIMEOUT = 60
+
+# Settings module, command and extra environment of every server.
+SERVERS = {
+    # The command of the Docker image before the production settings.
+    'runserver': ('friends.settings',
+                  ('manage.py', 'runserver', '{address}'), {}),
+    'gunicorn': ('friends.settings_production',
+                 ('-m', 'gunicorn', '--bind', '{address}'), {}),
+    'gunicorn_asgi': ('friends.settings_production',
+                      ('-m', 'gunicorn', '--bind', '{address}'),
+                      {'SERVER_INTERFACE': 'asgi'}),
+}
+
+SETTINGS_TEMPLATE = '''from {module} import *  # noqa
+DATABASES = {{'default': {{**DATABASES['default'], 'NAME': {name!r}}}}}
+'''
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def copy_database(directory: str) -> str:
+    '''
+    Name of a database the server processes can open.
+
+    An SQLite test database lives in the memory of this process, so it
+    is copied to a file; other backends share the test database.
+    '''
+    if connection.vendor != 'sqlite':
+        return connection.settings_dict['NAME']
+    path = os.path.join(directory, 'db.sqlite3')
+    connection.ensure_connection()
+    target = sqlite3.connect(path)
+    try:
+        connection.connection.backup(target)
+    finally:
+        target.close()
+    return path
+
+
+def send_request(base_url: str, request: Request) -> int:
+    path, token = request
+    http_request = urllib.request.Request(
+        base_url + path, headers={'Authorization': f'Token {token}'}
+    )
+    try:
+        with urllib.request.urlopen(http_request, timeout=30) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as error:
+        return error.code
+
+
+def wait_for_server(base_url: str, request: Request,
+                    process: subprocess.Popen) -> None:
+    deadline = time.perf_counter() + STARTUP_TIMEOUT
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'The server exited with {process.returncode}.')
+        try:
+            send_request(base_url, request)
+            return
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.05)
+    raise RuntimeError('The server did not start in time.')
+
+
+def stop_server(process: subprocess.Popen) -> None:
+    # The process group also holds the autoreloader child and workers.
+    os.killpg(process.pid, signal.SIGTERM)
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+
+
+def run_server(name: str, directory: str, database: str,
+               requests: List[Request], concurrency: int) -> dict:
+    module, arguments, extra_env = SERVERS[name]
+    settings_name = f'benchmark_{name}_settings'
+    Path(directory, f'{settings_name}.py').write_text(
+        SETTINGS_TEMPLATE.format(module=module, name=database)
+    )
+    address = f'127.0.0.1:{get_free_port()}'
+    base_url = f'http://{address}'
+    env = {
+        **os.environ,
+        **extra_env,
+        'DJANGO_SETTINGS_MODULE': settings_name,
+        'DJANGO_SECRET_KEY': os.environ.get('DJANGO_SECRET_KEY',
+                                            'benchmark'),
+        'PYTHONPATH': os.pathsep.join((directory, str(settings.BASE_DIR))),
+    }
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        (sys.executable, *(
+            argument.format(address=address) for argument in arguments
+        )),
+        cwd=settings.BASE_DIR, env=env, start_new_session=True,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_server(base_url, requests[0], process)
+        startup = time.perf_counter() - started
+        # Every worker answers a few requests before the timed run.
+        for request in requests[:concurrency * 2]:
+            send_request(base_url, request)
+
+        def timed_request(request):
+            request_started = time.perf_counter()
+            status = send_request(base_url, request)
+            return time.perf_counter() - request_started, status
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(timed_request, requests))
+        summary = summarize_run(results, time.perf_counter() - started)
+    finally:
+        stop_server(process)
+    return {'startup_ms': round(startup * 1000, 1), **summary}
+
+
+def get_available_servers() -> Dict[str, Optional[str]]:
+    '''Server names mapped to the module they miss, None if runnable.'''
+    available = {}
+    for name, (_, arguments, extra_env) in SERVERS.items():
+        modules = []
+        if 'gunicorn' in arguments:
+            modules.append('gunicorn')
+        if extra_env.get('SERVER_INTERFACE') == 'asgi':
+            modules.append('uvicorn')
+        missing = None
+        for module in modules:
+            try:
+                __import__(module)
+            except ImportError:
+                missing = module
+        available[name] = missing
+    return available
+
+
+@register('server')
+def server_benchmark(options: dict) -> dict:
+    '''
+    Compare startup and HTTP throughput of the development server of
+    the old image with the production gunicorn server.
+
+    Each server runs in its own processes on a copy of the benchmark
+    database and is timed from launch to its first answer, then with
+    `--clients` concurrent clients over real sockets.
+    '''
+    graph = get_synthetic_graph(
+        options['users'], options['degree'], options['graph'],
+        seed=options['seed'],
+    )
+    rng = random.Random(options['seed'])
+    tokens = [
+        Token.objects.create(user_id=user_id).key
+        for user_id in rng.sample(graph.user_ids,
+                                  min(options['clients'],
+                                      len(graph.user_ids)))
+    ]
+    requests = build_requests(graph.user_ids, tokens, options['requests'],
+                              rng)
+    results = {'cpus': os.cpu_count(), 'concurrency': options['clients']}
+    with tempfile.TemporaryDirectory() as directory:
+        database = copy_database(directory)
+        for name, missing in get_available_servers().items():
+            if missing is not None:
+                results[name] = {'skipped': f'{missing} is not installed'}
+                continue
+            results[name] = run_server(name, directory, database, requests,
+                                       options['clients'])
+    return results
@@ -0,0 +1,154 @@
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Iterator, List
+
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError, connection, connections
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory
+
+from users.benchmarks.base import register, summarize_latencies
+from users.benchmarks.server import copy_database
+from users.benchmarks.writes import follow_and_unfollow, sample_new_follows
+from users.services import SubscriptionQuerySet
+from users.snapshots import get_synthetic_graph
+from users.sqlite import get_sqlite_pragmas
+
+User = get_user_model()
+
+READ_PAGE = 100
+
+
+@contextmanager
+def use_database_file(name: str, options: dict) -> Iterator[None]:
+    '''
+    Point the connections opened by other threads at the file `name`
+    opened with `options`.
+
+    Connections share the settings dict, the connection of this thread
+    stays on the test database.
+    '''
+    settings_dict = connection.settings_dict
+    old_name, old_options = settings_dict['NAME'], settings_dict['OPTIONS']
+    settings_dict['NAME'], settings_dict['OPTIONS'] = name, options
+    try:
+        yield
+    finally:
+        settings_dict['NAME'], settings_dict['OPTIONS'] = (old_name,
+                                                           old_options)
+
+
+def run_mixed_load(user_ids: List[int], pairs: List[tuple], readers: int,
+                   reads: int) -> dict:
+    '''
+    `readers` threads list subscribers while the writer threads follow
+    and unfollow `pairs` until the reads are done.
+    '''
+    factory = APIRequestFactory()
+    users = User.objects.in_bulk({user_id for user_id, _ in pairs})
+    writers = len(pairs)
+    done = threading.Event()
+    barrier = threading.Barrier(readers + writers + 1)
+    rng = random.Random(0)
+    read_batches = [
+        [rng.choice(user_ids) for _ in range(reads // readers)]
+        for _ in range(readers)
+    ]
+
+    def read(batch):
+        try:
+            barrier.wait()
+            results = []
+            for user_id in batch:
+                started = time.perf_counter()
+                try:
+                    len(SubscriptionQuerySet(User(id=user_id))
+                        .get_user_subscribers()[:READ_PAGE])
+                    succeeded = True
+                except DatabaseError:
+                    succeeded = False
+                results.append((time.perf_counter() - started, succeeded))
+            return results
+        finally:
+            connections.close_all()
+
+    def write(pair):
+        user_id, following_id = pair
+        try:
+            barrier.wait()
+            results = []
+            while not done.is_set():
+                started = time.perf_counter()
+                succeeded = follow_and_unfollow(factory, users[user_id],
+                                                following_id)
+                results.append((time.perf_counter() - started, succeeded))
+            return results
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=readers + writers) as executor:
+        write_futures = [executor.submit(write, pair) for pair in pairs]
+        read_futures = [executor.submit(read, batch)
+                        for batch in read_batches]
+        barrier.wait()
+        started = time.perf_counter()
+        read_results = [result for future in read_futures
+                        for result in future.result()]
+        seconds = time.perf_counter() - started
+        done.set()
+        write_results = [result for future in write_futures
+                         for result in future.result()]
+    return {
+        'reads': summarize_results(read_results, seconds),
+        'writes': summarize_results(write_results, seconds),
+    }
+
+
+def summarize_results(results: List[tuple], seconds: float) -> dict:
+    succeeded = sum(success for _, success in results)
+    return {
+        **summarize_latencies([latency for latency, _ in results]),
+        'throughput_rps': round(succeeded / seconds, 1),
+        'errors': len(results) - succeeded,
+    }
+
+
+@register('sqlite_pragmas')
+def sqlite_pragmas_benchmark(options: dict) -> dict:
+    '''
+    Compare concurrent subscriber reads and follow writes on an SQLite
+    file with the SQLite defaults and with the tuned profile
+    (`settings.SQLITE_PRAGMAS` and immediate transactions).
+
+    `--clients` threads read while a quarter as many threads write.
+    Every profile runs on its own copy of the benchmark database.
+    '''
+    if connection.vendor != 'sqlite':
+        return {'skipped': 'SQLite only'}
+    graph = get_synthetic_graph(
+        options['users'], options['degree'], options['graph'],
+        seed=options['seed'],
+    )
+    writers = max(options['clients'] // 4, 1)
+    pairs = sample_new_follows(graph.user_ids, writers,
+                               random.Random(options['seed']))
+    # The SQLite defaults and the tuned profile of the settings.
+    profiles = {
+        'defaults': (None, {}),
+        'tuned': (get_sqlite_pragmas(), connection.settings_dict['OPTIONS']),
+    }
+    results = {}
+    for profile, (pragmas, database_options) in profiles.items():
+        with tempfile.TemporaryDirectory() as directory:
+            name = copy_database(directory)
+            with override_settings(SQLITE_PRAGMAS=pragmas):
+                with use_database_file(name, database_options):
+                    results[profile] = run_mixed_load(
+                        graph.user_ids, pairs, options['clients'],
+                        options['requests'],
+                    )
+    return results
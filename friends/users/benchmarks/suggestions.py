@@ -0,0 +1,84 @@
+import random
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db.models import Count
+
+from users.benchmarks.base import measure, register
+from users.models import Friendship
+from users.snapshots import get_synthetic_graph
+from users.suggestions import (get_expanded_friends, get_friend_suggestions,
+                               get_mutual_friends, get_suggestion_settings,
+                               rank_friends_of_friends)
+
+User = get_user_model()
+
+UNCAPPED = 10 ** 9
+
+# Share of the follows followed back, random follows alone make almost
+# no friends.
+RECIPROCITY = 0.5
+
+
+def measure_suggestions(user_id: int, max_friends: int,
+                        max_friend_friends: int, repeat: int) -> dict:
+    friend_ids = list(get_expanded_friends(user_id, max_friends,
+                                           max_friend_friends))
+    limit = get_suggestion_settings()['MAX_SUGGESTIONS']
+    return {
+        **measure(lambda: rank_friends_of_friends(
+            user_id, max_friends, max_friend_friends, limit
+        ), repeat),
+        'expanded_friends': len(friend_ids),
+        'rows_read': Friendship.objects.filter(user__in=friend_ids).count(),
+    }
+
+
+@register('friend_suggestions')
+def friend_suggestions_benchmark(options: dict) -> dict:
+    '''
+    Time mutual friends and friends-of-friends suggestions for the user
+    with the most friends and for a random user.
+
+    Half of the follows of the graph are followed back. Suggestions
+    run with the caps of `FRIEND_SUGGESTIONS`, uncapped and from the
+    cache.
+    '''
+    graph = get_synthetic_graph(
+        options['users'], options['degree'], options['graph'],
+        reciprocity=RECIPROCITY, seed=options['seed'],
+    )
+    rng = random.Random(options['seed'])
+    hub_id = Friendship.objects.values('user').annotate(
+        total=Count('id')
+    ).order_by('-total').values_list('user', flat=True).first()
+    users = {
+        'hub': User.objects.get(id=hub_id or graph.user_ids[0]),
+        'random': User.objects.get(id=rng.choice(graph.user_ids)),
+    }
+    settings = get_suggestion_settings()
+    repeat = options['repeat']
+    cache = caches[settings['CACHE_ALIAS']]
+    results = {}
+    for name, user in users.items():
+        other = users['random' if name == 'hub' else 'hub']
+        cache.delete(f'friend-suggestions:{user.id}')
+        get_friend_suggestions(user.id, 1)
+        results[name] = {
+            'friends': Friendship.objects.filter(user=user).count(),
+            'mutual_friends': measure(
+                lambda: list(get_mutual_friends(user, other)
+                             .order_by('id')[:100]), repeat
+            ),
+            'suggestions_capped': measure_suggestions(
+                user.id, settings['MAX_FRIENDS'],
+                settings['MAX_FRIEND_FRIENDS'], repeat,
+            ),
+            'suggestions_uncapped': measure_suggestions(
+                user.id, UNCAPPED, UNCAPPED, repeat
+            ),
+            'suggestions_cached': measure(
+                lambda: get_friend_suggestions(user.id, 20), repeat
+            ),
+        }
+    return results
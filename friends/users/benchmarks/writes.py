@@ -0,0 +1,187 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError, connection, connections
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APIRequestFactory
+
+from users.benchmarks.base import register, summarize_latencies
+from users.benchmarks.queries import get_most_followed_user
+from users.metrics import record_queries
+from users.models import Follow
+from users.services import SubscriptionQuerySet, SubsriptionCreateDelete
+from users.snapshots import get_synthetic_graph
+
+User = get_user_model()
+
+
+def get_client(user: User) -> APIClient:
+    client = APIClient()
+    client.credentials(
+        HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}'
+    )
+    return client
+
+
+def measure_requests(send, repeat: int, setup=None) -> dict:
+    '''Time `send` calls, running `setup` untimed before each of them.'''
+    latencies = []
+    queries = 0
+    statuses = set()
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        with record_queries() as counter:
+            started = time.perf_counter()
+            response = send()
+            latencies.append(time.perf_counter() - started)
+        queries += counter.count
+        statuses.add(response.status_code)
+    return {
+        **summarize_latencies(latencies),
+        'queries_per_call': round(queries / repeat, 2) if repeat else 0,
+        'statuses': sorted(statuses),
+    }
+
+
+@register('destroy_subscriber')
+def destroy_subscriber_benchmark(options: dict) -> dict:
+    '''
+    Time removing a subscriber of the most followed user.
+
+    Covers the success path, a request by another user (403) and a
+    user that is not a subscriber (400).
+    '''
+    graph = get_synthetic_graph(
+        options['users'], options['degree'], options['graph'],
+        seed=options['seed'],
+    )
+    rng = random.Random(options['seed'])
+    user = get_most_followed_user(graph.user_ids)
+    subscription = SubscriptionQuerySet(user)
+    subscriber = subscription.get_user_subscribers().first()
+    not_subscriber = User.objects.exclude(id=user.id).exclude(
+        id__in=subscription.get_user_subscribers().values('id')
+    ).first()
+    other = User.objects.get(id=rng.choice(
+        [user_id for user_id in graph.user_ids if user_id != user.id]
+    ))
+    client = get_client(user)
+    other_client = get_client(other)
+
+    def url(subscriber_id):
+        return reverse('subscribers-detail', args=(user.id, subscriber_id))
+
+    def follow_again():
+        Follow.objects.get_or_create(user=subscriber, following=user)
+
+    repeat = options['repeat']
+    return {
+        'success': measure_requests(
+            lambda: client.delete(url(subscriber.id)), repeat, follow_again
+        ),
+        'forbidden': measure_requests(
+            lambda: other_client.delete(url(subscriber.id)), repeat
+        ),
+        'not_subscriber': measure_requests(
+            lambda: client.delete(url(not_subscriber.id)), repeat
+        ),
+    }
+
+
+def get_worker_counts(clients: int) -> List[int]:
+    counts = []
+    workers = 1
+    while workers < clients:
+        counts.append(workers)
+        workers *= 2
+    return counts + [clients]
+
+
+def sample_new_follows(user_ids: List[int], count: int,
+                       rng: random.Random) -> List[Tuple[int, int]]:
+    '''Sample `count` distinct (user, following) pairs not followed yet.'''
+    existing = set(Follow.objects.values_list('user', 'following'))
+    pairs = set()
+    while len(pairs) < count:
+        pair = tuple(rng.sample(user_ids, 2))
+        if pair not in existing:
+            pairs.add(pair)
+    return sorted(pairs)
+
+
+def follow_and_unfollow(factory: APIRequestFactory, user: User,
+                        following_id: int) -> bool:
+    '''Subscribe and unsubscribe, True if both writes succeeded.'''
+    request = factory.post('/subscribe/')
+    request.user = user
+    subscription = SubsriptionCreateDelete(request, User.objects.all(),
+                                           following_id)
+    try:
+        return (subscription.create_subscribe().status_code < 400
+                and subscription.delete_subscribe().status_code < 400)
+    except DatabaseError:
+        # SQLite raises "database is locked" for concurrent writers.
+        return False
+
+
+def run_writers(pairs: List[Tuple[int, int]], workers: int) -> dict:
+    factory = APIRequestFactory()
+    users = User.objects.in_bulk({user_id for user_id, _ in pairs})
+    # Each worker owns its users, so no pair is written twice at once.
+    batches = [[] for _ in range(workers)]
+    for user_id, following_id in pairs:
+        batches[user_id % workers].append((users[user_id], following_id))
+    barrier = threading.Barrier(workers + 1)
+
+    def write(batch):
+        try:
+            barrier.wait()
+            results = []
+            for user, following_id in batch:
+                started = time.perf_counter()
+                succeeded = follow_and_unfollow(factory, user, following_id)
+                results.append((time.perf_counter() - started, succeeded))
+            return results
+        finally:
+            # Every thread opened its own connection.
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(write, batch) for batch in batches]
+        barrier.wait()
+        started = time.perf_counter()
+        results = [result for future in futures for result in future.result()]
+        seconds = time.perf_counter() - started
+    succeeded = [latency for latency, success in results if success]
+    return {
+        **summarize_latencies([latency for latency, _ in results]),
+        # Follow + unfollow pairs completed per second of wall clock.
+        'throughput_rps': round(len(succeeded) / seconds, 1),
+        'errors': len(results) - len(succeeded),
+    }
+
+
+@register('concurrent_writes')
+def concurrent_writes_benchmark(options: dict) -> dict:
+    '''
+    Follow and unfollow from 1, 2, 4, ... `--clients` threads at once.
+
+    Each thread writes through its own database connection, so the
+    throughput shows how the backend serializes concurrent writes.
+    '''
+    graph = get_synthetic_graph(
+        options['users'], options['degree'], options['graph'],
+        seed=options['seed'],
+    )
+    rng = random.Random(options['seed'])
+    results = {'database': connection.vendor}
+    for workers in get_worker_counts(options['clients']):
+        pairs = sample_new_follows(graph.user_ids, options['requests'], rng)
+        results[f'workers_{workers}'] = run_writers(pairs, workers)
+    return results
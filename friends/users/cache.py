@@ -0,0 +1,197 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Iterable, NamedTuple, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+
+class Relationships(NamedTuple):
+    '''Ids of the users following the user and followed by the user.'''
+    followers: frozenset
+    following: frozenset
+
+    def size(self) -> int:
+        return len(self.followers) + len(self.following)
+
+
+class BaseRelationshipCache:
+    '''
+    Interface of the per-user relationship cache.
+
+    Backends store `Relationships` by user id. Writers invalidate the
+    users of every changed follow, readers fall back to the database
+    on a miss and `set` the loaded entry.
+
+    Users with more than `max_ids` follows are not cached, their
+    readers use SQL instead of loading the ids.
+
+    Entries expire after `timeout` seconds. Invalidations of a process
+    reach only the caches it can see, and a reader may `set` the rows
+    it read before a commit after the commit invalidated them: the
+    timeout bounds how long such an entry is served.
+
+    Options:
+        TIMEOUT: entry lifetime in seconds, 60 by default. None keeps
+            entries until they are invalidated, only safe when every
+            write goes through the services of processes sharing the
+            cache.
+        MAX_LIST_IDS: longest subscribers, subscriptions or friends
+            list read by id from a cached entry, every id is a query
+            parameter. Longer lists are read with SQL.
+    '''
+    max_ids: Optional[int] = None
+
+    def __init__(self, **options) -> None:
+        self.options = options
+        self.timeout: Optional[int] = options.get('TIMEOUT', 60)
+        self.max_list_ids: int = options.get('MAX_LIST_IDS', 10000)
+
+    def get(self, user_id: int) -> Optional[Relationships]:
+        raise NotImplementedError
+
+    def set(self, user_id: int, relationships: Relationships) -> None:
+        raise NotImplementedError
+
+    def invalidate(self, user_ids: Iterable[int]) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+
+class LocMemRelationshipCache(BaseRelationshipCache):
+    '''
+    In-process LRU cache.
+
+    Every worker process has its own entries, which writes of the other
+    processes and of management commands do not invalidate: they are
+    seen after `TIMEOUT`.
+
+    Options:
+        MAX_ENTRIES: maximum number of cached users.
+        MAX_IDS: maximum number of ids held by all entries together.
+            Least recently used entries are evicted to stay under it,
+            and a single entry larger than it is never cached.
+        TIMEOUT, MAX_LIST_IDS: see `BaseRelationshipCache`.
+    '''
+
+    def __init__(self, **options) -> None:
+        super().__init__(**options)
+        self.max_entries: int = options.get('MAX_ENTRIES', 10000)
+        self.max_ids = options.get('MAX_IDS', 1000000)
+        self._entries: OrderedDict = OrderedDict()
+        self._ids: int = 0
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> Optional[Relationships]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            relationships, expires_at = entry
+            if expires_at is not None and time.monotonic() >= expires_at:
+                self._pop(user_id)
+                return None
+            self._entries.move_to_end(user_id)
+            return relationships
+
+    def set(self, user_id: int, relationships: Relationships) -> None:
+        size = relationships.size()
+        if size > self.max_ids:
+            return
+        expires_at = (None if self.timeout is None
+                      else time.monotonic() + self.timeout)
+        with self._lock:
+            self._pop(user_id)
+            self._entries[user_id] = (relationships, expires_at)
+            self._ids += size
+            while (len(self._entries) > self.max_entries
+                   or self._ids > self.max_ids):
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._ids -= evicted.size()
+
+    def invalidate(self, user_ids: Iterable[int]) -> None:
+        with self._lock:
+            for user_id in user_ids:
+                self._pop(user_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._ids = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _pop(self, user_id: int) -> None:
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self._ids -= entry[0].size()
+
+
+class DjangoRelationshipCache(BaseRelationshipCache):
+    '''
+    Cache shared between processes through the Django cache framework.
+
+    Eviction and the memory bound are those of the configured cache
+    (`MAX_ENTRIES` of `LocMemCache`, `maxmemory-policy` of Redis, ...).
+    `clear` empties the whole alias, so give the cache its own alias.
+
+    Options:
+        CACHE_ALIAS: alias in `settings.CACHES`, `default` by default.
+        KEY_PREFIX: prefix of the cache keys.
+        MAX_IDS: users with more follows are not cached, unset by
+            default.
+        TIMEOUT, MAX_LIST_IDS: see `BaseRelationshipCache`.
+    '''
+
+    def __init__(self, **options) -> None:
+        super().__init__(**options)
+        self.max_ids = options.get('MAX_IDS')
+        self.cache = caches[options.get('CACHE_ALIAS', 'default')]
+        self.key_prefix: str = options.get('KEY_PREFIX', 'relationships')
+
+    def get(self, user_id: int) -> Optional[Relationships]:
+        value = self.cache.get(self._key(user_id))
+        if value is None:
+            return None
+        return Relationships(*value)
+
+    def set(self, user_id: int, relationships: Relationships) -> None:
+        self.cache.set(self._key(user_id), tuple(relationships),
+                       self.timeout)
+
+    def invalidate(self, user_ids: Iterable[int]) -> None:
+        self.cache.delete_many([self._key(user_id) for user_id in user_ids])
+
+    def clear(self) -> None:
+        self.cache.clear()
+
+    def _key(self, user_id: int) -> str:
+        return f'{self.key_prefix}:{user_id}'
+
+
+@lru_cache(maxsize=None)
+def get_relationship_cache() -> Optional[BaseRelationshipCache]:
+    '''
+    Return the cache configured by `settings.RELATIONSHIP_CACHE`.
+
+    Returns None when the setting is empty, which disables caching.
+    '''
+    config = getattr(settings, 'RELATIONSHIP_CACHE', None)
+    if not config:
+        return None
+    backend = import_string(config['BACKEND'])
+    return backend(**config.get('OPTIONS', {}))
+
+
+@receiver(setting_changed)
+def reset_relationship_cache(setting, **kwargs):
+    if setting == 'RELATIONSHIP_CACHE':
+        get_relationship_cache.cache_clear()
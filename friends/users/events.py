@@ -0,0 +1,164 @@
+import heapq
+from collections import Counter
+from datetime import datetime
+from typing import Iterable, Iterator, List, NamedTuple, Tuple
+
+from django.conf import settings
+from django.db.models import Max, Min
+
+from users.models import FollowEvent, UserCounters
+
+Edge = Tuple[int, int]
+
+VERSIONS_CHUNK_SIZE = 500
+
+FOLLOW_EVENTS_DEFAULTS = {
+    # Write the events of the follows, off when nothing reads the feed.
+    # Follows written without events leave gaps in the feed, cursors
+    # before a gap are answered as stale.
+    'ENABLED': True,
+    # Events per page of the feed, `limit` may not exceed MAX_PAGE_SIZE.
+    'PAGE_SIZE': 100,
+    'MAX_PAGE_SIZE': 1000,
+    # Age of the events deleted by `compact_follow_events`, in days.
+    'RETENTION_DAYS': 30,
+}
+
+
+def get_follow_event_settings() -> dict:
+    return {**FOLLOW_EVENTS_DEFAULTS,
+            **getattr(settings, 'FOLLOW_EVENTS', {})}
+
+
+class StaleCursorError(Exception):
+    '''Events after the cursor are missing, the feed has a gap.'''
+
+
+class ChangesPage(NamedTuple):
+    events: List[FollowEvent]
+    # Cursor of the next page, the `since` of the next request.
+    cursor: int
+    has_more: bool
+
+
+def count_changes(edges: Iterable[Edge]) -> Counter:
+    """
+    Return the number of follow changes of every user of `edges`.
+
+    `relationships_version` of a user grows by this number, the
+    versions in between are the positions of the events of the user.
+    """
+    return Counter(user_id for edge in edges for user_id in edge)
+
+
+def record_follow_events(edges: List[Edge], created: bool) -> None:
+    """
+    Append an event per edge, in the transaction of the follows.
+
+    Called after the counters of the users were updated: their rows
+    stay locked until the commit, so the positions read back from them
+    are taken in commit order, one transaction of a user at a time.
+    """
+    if not get_follow_event_settings()['ENABLED']:
+        return
+    changes = count_changes(edges)
+    user_ids = list(changes)
+    positions = {}
+    # Bounded `IN` lists, the edges of a deleted user are one batch.
+    for start in range(0, len(user_ids), VERSIONS_CHUNK_SIZE):
+        positions.update(
+            (user_id, version - changes[user_id])
+            for user_id, version in UserCounters.objects.filter(
+                user_id__in=user_ids[start:start + VERSIONS_CHUNK_SIZE]
+            ).values_list('user_id', 'relationships_version')
+        )
+    events = []
+    for user_id, following_id in edges:
+        positions[user_id] += 1
+        positions[following_id] += 1
+        events.append(FollowEvent(
+            user_id=user_id, following_id=following_id, created=created,
+            user_position=positions[user_id],
+            following_position=positions[following_id],
+        ))
+    FollowEvent.objects.bulk_create(events)
+
+
+def get_current_cursor(user_id: int) -> int:
+    """
+    Return the position of the latest committed change of the user.
+
+    A consumer takes it before listing the relationships in full and
+    follows the feed from it, replaying the events written meanwhile.
+    """
+    return UserCounters.objects.filter(user_id=user_id).values_list(
+        'relationships_version', flat=True
+    ).first() or 0
+
+
+def get_changes(user_id: int, since: int, limit: int) -> ChangesPage:
+    """
+    Return the events of the follows of and to the user after `since`.
+
+    Positions of the events of a user follow each other without gaps
+    up to the current cursor, and all of them are committed. Both
+    directions are one range of their index each, read up to
+    `limit + 1` rows and merged by position, so the cost follows the
+    number of changes rather than the size of the lists. Every event
+    gets the `position` of the user.
+
+    Raises `StaleCursorError` when events after `since` are missing:
+    compacted, written without events, or `since` is not a cursor of
+    the user.
+    """
+    head = get_current_cursor(user_id)
+    events = list(heapq.merge(
+        *(_read_direction(user_id, field, since, head, limit)
+          for field in ('user', 'following')),
+        key=lambda event: event.position,
+    ))
+    # Both ranges end at `head`, the positions up to it must all be read.
+    expected = list(range(since + 1, min(head, since + limit + 1) + 1))
+    if since > head or [event.position for event in events] != expected:
+        raise StaleCursorError(
+            'События после курсора удалены, загрузите списки заново.'
+        )
+    if len(events) > limit:
+        return ChangesPage(events[:limit], since + limit, True)
+    return ChangesPage(events, head, False)
+
+
+def _read_direction(user_id: int, field: str, since: int, head: int,
+                    limit: int) -> Iterator[FollowEvent]:
+    position_field = f'{field}_position'
+    events = FollowEvent.objects.filter(**{
+        field: user_id,
+        f'{position_field}__gt': since,
+        f'{position_field}__lte': head,
+    }).order_by(position_field)[:limit + 1]
+    for event in events:
+        event.position = getattr(event, position_field)
+        yield event
+
+
+def compact_follow_events(before: datetime, batch_size: int = 10000) -> int:
+    """
+    Delete the events created before `before`, return their number.
+
+    The events of a user are numbered in the order of their ids, so
+    only the oldest events of every user are deleted and the feed
+    answers the cursors before them as stale. Rows are deleted in
+    primary key ranges of `batch_size` ids.
+    """
+    last_event_id = FollowEvent.objects.filter(
+        created_at__lt=before
+    ).aggregate(last=Max('id'))['last']
+    if last_event_id is None:
+        return 0
+    first_event_id = FollowEvent.objects.aggregate(first=Min('id'))['first']
+    deleted = 0
+    for start in range(first_event_id, last_event_id + 1, batch_size):
+        deleted += FollowEvent.objects.filter(
+            id__gte=start, id__lte=min(start + batch_size - 1, last_event_id)
+        ).delete()[0]
+    return deleted
@@ -0,0 +1,458 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections
+from django.dispatch import receiver
+
+from users.models import Follow
+
+Edge = Tuple[int, int]
+
+# Above this length ratio an intersection probes the longer list with
+# binary searches instead of walking it.
+GALLOP_RATIO = 32
+
+FOLLOW_GRAPH_DEFAULTS = {
+    # Users with rewritten adjacency rows before the index is compacted.
+    'MAX_PENDING': 10000,
+    # Seconds before the index is reloaded from the database. Writes of
+    # other processes are only seen after a reload, None never reloads.
+    'MAX_AGE': 60,
+    # Larger sets are read with SQL, every id is a query parameter.
+    'MAX_IDS': 10000,
+}
+
+
+def intersect_sorted(first: Sequence[int],
+                     second: Sequence[int]) -> List[int]:
+    '''Ids present in both sorted sequences, in ascending order.'''
+    if len(first) > len(second):
+        first, second = second, first
+    if not first:
+        return []
+    if len(second) > GALLOP_RATIO * len(first):
+        result = []
+        size = len(second)
+        low = 0
+        for value in first:
+            low = bisect_left(second, value, low)
+            if low == size:
+                break
+            if second[low] == value:
+                result.append(value)
+        return result
+    result = []
+    first_index = second_index = 0
+    first_size, second_size = len(first), len(second)
+    while first_index < first_size and second_index < second_size:
+        first_value, second_value = first[first_index], second[second_index]
+        if first_value < second_value:
+            first_index += 1
+        elif first_value > second_value:
+            second_index += 1
+        else:
+            result.append(first_value)
+            first_index += 1
+            second_index += 1
+    return result
+
+
+def difference_sorted(first: Sequence[int],
+                      second: Sequence[int]) -> List[int]:
+    '''Ids of the sorted `first` missing from the sorted `second`.'''
+    result = []
+    second_index, second_size = 0, len(second)
+    for value in first:
+        while second_index < second_size and second[second_index] < value:
+            second_index += 1
+        if second_index == second_size or second[second_index] != value:
+            result.append(value)
+    return result
+
+
+def contains_sorted(values: Sequence[int], value: int) -> bool:
+    index = bisect_left(values, value)
+    return index < len(values) and values[index] == value
+
+
+def get_typecode(max_value: int) -> str:
+    '''Smallest signed `array` typecode holding `max_value`.'''
+    return 'i' if max_value < 2 ** 31 else 'q'
+
+
+class Adjacency:
+    '''
+    Sorted neighbour ids of every user in compressed sparse rows.
+
+    The neighbours of user `n` are `targets[offsets[n]:offsets[n + 1]]`.
+    Rows are indexed by the user id itself, which costs one offset per
+    id up to the largest one and no id lookup table.
+    '''
+    __slots__ = ('offsets', 'targets', '_targets_view')
+
+    def __init__(self, offsets: array, targets: array) -> None:
+        self.offsets = offsets
+        self.targets = targets
+        self._targets_view = memoryview(targets)
+
+    @classmethod
+    def from_rows(cls, row: Callable[[int], Sequence[int]],
+                  size: int) -> 'Adjacency':
+        '''Build from the sorted `row` of every user id below `size`.'''
+        targets = array(get_typecode(size))
+        offsets = [0] * (size + 1)
+        for user_id in range(size):
+            targets.extend(row(user_id))
+            offsets[user_id + 1] = len(targets)
+        return cls(array(get_typecode(len(targets)), offsets), targets)
+
+    def row(self, user_id: int) -> Sequence[int]:
+        '''Neighbours of the user, a view into `targets`.'''
+        if not 0 <= user_id < len(self.offsets) - 1:
+            return ()
+        return self._targets_view[
+            self.offsets[user_id]:self.offsets[user_id + 1]
+        ]
+
+    def __len__(self) -> int:
+        return len(self.targets)
+
+    @property
+    def nbytes(self) -> int:
+        return (self.offsets.itemsize * len(self.offsets)
+                + self.targets.itemsize * len(self.targets))
+
+
+def build_adjacencies(sources: array, targets: array,
+                      size: int) -> Tuple[Adjacency, Adjacency]:
+    '''
+    Build the forward and the reverse adjacency of the edges.
+
+    The edges must be sorted by source then target. The reverse rows
+    are filled by a counting sort, which keeps them sorted too.
+    '''
+    offsets_typecode = get_typecode(len(sources))
+    forward_offsets = array(offsets_typecode, [0]) * (size + 1)
+    reverse_offsets = array(offsets_typecode, [0]) * (size + 1)
+    for source, target in zip(sources, targets):
+        forward_offsets[source + 1] += 1
+        reverse_offsets[target + 1] += 1
+    for index in range(size):
+        forward_offsets[index + 1] += forward_offsets[index]
+        reverse_offsets[index + 1] += reverse_offsets[index]
+    reverse_targets = array(sources.typecode, sources)
+    positions = array(offsets_typecode, reverse_offsets)
+    for source, target in zip(sources, targets):
+        reverse_targets[positions[target]] = source
+        positions[target] += 1
+    return (Adjacency(forward_offsets, targets),
+            Adjacency(reverse_offsets, reverse_targets))
+
+
+class FollowGraph:
+    '''
+    In-memory copy of `Follow` answering relationship questions.
+
+    Follows and followers are kept as two `Adjacency` snapshots. Users
+    changed since the snapshot get a rewritten row in an overlay, and
+    the overlay is merged into a new snapshot by `compact`. Rows are
+    replaced and never mutated, so readers take no lock.
+    '''
+
+    def __init__(self, following: Adjacency, followers: Adjacency,
+                 max_pending: int = FOLLOW_GRAPH_DEFAULTS['MAX_PENDING']
+                 ) -> None:
+        self._following = following
+        self._followers = followers
+        self._following_overlay: Dict[int, List[int]] = {}
+        self._followers_overlay: Dict[int, List[int]] = {}
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_edges(cls, edges: Iterable[Edge], **kwargs) -> 'FollowGraph':
+        sources, targets = array('q'), array('q')
+        for source, target in sorted(edges):
+            sources.append(source)
+            targets.append(target)
+        return cls(*cls._build(sources, targets), **kwargs)
+
+    @classmethod
+    def from_database(cls, **kwargs) -> 'FollowGraph':
+        '''Load every follow, sorted by the `unique_follow` index.'''
+        sources, targets = array('q'), array('q')
+        follows = Follow.objects.order_by('user', 'following').values_list(
+            'user', 'following'
+        )
+        for source, target in follows.iterator(chunk_size=10000):
+            sources.append(source)
+            targets.append(target)
+        return cls(*cls._build(sources, targets), **kwargs)
+
+    @staticmethod
+    def _build(sources: array, targets: array) -> Tuple[Adjacency,
+                                                        Adjacency]:
+        size = max(max(sources, default=0), max(targets, default=0)) + 1
+        typecode = get_typecode(size)
+        return build_adjacencies(array(typecode, sources),
+                                 array(typecode, targets), size)
+
+    def following(self, user_id: int) -> Sequence[int]:
+        '''Sorted ids of the users the user follows.'''
+        row = self._following_overlay.get(user_id)
+        if row is None:
+            return self._following.row(user_id)
+        return row
+
+    def followers(self, user_id: int) -> Sequence[int]:
+        '''Sorted ids of the users following the user.'''
+        row = self._followers_overlay.get(user_id)
+        if row is None:
+            return self._followers.row(user_id)
+        return row
+
+    def follows(self, user_id: int, following_id: int) -> bool:
+        return contains_sorted(self.following(user_id), following_id)
+
+    def is_follower(self, user_id: int, other_id: int) -> bool:
+        '''Whether `other_id` follows `user_id`.'''
+        return self.follows(other_id, user_id)
+
+    def is_following(self, user_id: int, other_id: int) -> bool:
+        '''Whether `user_id` follows `other_id`.'''
+        return self.follows(user_id, other_id)
+
+    def friends(self, user_id: int) -> List[int]:
+        return intersect_sorted(self.following(user_id),
+                                self.followers(user_id))
+
+    def subscribers(self, user_id: int) -> List[int]:
+        return difference_sorted(self.followers(user_id),
+                                 self.following(user_id))
+
+    def subscriptions(self, user_id: int) -> List[int]:
+        return difference_sorted(self.following(user_id),
+                                 self.followers(user_id))
+
+    def mutual_friends(self, user_id: int, other_id: int) -> List[int]:
+        '''
+        Friends of both users, the friends of the user following fewer
+        users probed in the rows of the other one.
+        '''
+        if len(self.following(other_id)) < len(self.following(user_id)):
+            user_id, other_id = other_id, user_id
+        return intersect_sorted(
+            intersect_sorted(self.friends(user_id),
+                             self.following(other_id)),
+            self.followers(other_id),
+        )
+
+    def add(self, edges: Iterable[Edge]) -> None:
+        self._update(edges, created=True)
+
+    def remove(self, edges: Iterable[Edge]) -> None:
+        self._update(edges, created=False)
+
+    def compact(self) -> None:
+        '''Merge the overlay into new snapshots.'''
+        with self._lock:
+            self._compact()
+
+    def __len__(self) -> int:
+        '''Number of follows.'''
+        return len(self._following) + sum(
+            len(row) - len(self._following.row(user_id))
+            for user_id, row in self._following_overlay.items()
+        )
+
+    @property
+    def nbytes(self) -> int:
+        '''Bytes held by the snapshot arrays, without the overlay.'''
+        return self._following.nbytes + self._followers.nbytes
+
+    def _update(self, edges: Iterable[Edge], created: bool) -> None:
+        with self._lock:
+            for user_id, following_id in edges:
+                self._update_row(self._following_overlay, self._following,
+                                 user_id, following_id, created)
+                self._update_row(self._followers_overlay, self._followers,
+                                 following_id, user_id, created)
+            if (len(self._following_overlay) + len(self._followers_overlay)
+                    > self.max_pending):
+                self._compact()
+
+    @staticmethod
+    def _update_row(overlay: Dict[int, List[int]], adjacency: Adjacency,
+                    user_id: int, other_id: int, created: bool) -> None:
+        row = overlay.get(user_id)
+        if row is None:
+            row = adjacency.row(user_id)
+        index = bisect_left(row, other_id)
+        present = index < len(row) and row[index] == other_id
+        if present == created:
+            return
+        # A new list, the current row may be in use by a reader.
+        if created:
+            row = [*row[:index], other_id, *row[index:]]
+        else:
+            row = [*row[:index], *row[index + 1:]]
+        overlay[user_id] = row
+
+    def _compact(self) -> None:
+        for name in ('_following', '_followers'):
+            adjacency = getattr(self, name)
+            overlay = getattr(self, f'{name}_overlay')
+            if not overlay:
+                continue
+
+            def row(user_id):
+                overlay_row = overlay.get(user_id)
+                if overlay_row is None:
+                    return adjacency.row(user_id)
+                return overlay_row
+
+            size = max(len(adjacency.offsets) - 1, max(overlay) + 1)
+            # The new snapshot goes in first: a reader seeing it with
+            # the old overlay still gets the current rows.
+            setattr(self, name, Adjacency.from_rows(row, size))
+            setattr(self, f'{name}_overlay', {})
+
+
+class FollowGraphIndex:
+    '''
+    Process-wide `FollowGraph`, loaded on first use.
+
+    Commits of this process are applied to the loaded graph by
+    `users.services`. The graph is reloaded from the database after
+    `MAX_AGE` seconds, in a background thread: readers keep the
+    current graph and commits keep being applied to it, then replayed
+    on the new graph before it replaces the current one. Readers wait
+    for a graph older than `max_staleness`, which bounds how stale the
+    writes of other processes (and of bulk writes that skip the sync)
+    can get.
+    '''
+
+    def __init__(self, **options) -> None:
+        self.options = {**FOLLOW_GRAPH_DEFAULTS, **options}
+        self._graph: Optional[FollowGraph] = None
+        self._loaded_at = 0.0
+        # Commits applied during a load, replayed on the loaded graph.
+        self._replay: Optional[List[Tuple[List[Edge], bool]]] = None
+        # Guards the graph and the replay list, held briefly.
+        self._lock = threading.Lock()
+        # Held for the whole load, one load at a time.
+        self._load_lock = threading.Lock()
+
+    @property
+    def max_staleness(self) -> Optional[float]:
+        '''Seconds the graph may miss the writes of other processes.'''
+        max_age = self.options['MAX_AGE']
+        if max_age is None:
+            return None
+        return 2 * max_age
+
+    @property
+    def graph(self) -> FollowGraph:
+        graph = self._graph
+        if graph is not None and not self._is_stale():
+            return graph
+        if graph is None or self._age() > self.max_staleness:
+            with self._load_lock:
+                self._load()
+            return self._graph
+        if self._load_lock.acquire(blocking=False):
+            threading.Thread(target=self._reload, daemon=True).start()
+        return graph
+
+    def apply(self, edges: Iterable[Edge], created: bool) -> None:
+        '''Apply committed follows, and replay them after a load.'''
+        edges = list(edges)
+        with self._lock:
+            if self._replay is not None:
+                self._replay.append((edges, created))
+            if self._graph is not None:
+                self._apply(self._graph, edges, created)
+
+    def clear(self) -> None:
+        '''Drop the graph, the next read loads it again.'''
+        with self._lock:
+            self._graph = None
+            self._loaded_at = 0.0
+
+    def _age(self) -> float:
+        return time.monotonic() - self._loaded_at
+
+    def _is_stale(self) -> bool:
+        max_age = self.options['MAX_AGE']
+        return max_age is not None and self._age() > max_age
+
+    def _reload(self) -> None:
+        try:
+            self._load()
+        finally:
+            self._load_lock.release()
+            connections.close_all()
+
+    def _load(self) -> None:
+        if self._graph is not None and not self._is_stale():
+            # Loaded by another thread while this one waited.
+            return
+        started_at = time.monotonic()
+        with self._lock:
+            self._replay = []
+        try:
+            graph = FollowGraph.from_database(
+                max_pending=self.options['MAX_PENDING']
+            )
+        except BaseException:
+            with self._lock:
+                self._replay = None
+            raise
+        with self._lock:
+            for edges, created in self._replay:
+                self._apply(graph, edges, created)
+            self._replay = None
+            self._graph = graph
+            # Writes of other processes are seen up to the start.
+            self._loaded_at = started_at
+
+    @staticmethod
+    def _apply(graph: FollowGraph, edges: List[Edge],
+               created: bool) -> None:
+        if created:
+            graph.add(edges)
+        else:
+            graph.remove(edges)
+
+
+@lru_cache(maxsize=None)
+def get_follow_graph_index() -> Optional[FollowGraphIndex]:
+    '''
+    Return the index configured by `settings.FOLLOW_GRAPH`.
+
+    Returns None when the setting is empty, which disables the index
+    and leaves every relationship query to SQL.
+    '''
+    config = getattr(settings, 'FOLLOW_GRAPH', None)
+    if not config:
+        return None
+    return FollowGraphIndex(**config)
+
+
+def get_follow_graph() -> Optional[FollowGraph]:
+    index = get_follow_graph_index()
+    if index is None:
+        return None
+    return index.graph
+
+
+@receiver(setting_changed)
+def reset_follow_graph(setting, **kwargs):
+    if setting == 'FOLLOW_GRAPH':
+        get_follow_graph_index.cache_clear()
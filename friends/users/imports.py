@@ -0,0 +1,186 @@
+import csv
+import json
+from contextlib import contextmanager
+from typing import IO, Iterator, List, NamedTuple, Tuple
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX
+from django.db import connection, transaction
+from django.utils import timezone
+
+from users.models import Follow
+
+User = get_user_model()
+
+EDGE_FORMATS = ('csv', 'ndjson')
+
+# Field names of an edge: the follower and the followed username.
+EDGE_FIELDS = ('user', 'following')
+
+UsernameEdge = Tuple[str, str]
+
+# Usernames or edges looked up per query. A chunk of edges binds two
+# variables per edge and stays under 999, the limit of SQLite before
+# 3.32, whatever the batch size.
+LOOKUP_CHUNK_SIZE = 450
+
+
+class EdgeFormatError(ValueError):
+    '''An edge of the input cannot be read.'''
+
+
+class BatchResult(NamedTuple):
+    users_created: int
+    follows_written: int
+    self_follows: int
+
+
+def read_edges(file: IO[str], edge_format: str) -> Iterator[UsernameEdge]:
+    '''
+    Yield `(user, following)` username pairs from `file`.
+
+    CSV needs a header with the `user` and `following` columns, NDJSON
+    one object with these keys per line.
+    '''
+    if edge_format not in EDGE_FORMATS:
+        raise ValueError(f'Unknown edge format: {edge_format}')
+    if edge_format == 'csv':
+        records = csv.DictReader(file)
+    else:
+        records = (json.loads(line) for line in file if line.strip())
+    for number, record in enumerate(records, 1):
+        try:
+            # Short CSV rows have None in the missing columns.
+            user, following = (record[field] for field in EDGE_FIELDS)
+        except (KeyError, TypeError):
+            user = following = None
+        if user is None or following is None:
+            raise EdgeFormatError(
+                f'Edge {number} has no {" and ".join(EDGE_FIELDS)} fields.'
+            )
+        user, following = str(user), str(following)
+        if not user or not following:
+            raise EdgeFormatError(f'Edge {number} has an empty username.')
+        yield user, following
+
+
+def import_edges(edges: List[UsernameEdge],
+                 batch_size: int = 1000) -> BatchResult:
+    """
+    Write one batch of edges in a transaction.
+
+    Missing users are created with an unusable password, the ones
+    another process created meanwhile are not counted. Follows
+    already in the table are skipped and the rest are inserted with
+    `ignore_conflicts`, so a batch can be written again after a crash.
+    Self-follows are dropped before the insert: the
+    `user_not_equal_following` check is not covered by
+    `ignore_conflicts` on PostgreSQL and would fail the whole batch.
+
+    `Friendship` and `UserCounters` are not updated and no follow events
+    are written, rebuild them once the import is done: the rebuild
+    moves the relationship versions on, so the change feeds answer the
+    cursors taken before the import as stale.
+    """
+    follows = [(user, following) for user, following in edges
+               if user != following]
+    usernames = list({username for edge in follows for username in edge})
+    self_follows = len(edges) - len(follows)
+    users_created = 0
+    with transaction.atomic():
+        user_ids = {}
+        for chunk in _chunks(usernames):
+            user_ids.update(User.objects.filter(
+                username__in=chunk
+            ).values_list('username', 'id'))
+        missing = [username for username in usernames
+                   if username not in user_ids]
+        if missing:
+            # Rows inserted meanwhile by another process are skipped by
+            # `ignore_conflicts`, the batch timestamp tells its own rows.
+            created_at = timezone.now()
+            User.objects.bulk_create(
+                (User(username=username, password=UNUSABLE_PASSWORD_PREFIX,
+                      date_joined=created_at)
+                 for username in missing),
+                batch_size=batch_size, ignore_conflicts=True,
+            )
+            # Backends without RETURNING leave the primary keys unset.
+            for chunk in _chunks(missing):
+                for username, user_id, date_joined in User.objects.filter(
+                        username__in=chunk
+                ).values_list('username', 'id', 'date_joined'):
+                    user_ids[username] = user_id
+                    users_created += date_joined == created_at
+        new_follows = dict.fromkeys(
+            (user_ids[user], user_ids[following])
+            for user, following in follows
+        )
+        # Stored follows are left out, so that only the inserted ones
+        # are counted as written.
+        for chunk in _chunks(list(new_follows)):
+            stored = Follow.objects.filter(
+                user__in={user_id for user_id, _ in chunk},
+                following__in={following_id for _, following_id in chunk},
+            ).values_list('user', 'following')
+            for edge in stored:
+                new_follows.pop(edge, None)
+        Follow.objects.bulk_create(
+            (Follow(user_id=user_id, following_id=following_id)
+             for user_id, following_id in new_follows),
+            batch_size=batch_size, ignore_conflicts=True,
+        )
+    return BatchResult(users_created, len(new_follows), self_follows)
+
+
+def _chunks(items: list) -> Iterator[list]:
+    for start in range(0, len(items), LOOKUP_CHUNK_SIZE):
+        yield items[start:start + LOOKUP_CHUNK_SIZE]
+
+
+def get_follow_indexes_present() -> set:
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(
+            cursor, Follow._meta.db_table
+        )
+    return {index.name for index in Follow._meta.indexes
+            if index.name in constraints}
+
+
+def drop_follow_indexes() -> None:
+    '''
+    Drop the secondary indexes of `Follow`.
+
+    `unique_follow` stays, the inserts rely on it to skip duplicates.
+    Indexes dropped by an interrupted import are skipped.
+    '''
+    present = get_follow_indexes_present()
+    with connection.schema_editor() as schema_editor:
+        for index in Follow._meta.indexes:
+            if index.name in present:
+                schema_editor.remove_index(Follow, index)
+
+
+def create_follow_indexes() -> None:
+    '''Create the secondary indexes of `Follow` that are missing.'''
+    present = get_follow_indexes_present()
+    with connection.schema_editor() as schema_editor:
+        for index in Follow._meta.indexes:
+            if index.name not in present:
+                schema_editor.add_index(Follow, index)
+
+
+@contextmanager
+def follow_indexes_dropped() -> Iterator[None]:
+    '''
+    Drop the secondary `Follow` indexes around a bulk load.
+
+    Building an index once over the loaded table is cheaper than
+    updating it for every inserted row. The indexes are created again
+    even if the load fails.
+    '''
+    drop_follow_indexes()
+    try:
+        yield
+    finally:
+        create_follow_indexes()
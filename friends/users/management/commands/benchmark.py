@@ -0,0 +1,132 @@
+import json
+import pkgutil
+import subprocess
+from importlib import import_module
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+import users.benchmarks
+from users.benchmarks.api import DEFAULT_MIX
+from users.benchmarks.base import BENCHMARKS
+from users.synthetic import GRAPH_DISTRIBUTIONS
+
+
+def load_benchmarks():
+    for module in pkgutil.iter_modules(users.benchmarks.__path__):
+        import_module(f'{users.benchmarks.__name__}.{module.name}')
+    return BENCHMARKS
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ('git', 'rev-parse', '--short', 'HEAD'),
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(previous, current, path=''):
+    '''Yield the relative change of every latency and query metric.'''
+    compared_metrics = ('_ms', 'queries_per')
+    for key, value in current.items():
+        name = f'{path}.{key}' if path else key
+        old_value = previous.get(key)
+        if isinstance(value, dict):
+            yield from compare_results(old_value or {}, value, name)
+        elif (isinstance(value, (int, float)) and old_value
+              and any(metric in key for metric in compared_metrics)):
+            change = (value - old_value) / old_value * 100
+            yield f'{name}: {old_value} -> {value} ({change:+.1f}%)'
+
+
+class Command(BaseCommand):
+    help = (
+        'Run performance benchmarks against a fresh test database and '
+        'print (or write) the results as JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'benchmarks', nargs='*',
+            help='Benchmarks to run, all of them by default.',
+        )
+        parser.add_argument('--list', action='store_true',
+                            help='List the available benchmarks.')
+        parser.add_argument('--users', type=int, default=1000,
+                            help='Users in the synthetic graph.')
+        parser.add_argument('--degree', type=float, default=20,
+                            help='Average follows per user.')
+        parser.add_argument('--graph', choices=GRAPH_DISTRIBUTIONS,
+                            default='power_law',
+                            help='Degree distribution of the graph.')
+        parser.add_argument('--requests', type=int, default=500,
+                            help='Requests replayed by API benchmarks.')
+        parser.add_argument('--clients', type=int, default=20,
+                            help='Authenticated clients sending requests.')
+        parser.add_argument('--mix', default=DEFAULT_MIX,
+                            help='Weighted route names, e.g. '
+                                 '"users-list=1,friends-list=3".')
+        parser.add_argument('--repeat', type=int, default=100,
+                            help='Repetitions of micro-benchmarks.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output',
+                            help='Write the JSON results to this file.')
+        parser.add_argument('--compare',
+                            help='Results file of a previous run to compare '
+                                 'with.')
+
+    def handle(self, *args, **options):
+        benchmarks = load_benchmarks()
+        if options['list']:
+            for name, benchmark in sorted(benchmarks.items()):
+                summary = (benchmark.__doc__ or '').strip().split('\n')[0]
+                self.stdout.write(f'{name}: {summary}')
+            return
+        names = options['benchmarks'] or sorted(benchmarks)
+        unknown = set(names) - set(benchmarks)
+        if unknown:
+            raise CommandError(
+                f'Unknown benchmarks: {", ".join(sorted(unknown))}'
+            )
+
+        results = {
+            'commit': get_commit(),
+            'database': connection.vendor,
+            'options': {
+                key: options[key]
+                for key in ('users', 'degree', 'graph', 'requests',
+                            'clients', 'mix', 'repeat', 'seed')
+            },
+            'benchmarks': {
+                name: self.run_benchmark(benchmarks[name], options)
+                for name in names
+            },
+        }
+
+        output = json.dumps(results, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output)
+        else:
+            self.stdout.write(output)
+        if options['compare']:
+            with open(options['compare']) as file:
+                previous = json.load(file)
+            for line in compare_results(previous['benchmarks'],
+                                        results['benchmarks']):
+                self.stdout.write(line)
+
+    def run_benchmark(self, benchmark, options):
+        setup_test_environment(debug=False)
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        try:
+            return benchmark(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
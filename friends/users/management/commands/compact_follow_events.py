@@ -0,0 +1,35 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from users.events import compact_follow_events, get_follow_event_settings
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete the follow events older than the retention period. '
+        'Change feed cursors into the deleted events become stale.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=float,
+            help='Age of the deleted events, RETENTION_DAYS of '
+                 'FOLLOW_EVENTS by default.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=10000,
+            help='Events deleted per statement.',
+        )
+
+    def handle(self, *args, **options):
+        days = options['days']
+        if days is None:
+            days = get_follow_event_settings()['RETENTION_DAYS']
+        before = timezone.now() - timedelta(days=days)
+        deleted = compact_follow_events(before, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {deleted} follow events created before '
+            f'{before.isoformat()}.'
+        ))
@@ -0,0 +1,92 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from users.benchmarks.queries import get_relationship_queries
+from users.models import Follow, Friendship
+
+User = get_user_model()
+
+FOLLOW_GRAPH_TABLES = {Follow._meta.db_table, Friendship._meta.db_table}
+SQL_TABLE_ALIASES = re.compile(r'(?:FROM|JOIN) "(\w+)"(?: (?:AS )?"?(\w+)"?)?')
+SQLITE_SCAN = re.compile(r'\bSCAN (\w+)')
+POSTGRESQL_SCAN = re.compile(r'Seq Scan on (\w+)')
+
+
+def find_table_scans(sql: str, plan: str) -> set:
+    '''Return the follow-graph tables read by a full scan in `plan`.'''
+    if connection.vendor == 'postgresql':
+        scanned = set(POSTGRESQL_SCAN.findall(plan))
+    else:
+        aliases = {}
+        for table, alias in SQL_TABLE_ALIASES.findall(sql):
+            aliases[alias or table] = table
+        scanned = {aliases.get(name, name)
+                   for name in SQLITE_SCAN.findall(plan)}
+    return scanned & FOLLOW_GRAPH_TABLES
+
+
+class Command(BaseCommand):
+    help = (
+        'Print EXPLAIN plans of the follow-graph queries and report the '
+        'ones scanning a whole follow-graph table.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user-id', type=int,
+            help='User whose relations are listed, the most followed one '
+                 'by default.',
+        )
+        parser.add_argument(
+            '--request-user-id', type=int,
+            help='User the statuses are annotated for, the first one by '
+                 'default.',
+        )
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Exit with an error if any query falls back to a table '
+                 'scan.',
+        )
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user_id'], most_followed=True)
+        request_user = self.get_user(options['request_user_id'])
+        failed = []
+        for name, queryset in get_relationship_queries(
+                user, request_user).items():
+            sql, _ = queryset.query.sql_with_params()
+            plan = queryset.explain()
+            scans = find_table_scans(sql, plan)
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{name}:'))
+            self.stdout.write(plan)
+            if scans:
+                failed.append(name)
+                self.stdout.write(self.style.ERROR(
+                    f'Table scan on {", ".join(sorted(scans))}'
+                ))
+            self.stdout.write('')
+        if not failed:
+            self.stdout.write(self.style.SUCCESS(
+                'No follow-graph query scans a whole table.'
+            ))
+        elif options['check']:
+            raise CommandError(
+                f'Table scans in: {", ".join(failed)}'
+            )
+
+    def get_user(self, user_id, most_followed=False):
+        if user_id is not None:
+            user = User.objects.filter(id=user_id).first()
+        elif most_followed:
+            user = User.objects.order_by(
+                '-counters__subscribers_count', '-counters__friends_count',
+                'id'
+            ).first()
+        else:
+            user = User.objects.order_by('id').first()
+        if user is None:
+            raise CommandError('No such user, load some data first.')
+        return user
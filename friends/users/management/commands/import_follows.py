@@ -0,0 +1,122 @@
+import json
+import os
+import time
+from contextlib import nullcontext
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.imports import (EDGE_FORMATS, EdgeFormatError,
+                           follow_indexes_dropped, import_edges, read_edges)
+from users.services import (clear_follow_caches, rebuild_friendships,
+                            rebuild_user_counters)
+
+
+class Command(BaseCommand):
+    help = (
+        'Import follows from a CSV or NDJSON file of (user, following) '
+        'username pairs, creating the missing users.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File with the edges to import.')
+        parser.add_argument(
+            '--format', choices=EDGE_FORMATS,
+            help='Format of the file, guessed from the extension by '
+                 'default.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=10000,
+            help='Edges written per transaction.',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='File recording the imported edges. An interrupted '
+                 'import run with the same file resumes after them.',
+        )
+        parser.add_argument(
+            '--drop-indexes', action='store_true',
+            help='Drop the secondary follow indexes during the import '
+                 'and build them once at the end.',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        edge_format = options['format'] or self.guess_format(path)
+        batch_size = options['batch_size']
+        checkpoint = options['checkpoint']
+        imported = resumed = self.read_checkpoint(checkpoint, path)
+        if resumed:
+            self.stdout.write(f'Resuming after {resumed} edges.')
+
+        indexes = (follow_indexes_dropped() if options['drop_indexes']
+                   else nullcontext())
+        started = time.perf_counter()
+        totals = {'users_created': 0, 'follows_written': 0,
+                  'self_follows': 0}
+        with open(path, newline='') as file, indexes:
+            edges = islice(read_edges(file, edge_format), imported, None)
+            while True:
+                try:
+                    batch = list(islice(edges, batch_size))
+                except EdgeFormatError as error:
+                    raise CommandError(error)
+                if not batch:
+                    break
+                result = import_edges(batch)
+                imported += len(batch)
+                for key, value in result._asdict().items():
+                    totals[key] += value
+                self.write_checkpoint(checkpoint, path, imported)
+                rate = (imported - resumed) / (time.perf_counter() - started)
+                self.stdout.write(self.format_progress(imported, totals,
+                                                       rate))
+
+        friendships = rebuild_friendships(batch_size=batch_size)
+        rebuild_user_counters(batch_size=batch_size)
+        clear_follow_caches()
+        if checkpoint and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported} edges: {totals["follows_written"]} '
+            f'follows written, {totals["users_created"]} users created, '
+            f'{friendships // 2} friendships.'
+        ))
+
+    def guess_format(self, path):
+        extension = os.path.splitext(path)[1].lstrip('.').lower()
+        if extension == 'jsonl':
+            return 'ndjson'
+        if extension not in EDGE_FORMATS:
+            raise CommandError(
+                f'Cannot guess the format of {path}, pass --format.'
+            )
+        return extension
+
+    def read_checkpoint(self, checkpoint, path):
+        if not checkpoint or not os.path.exists(checkpoint):
+            return 0
+        with open(checkpoint) as file:
+            state = json.load(file)
+        if state['path'] != os.path.abspath(path):
+            raise CommandError(
+                f'{checkpoint} is the checkpoint of {state["path"]}.'
+            )
+        return state['edges']
+
+    def write_checkpoint(self, checkpoint, path, imported):
+        if not checkpoint:
+            return
+        # Replaced in one step, a crash leaves the previous checkpoint.
+        temporary = f'{checkpoint}.tmp'
+        with open(temporary, 'w') as file:
+            json.dump({'path': os.path.abspath(path), 'edges': imported},
+                      file)
+        os.replace(temporary, checkpoint)
+
+    def format_progress(self, imported, totals, rate):
+        return (
+            f'{imported} edges read, {totals["follows_written"]} follows '
+            f'written, {totals["self_follows"]} self-follows skipped, '
+            f'{totals["users_created"]} users created ({rate:.0f} edges/s)'
+        )
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from users.services import rebuild_friendships
+
+
+class Command(BaseCommand):
+    help = 'Recompute the friendships table from mutual follows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of friendship rows written per INSERT.',
+        )
+
+    def handle(self, *args, **options):
+        total = rebuild_friendships(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {total // 2} friendships.'
+        ))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from users.services import rebuild_user_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute subscribers, subscriptions and friends counters.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of counters rows written per INSERT.',
+        )
+
+    def handle(self, *args, **options):
+        total = rebuild_user_counters(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt counters of {total} users.'
+        ))
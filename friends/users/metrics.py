@@ -0,0 +1,101 @@
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Sequence
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+DURATION_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+QUERIES_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+METRICS = {
+    'duration_ms': DURATION_BUCKETS_MS,
+    'db_ms': DURATION_BUCKETS_MS,
+    'render_ms': DURATION_BUCKETS_MS,
+    'queries': QUERIES_BUCKETS,
+    'response_bytes': SIZE_BUCKETS_BYTES,
+}
+
+
+class QueryRecorder:
+    '''Database execute wrapper counting queries and their time.'''
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+@contextmanager
+def record_queries(using: str = DEFAULT_DB_ALIAS) -> Iterator[QueryRecorder]:
+    recorder = QueryRecorder()
+    with connections[using].execute_wrapper(recorder):
+        yield recorder
+
+
+class Histogram:
+    '''Cumulative-friendly histogram with fixed upper bounds.'''
+
+    def __init__(self, bounds: Sequence[float]) -> None:
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def as_dict(self) -> dict:
+        labels = [str(bound) for bound in self.bounds] + ['+Inf']
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 3),
+            'buckets': dict(zip(labels, self.counts)),
+        }
+
+
+class MetricsRegistry:
+    '''Thread-safe histograms of request metrics per view action.'''
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._views: Dict[str, Dict[str, Histogram]] = {}
+
+    def observe(self, view: str, values: Dict[str, float]) -> None:
+        with self._lock:
+            histograms = self._views.get(view)
+            if histograms is None:
+                histograms = self._views[view] = {
+                    name: Histogram(bounds)
+                    for name, bounds in METRICS.items()
+                }
+            for name, value in values.items():
+                if value is not None and not math.isnan(value):
+                    histograms[name].observe(value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                view: {name: histogram.as_dict()
+                       for name, histogram in histograms.items()}
+                for view, histograms in sorted(self._views.items())
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._views.clear()
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,109 @@
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from users.metrics import record_queries, registry
+
+
+class RequestMetricsMiddleware:
+    '''
+    Record query count, database time, render time and response size of
+    sampled requests per view action (`UserViewSet.subscribe`,
+    `FriendsViewSet.list`, ...). The render time is the rendering of
+    the response, the serializers run in the view.
+
+    Sampled responses to staff users get a `Server-Timing` header, the
+    aggregated histograms are served by `MetricsView`. `REQUEST_METRICS`
+    sets the `SAMPLE_RATE` (0 disables recording).
+
+    Supports both the WSGI and the ASGI request paths, under ASGI the
+    queries of the async ORM are recorded the same way.
+    '''
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.is_sampled():
+            return self.get_response(request)
+
+        request.metrics_sampled = True
+        with record_queries() as queries:
+            started = time.perf_counter()
+            response = self.get_response(request)
+            duration = time.perf_counter() - started
+        return self.observe(request, response, queries, duration)
+
+    async def __acall__(self, request):
+        if not self.is_sampled():
+            return await self.get_response(request)
+
+        request.metrics_sampled = True
+        with record_queries() as queries:
+            started = time.perf_counter()
+            response = await self.get_response(request)
+            duration = time.perf_counter() - started
+        return self.observe(request, response, queries, duration)
+
+    def is_sampled(self) -> bool:
+        sample_rate = getattr(settings, 'REQUEST_METRICS', {}).get(
+            'SAMPLE_RATE', 1.0
+        )
+        return sample_rate > 0 and random.random() < sample_rate
+
+    def observe(self, request, response, queries, duration):
+        render = getattr(response, 'metrics_render_duration', 0.0)
+        size = None if response.streaming else len(response.content)
+        registry.observe(get_view_name(request), {
+            'duration_ms': duration * 1000,
+            'db_ms': queries.duration * 1000,
+            'render_ms': render * 1000,
+            'queries': queries.count,
+            'response_bytes': size,
+        })
+        # The timings tell about the database, keep them from clients.
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_staff:
+            response['Server-Timing'] = (
+                f'db;dur={queries.duration * 1000:.2f};'
+                f'desc="{queries.count} queries", '
+                f'render;dur={render * 1000:.2f}, '
+                f'total;dur={duration * 1000:.2f}'
+            )
+        return response
+
+    def process_template_response(self, request, response):
+        if getattr(request, 'metrics_sampled', False):
+            started = time.perf_counter()
+
+            def render_finished(rendered_response):
+                rendered_response.metrics_render_duration = (
+                    time.perf_counter() - started
+                )
+
+            response.add_post_render_callback(render_finished)
+        return response
+
+
+def get_view_name(request) -> str:
+    resolver_match = request.resolver_match
+    if resolver_match is None:
+        return 'unresolved'
+    view = resolver_match.func
+    view_class = getattr(view, 'cls', None)
+    if view_class is None:
+        view_class = getattr(view, 'view_class', None)
+    if view_class is None:
+        return resolver_match.view_name or view.__name__
+    actions = getattr(view, 'actions', None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    return f'{view_class.__name__}.{action}'
@@ -0,0 +1,70 @@
+# Generated by Django 4.2.1 on 2026-10-18 10:55
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_user_counters(apps, schema_editor):
+    Follow = apps.get_model('users', 'Follow')
+    UserCounters = apps.get_model('users', 'UserCounters')
+    counters = {}
+
+    def get_counters(user_id):
+        return counters.setdefault(user_id, {
+            'subscribers_count': 0,
+            'subscriptions_count': 0,
+            'friends_count': 0,
+        })
+
+    followers = Follow.objects.values('following').annotate(
+        total=models.Count('id')
+    ).values_list('following', 'total')
+    for user_id, total in followers.iterator():
+        get_counters(user_id)['subscribers_count'] += total
+    followings = Follow.objects.values('user').annotate(
+        total=models.Count('id')
+    ).values_list('user', 'total')
+    for user_id, total in followings.iterator():
+        get_counters(user_id)['subscriptions_count'] += total
+    reverse_follow = Follow.objects.filter(
+        user=models.OuterRef('following'), following=models.OuterRef('user')
+    )
+    mutual = Follow.objects.filter(models.Exists(reverse_follow)).values(
+        'user'
+    ).annotate(total=models.Count('id')).values_list('user', 'total')
+    for user_id, total in mutual.iterator():
+        user_counters = get_counters(user_id)
+        user_counters['friends_count'] += total
+        user_counters['subscribers_count'] -= total
+        user_counters['subscriptions_count'] -= total
+    UserCounters.objects.bulk_create(
+        (UserCounters(user_id=user_id, **user_counters)
+         for user_id, user_counters in counters.items()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserCounters',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counters', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('subscribers_count', models.IntegerField(default=0, verbose_name='Подписчики')),
+                ('subscriptions_count', models.IntegerField(default=0, verbose_name='Подписки')),
+                ('friends_count', models.IntegerField(default=0, verbose_name='Друзья')),
+            ],
+            options={
+                'verbose_name': 'user counters',
+                'verbose_name_plural': 'user counters',
+            },
+        ),
+        migrations.RunPython(fill_user_counters, migrations.RunPython.noop),
+    ]
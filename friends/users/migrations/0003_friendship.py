@@ -0,0 +1,49 @@
+# Generated by Django 4.2.1 on 2026-10-18 10:56
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_friendships(apps, schema_editor):
+    Follow = apps.get_model('users', 'Follow')
+    Friendship = apps.get_model('users', 'Friendship')
+    reverse_follow = Follow.objects.filter(
+        user=models.OuterRef('following'), following=models.OuterRef('user')
+    )
+    mutual_follows = Follow.objects.filter(
+        models.Exists(reverse_follow)
+    ).values_list('user', 'following')
+    Friendship.objects.bulk_create(
+        (Friendship(user_id=user_id, friend_id=friend_id)
+         for user_id, friend_id in mutual_follows.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('users', '0002_user_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Friendship',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('friend', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='friend_of', to=settings.AUTH_USER_MODEL, verbose_name='Друг')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='friendships', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'friendship',
+                'verbose_name_plural': 'friendships',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='friendship',
+            constraint=models.UniqueConstraint(fields=('user', 'friend'), name='unique_friendship'),
+        ),
+        migrations.RunPython(fill_friendships, migrations.RunPython.noop),
+    ]
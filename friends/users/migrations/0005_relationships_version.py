@@ -0,0 +1,24 @@
+# Generated by Django 4.2.1 on 2026-10-18 12:10
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_follow_covering_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usercounters',
+            name='relationships_changed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Отношения изменены'),
+        ),
+        migrations.AddField(
+            model_name='usercounters',
+            name='relationships_version',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Версия отношений'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.1 on 2026-10-18 12:16
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('users', '0005_relationships_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FollowEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.BooleanField(verbose_name='Подписка создана')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Время')),
+                ('following', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('user', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Подписчик')),
+                ('user_position', models.PositiveBigIntegerField(verbose_name='Позиция у подписчика')),
+                ('following_position', models.PositiveBigIntegerField(verbose_name='Позиция у автора')),
+            ],
+            options={
+                'verbose_name': 'follow event',
+                'verbose_name_plural': 'follow events',
+                'indexes': [models.Index(fields=['user', 'user_position'], name='follow_event_user_idx'), models.Index(fields=['following', 'following_position'], name='follow_event_following_idx')],
+            },
+        ),
+    ]
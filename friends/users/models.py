@@ -1,26 +1,37 @@
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.utils import timezone
 
 User = get_user_model()
 
 
 class Follow(models.Model):
+    # `unique_follow` and `follow_following_user_idx` lead with these
+    # columns, so the default single-column FK indexes are redundant.
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         related_name='follower',
-        verbose_name='Подписчик'
+        verbose_name='Подписчик',
+        db_index=False
     )
     following = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         related_name='following',
-        verbose_name='Автор'
+        verbose_name='Автор',
+        db_index=False
     )
 
     class Meta:
         verbose_name = 'follow'
         verbose_name_plural = 'follows'
+        indexes = (
+            models.Index(
+                fields=('following', 'user'),
+                name='follow_following_user_idx'
+            ),
+        )
         constraints = (
             models.UniqueConstraint(
                 fields=('user', 'following'),
@@ -34,3 +45,123 @@ class Follow(models.Model):
 
     def __str__(self) -> str:
         return f'{self.__class__.__name__}: {self.user}->{self.following}'
+
+
+class UserCounters(models.Model):
+    '''
+    Denormalized relationship counters of the user.
+
+    Kept in sync with `Follow` by `users.signals`, so a profile page
+    reads them with one primary key lookup.
+
+    `relationships_version` and `relationships_changed_at` change with
+    every follow of the user, they stamp the relationship lists of the
+    user for conditional requests. The version grows by one per follow
+    or unfollow, and numbers the events of the change feed of the user.
+    '''
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='counters',
+        verbose_name='Пользователь'
+    )
+    subscribers_count = models.IntegerField('Подписчики', default=0)
+    subscriptions_count = models.IntegerField('Подписки', default=0)
+    friends_count = models.IntegerField('Друзья', default=0)
+    relationships_version = models.PositiveBigIntegerField(
+        'Версия отношений', default=0
+    )
+    relationships_changed_at = models.DateTimeField(
+        'Отношения изменены', default=timezone.now
+    )
+
+    class Meta:
+        verbose_name = 'user counters'
+        verbose_name_plural = 'user counters'
+
+    def __str__(self) -> str:
+        return f'{self.__class__.__name__}: {self.user_id}'
+
+
+class Friendship(models.Model):
+    '''
+    Materialized mutual follow.
+
+    Every friendship is stored in both directions, so the friends of a
+    user are one range of the `unique_friendship` index. Rows are
+    written and removed together with `Follow` by `users.signals`.
+    '''
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='friendships',
+        verbose_name='Пользователь'
+    )
+    friend = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='friend_of',
+        verbose_name='Друг'
+    )
+
+    class Meta:
+        verbose_name = 'friendship'
+        verbose_name_plural = 'friendships'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'friend'),
+                name='unique_friendship'
+            ),
+        )
+
+    def __str__(self) -> str:
+        return f'{self.__class__.__name__}: {self.user_id}<->{self.friend_id}'
+
+
+class FollowEvent(models.Model):
+    '''
+    Append-only log of created and deleted follows.
+
+    Written by `users.services` together with the follows. The event
+    takes the next `relationships_version` of both users as its
+    positions, the cursors of their change feeds. The users are kept
+    without a foreign key constraint, so the events of a deleted user
+    stay in the log for the consumers of the feed.
+    '''
+    user = models.ForeignKey(
+        User,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
+        related_name='+',
+        verbose_name='Подписчик'
+    )
+    following = models.ForeignKey(
+        User,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
+        related_name='+',
+        verbose_name='Автор'
+    )
+    created = models.BooleanField('Подписка создана')
+    created_at = models.DateTimeField('Время', default=timezone.now)
+    user_position = models.PositiveBigIntegerField('Позиция у подписчика')
+    following_position = models.PositiveBigIntegerField('Позиция у автора')
+
+    class Meta:
+        verbose_name = 'follow event'
+        verbose_name_plural = 'follow events'
+        # The feed of a user is one range of each of the two indexes.
+        indexes = (
+            models.Index(fields=('user', 'user_position'),
+                         name='follow_event_user_idx'),
+            models.Index(fields=('following', 'following_position'),
+                         name='follow_event_following_idx'),
+        )
+
+    def __str__(self) -> str:
+        sign = '+' if self.created else '-'
+        return (f'{self.__class__.__name__} {self.id}: '
+                f'{sign}{self.user_id}->{self.following_id}')
@@ -0,0 +1,111 @@
+from django.core.paginator import InvalidPage, Page
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class IdCursorPagination(CursorPagination):
+    '''
+    Keyset pagination over the `id` ordering used by the user lists.
+
+    Pages are fetched with `WHERE id > <position> ORDER BY id LIMIT n`,
+    so there is no `COUNT(*)` and no `OFFSET` scan at any depth.
+    '''
+    ordering = 'id'
+
+
+class UserListPagination(PageNumberPagination):
+    '''
+    Page number pagination with an opt-in keyset mode.
+
+    Pass `?pagination=cursor` to switch a list endpoint to
+    `IdCursorPagination`. The `next`/`previous` links keep the parameter,
+    so clients only have to opt in on the first request.
+    '''
+    pagination_query_param = 'pagination'
+    cursor_pagination_value = 'cursor'
+    cursor_pagination_class = IdCursorPagination
+
+    def __init__(self):
+        self.cursor_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        mode = request.query_params.get(self.pagination_query_param)
+        if mode == self.cursor_pagination_value:
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response_schema(
+                schema
+            )
+        return super().get_paginated_response_schema(schema)
+
+    def get_html_context(self):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_html_context()
+        return super().get_html_context()
+
+    def get_schema_operation_parameters(self, view):
+        parameters = super().get_schema_operation_parameters(view)
+        parameters.append({
+            'name': self.pagination_query_param,
+            'required': False,
+            'in': 'query',
+            'description': 'Set to `cursor` to use keyset pagination.',
+            'schema': {'type': 'string', 'enum': ['cursor']},
+        })
+        parameters.append({
+            'name': IdCursorPagination.cursor_query_param,
+            'required': False,
+            'in': 'query',
+            'description': IdCursorPagination.cursor_query_description,
+            'schema': {'type': 'string'},
+        })
+        return parameters
+
+
+class AsyncPageNumberPagination(PageNumberPagination):
+    '''
+    Page number pagination for the async views of `users.async_views`.
+
+    Counts with `acount()` and reads the page with `aiterator()`. Takes
+    a plain Django request and returns the response data, links and
+    errors are the same as those of `PageNumberPagination`.
+    '''
+
+    async def apaginate_queryset(self, queryset, request):
+        paginator = self.django_paginator_class(queryset, self.page_size)
+        paginator.count = await queryset.acount()
+        page_number = request.GET.get(self.page_query_param) or 1
+        if page_number in self.last_page_strings:
+            page_number = paginator.num_pages
+        try:
+            number = paginator.validate_number(page_number)
+        except InvalidPage as exc:
+            msg = self.invalid_page_message.format(
+                page_number=page_number, message=str(exc)
+            )
+            raise NotFound(msg)
+        bottom = (number - 1) * self.page_size
+        page = queryset[bottom:bottom + self.page_size]
+        self.page = Page([obj async for obj in page.aiterator()], number,
+                         paginator)
+        self.request = request
+        return list(self.page)
+
+    def get_paginated_data(self, data):
+        return {
+            'count': self.page.paginator.count,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
@@ -4,6 +4,8 @@ from django.core import exceptions as django_exceptions
 from django.db import IntegrityError
 from rest_framework import serializers
 
+from users.models import FollowEvent, UserCounters
+
 User = get_user_model()
 
 
@@ -11,7 +13,8 @@ class UserSerializer(serializers.ModelSerializer):
     """
     Serializer for User model.
     Be sure to annotate `is_follower` and `is_following`
-    when many=True for optimized queries.
+    or pass the cached `relationships` of the request user
+    in the context when many=True for optimized queries.
     """
     FRIENDSHIP_STATUSES = {
         'friends': 'уже друзья',
@@ -19,6 +22,13 @@ class UserSerializer(serializers.ModelSerializer):
         'incoming_request': 'есть входящая заявка',
         'nothing': 'нет ничего',
     }
+    # (is_follower, is_following) -> friendship status.
+    FRIENDSHIP_STATUS_BY_FLAGS = {
+        (True, True): FRIENDSHIP_STATUSES['friends'],
+        (False, True): FRIENDSHIP_STATUSES['outgoing_request'],
+        (True, False): FRIENDSHIP_STATUSES['incoming_request'],
+        (False, False): FRIENDSHIP_STATUSES['nothing'],
+    }
 
     friendship_status = serializers.SerializerMethodField()
 
@@ -28,8 +38,11 @@ class UserSerializer(serializers.ModelSerializer):
 
     def get_friendship_status(self, obj):
         user = self.context['request'].user
+        relationships = self.context.get('relationships')
         if hasattr(obj, 'is_follower'):
             is_follower = obj.is_follower
+        elif relationships is not None:
+            is_follower = obj.id in relationships.followers
         else:
             is_follower = (
                 user.is_authenticated
@@ -37,18 +50,48 @@ class UserSerializer(serializers.ModelSerializer):
             )
         if hasattr(obj, 'is_following'):
             is_following = obj.is_following
+        elif relationships is not None:
+            is_following = obj.id in relationships.following
         else:
             is_following = (
                 user.is_authenticated
                 and obj.following.filter(user=user).exists()
             )
-        if is_follower and is_following:
-            return self.FRIENDSHIP_STATUSES['friends']
-        if is_following:
-            return self.FRIENDSHIP_STATUSES['outgoing_request']
-        if is_follower:
-            return self.FRIENDSHIP_STATUSES['incoming_request']
-        return self.FRIENDSHIP_STATUSES['nothing']
+        return self.get_status_by_flags(is_follower, is_following)
+
+    @classmethod
+    def get_status_by_flags(cls, is_follower, is_following):
+        return cls.FRIENDSHIP_STATUS_BY_FLAGS[
+            bool(is_follower), bool(is_following)
+        ]
+
+
+def serialize_user_values(rows, relationships=None):
+    '''
+    Fast path of `UserSerializer(many=True).data` for list responses.
+
+    Takes rows of `values('id', 'username')`, with `is_follower` and
+    `is_following` when annotated, otherwise the flags are read from the
+    cached `relationships` of the request user. Returns the same data
+    without building model instances or serializer fields.
+    '''
+    statuses = UserSerializer.FRIENDSHIP_STATUS_BY_FLAGS
+    if relationships is not None:
+        followers, following = relationships
+        return [{
+            'id': row['id'],
+            'username': row['username'],
+            'friendship_status': statuses[
+                row['id'] in followers, row['id'] in following
+            ],
+        } for row in rows]
+    return [{
+        'id': row['id'],
+        'username': row['username'],
+        'friendship_status': statuses[
+            row.get('is_follower', False), row.get('is_following', False)
+        ],
+    } for row in rows]
 
 
 class UserCreateSerializer(UserSerializer):
@@ -85,3 +128,60 @@ class UserCreateSerializer(UserSerializer):
 
     def perform_create(self, validated_data):
         return User.objects.create_user(**validated_data)
+
+
+class UserCountersSerializer(serializers.ModelSerializer):
+    class Meta:
+        fields = ('subscribers_count', 'subscriptions_count', 'friends_count')
+        model = UserCounters
+
+
+class UserIdsSerializer(serializers.Serializer):
+    MAX_IDS = 100
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_IDS,
+    )
+
+
+class FriendSuggestionsQuerySerializer(serializers.Serializer):
+    '''Query of the suggestions, `max_limit` comes from the context.'''
+    DEFAULT_LIMIT = 20
+
+    limit = serializers.IntegerField(min_value=1, default=DEFAULT_LIMIT)
+
+    def validate_limit(self, limit):
+        max_limit = self.context['max_limit']
+        if limit > max_limit:
+            raise serializers.ValidationError(f'Не больше {max_limit}.')
+        return limit
+
+
+class FollowChangesQuerySerializer(serializers.Serializer):
+    '''Query of the change feed, `max_limit` comes from the context.'''
+    since = serializers.IntegerField(min_value=0, required=False)
+    limit = serializers.IntegerField(min_value=1, required=False)
+
+    def validate_limit(self, limit):
+        max_limit = self.context['max_limit']
+        if limit > max_limit:
+            raise serializers.ValidationError(f'Не больше {max_limit}.')
+        return limit
+
+
+class FollowEventSerializer(serializers.ModelSerializer):
+    EVENT_TYPES = {True: 'follow', False: 'unfollow'}
+
+    type = serializers.SerializerMethodField()
+    # Position of the event in the feed it was read from.
+    position = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        fields = ('id', 'position', 'type', 'user', 'following',
+                  'created_at')
+        model = FollowEvent
+
+    def get_type(self, event):
+        return self.EVENT_TYPES[event.created]
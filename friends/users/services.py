@@ -1,14 +1,30 @@
-from typing import Optional
+import hashlib
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import (Any, Callable, Dict, Iterable, Iterator, List, NamedTuple,
+                    Optional, Tuple)
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Exists, OuterRef, Q, Subquery
+from django.db import (DEFAULT_DB_ALIAS, IntegrityError, connection,
+                       connections, transaction)
+from django.db.models import (Case, Count, Exists, F, OuterRef, Q, Subquery,
+                              Value, When)
 from django.db.models.query import QuerySet
+from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.module_loading import import_string
 from rest_framework import status
 from rest_framework.request import Request
 from rest_framework.response import Response
 
-from users.models import Follow
+from users.cache import (BaseRelationshipCache, Relationships,
+                         get_relationship_cache)
+from users.events import count_changes, record_follow_events
+from users.graph import (FollowGraphIndex, get_follow_graph_index,
+                         intersect_sorted)
+from users.models import Follow, Friendship, UserCounters
 from users.serializers import UserSerializer
 
 User = get_user_model()
@@ -16,6 +32,14 @@ User = get_user_model()
 
 ERRORS_KEY: str = 'errors'
 
+Edge = Tuple[int, int]
+CountersDeltas = Dict[int, Dict[str, int]]
+
+# Edges or users per statement of a sync. Deleting a user syncs all of
+# its follows at once, and a statement with an OR or a CASE term per
+# edge would exceed the expression depth of SQLite.
+SYNC_CHUNK_SIZE = 500
+
 
 def annotate_follower_and_following_on_request_user(
         queryset: QuerySet, request_user: User) -> QuerySet:
@@ -29,55 +53,359 @@ def annotate_follower_and_following_on_request_user(
     )
 
 
+def get_relationships(
+        user_id: int,
+        user_ids: Optional[Iterable[int]] = None) -> Optional[Relationships]:
+    """
+    Return follower and following ids of the user.
+
+    With the follow graph enabled the ids are read from the graph, and
+    only those among `user_ids` when given, by merging the sorted ids
+    with the adjacency rows of the user. Otherwise they come from the
+    cache: missing entries are loaded with one query and cached. Users
+    with more follows than the `max_ids` of the cache are told by their
+    counters first and not loaded. Returns None for them and when both
+    the graph and the cache are disabled, the caller reads the
+    relationships with SQL.
+    """
+    index = get_follow_graph_index()
+    if index is not None:
+        graph = index.graph
+        followers = graph.followers(user_id)
+        following = graph.following(user_id)
+        if user_ids is not None:
+            user_ids = sorted(user_ids)
+            followers = intersect_sorted(user_ids, followers)
+            following = intersect_sorted(user_ids, following)
+        return Relationships(frozenset(followers), frozenset(following))
+    cache = get_relationship_cache()
+    if cache is None:
+        return None
+    relationships = cache.get(user_id)
+    if relationships is not None:
+        return relationships
+    if cache.max_ids is not None and _count_follows(user_id) > cache.max_ids:
+        return None
+    followers, following = set(), set()
+    follows = Follow.objects.filter(
+        Q(user=user_id) | Q(following=user_id)
+    ).values_list('user', 'following')
+    for follower_id, following_id in follows.iterator():
+        if following_id == user_id:
+            followers.add(follower_id)
+        else:
+            following.add(following_id)
+    relationships = Relationships(frozenset(followers), frozenset(following))
+    cache.set(user_id, relationships)
+    return relationships
+
+
+def _count_follows(user_id: int) -> int:
+    counters = UserCounters.objects.filter(user_id=user_id).values_list(
+        'subscribers_count', 'subscriptions_count', 'friends_count'
+    ).first()
+    if counters is None:
+        return 0
+    subscribers, subscriptions, friends = counters
+    # A friend is both a follower and followed.
+    return subscribers + subscriptions + 2 * friends
+
+
+class RelationshipStamp(NamedTuple):
+    '''Version and change time of the relationships of a user.'''
+    version: int
+    changed_at: Optional[datetime]
+
+
+def get_relationship_stamps(
+        user_ids: Iterable[int]) -> Dict[int, RelationshipStamp]:
+    """
+    Return the relationship stamps of the users with one query.
+
+    Users without a `UserCounters` row never had a follow and are left
+    out of the result.
+    """
+    return {
+        user_id: RelationshipStamp(version, changed_at)
+        for user_id, version, changed_at in UserCounters.objects.filter(
+            user_id__in=user_ids
+        ).values_list('user_id', 'relationships_version',
+                      'relationships_changed_at')
+    }
+
+
+def get_list_validators(
+        stamps: Dict[int, RelationshipStamp], user_ids: List[int],
+        request_user_id: Optional[int],
+        request_key: tuple) -> Optional[Tuple[str, int]]:
+    """
+    Return the weak ETag and the Last-Modified timestamp of a
+    relationship list of `user_ids` for the request user.
+
+    `stamps` are the relationship stamps of these users and of the
+    request user, `request_key` tells apart the lists of one user (path
+    with the query, media type). Returns None when a listed user has no
+    stamp (the user never had a follow or does not exist) or the list
+    may be stale.
+    """
+    if not all(user_id in stamps for user_id in user_ids):
+        return None
+    validated = [stamps[user_id] for user_id in user_ids]
+    if request_user_id in stamps:
+        validated.append(stamps[request_user_id])
+    key = repr((*request_key, request_user_id,
+                [tuple(stamp) for stamp in validated]))
+    last_modified = max(stamp.changed_at for stamp in validated)
+    max_staleness = _get_max_staleness()
+    if max_staleness is not None and (
+            timezone.now() - last_modified < timedelta(seconds=max_staleness)):
+        # The graphs and caches of other processes may still miss the
+        # change, a stale list must not be validated until they reload.
+        return None
+    etag = f'W/"{hashlib.sha1(key.encode()).hexdigest()}"'
+    return etag, int(last_modified.timestamp())
+
+
+def _get_max_staleness() -> Optional[float]:
+    index = get_follow_graph_index()
+    if index is not None:
+        return index.max_staleness
+    cache = get_relationship_cache()
+    if cache is not None:
+        return cache.timeout
+    return None
+
+
 def destroy_from_subscribers(request_user: User, user_id: int,
                              subscriber_id: int) -> Response:
-    not_enough_rights: str = 'Недостаточно прав!'
-    cannot_unsubscribe_if_not_subscribed: str = (
+    """
+    Remove `subscriber_id` from the subscribers of `user_id`.
+
+    Only the user can remove their subscribers, which is checked before
+    any query. The follow is removed by one `DELETE` that skips friends,
+    the subscriber is only loaded to explain a failed delete.
+    """
+    if str(request_user.id) != str(user_id):
+        return Response({ERRORS_KEY: 'Недостаточно прав!'},
+                        status.HTTP_403_FORBIDDEN)
+    follows = Follow.objects.filter(
+        user=subscriber_id, following=user_id
+    ).filter(~Exists(Friendship.objects.filter(
+        user=user_id, friend=subscriber_id
+    )))
+    with transaction.atomic():
+        deleted = _delete_follows(follows)
+        sync_deleted_follows(deleted)
+    if deleted:
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    subscriber = get_object_or_404(User, id=subscriber_id)
+    error_message = (
         'Пользователь {subscriber}, не является подписчиком {user}!'
-    )
+    ).format(subscriber=subscriber.username, user=request_user.username)
+    return Response({ERRORS_KEY: error_message}, status.HTTP_400_BAD_REQUEST)
 
-    user = get_object_or_404(User, id=user_id)
-    subscriber = get_object_or_404(User,
-                                   id=subscriber_id)
-    subscribers = SubscriptionQuerySet(user).get_user_subscribers()
-    if request_user != user:
-        error_message = {ERRORS_KEY: not_enough_rights}
-        return Response(error_message, status.HTTP_403_FORBIDDEN)
-    if not subscribers.filter(id=subscriber_id).exists():
-        error_message = {
-            ERRORS_KEY: cannot_unsubscribe_if_not_subscribed.format(
-                subscriber=subscriber.username, user=user.username
-            )
-        }
-        return Response(error_message, status.HTTP_400_BAD_REQUEST)
-    Follow.objects.get(user=subscriber_id, following=user_id).delete()
-    return Response(status=status.HTTP_204_NO_CONTENT)
 
+class SubqueryEngine:
+    '''
+    Builds the subscription sets with `IN` / `NOT IN` subqueries.
 
-class SubscriptionQuerySet:
-    def __init__(self, user: User) -> None:
-        self.user = user
+    The follows of the user are filtered in a subquery and the friends
+    are excluded with a nested `NOT IN`.
+    '''
 
-    def get_user_subscribers(self) -> QuerySet:
-        user_all_subscriptions = self.user.follower.values('following')
-        subscribers = self.user.following.filter(
-            ~Q(user__in=user_all_subscriptions)
+    def get_user_subscribers(self, user: User) -> QuerySet:
+        subscribers = user.following.filter(
+            ~Q(user__in=self._get_friends_ids(user))
         ).values('user')
         return User.objects.filter(id__in=subscribers)
 
-    def get_user_subscriptions(self) -> QuerySet:
-        user_all_subscribers = self.user.following.values('user')
-        subscriptions = self.user.follower.filter(
-            ~Q(following__in=user_all_subscribers)
+    def get_user_subscriptions(self, user: User) -> QuerySet:
+        subscriptions = user.follower.filter(
+            ~Q(following__in=self._get_friends_ids(user))
         ).values('following')
         return User.objects.filter(id__in=subscriptions)
 
+    def get_user_friends(self, user: User) -> QuerySet:
+        return User.objects.filter(friend_of__user=user)
+
+    def _get_friends_ids(self, user: User) -> QuerySet:
+        return user.friendships.values('friend')
+
+
+class JoinEngine(SubqueryEngine):
+    '''
+    Builds the subscription sets with joins and `NOT EXISTS` anti-joins.
+
+    Users are joined to their follows directly, the unique follow
+    constraint keeps the rows distinct. Friends are excluded with a
+    correlated `NOT EXISTS` that planners run as an index probe per row
+    instead of materializing the friend ids.
+    '''
+
+    def get_user_subscribers(self, user: User) -> QuerySet:
+        return User.objects.filter(
+            follower__following=user
+        ).filter(~self._is_friend(user))
+
+    def get_user_subscriptions(self, user: User) -> QuerySet:
+        return User.objects.filter(
+            following__user=user
+        ).filter(~self._is_friend(user))
+
+    def _is_friend(self, user: User) -> Exists:
+        return Exists(Friendship.objects.filter(
+            user=user, friend=OuterRef('pk')
+        ))
+
+
+class GraphEngine(SubqueryEngine):
+    '''
+    Reads the subscription sets from the in-memory follow graph.
+
+    The ids are merged from the sorted adjacency rows of the user and
+    sent as an `IN` list. Sets merged from rows longer than the
+    `MAX_IDS` option of the graph are left to the SQL `fallback`
+    engine.
+    '''
+
+    def __init__(self, index: FollowGraphIndex,
+                 fallback: SubqueryEngine) -> None:
+        self.index = index
+        self.fallback = fallback
+
+    def get_user_subscribers(self, user: User) -> QuerySet:
+        graph = self.index.graph
+        return self._get_users(
+            len(graph.followers(user.id)),
+            lambda: graph.subscribers(user.id),
+            self.fallback.get_user_subscribers, user,
+        )
+
+    def get_user_subscriptions(self, user: User) -> QuerySet:
+        graph = self.index.graph
+        return self._get_users(
+            len(graph.following(user.id)),
+            lambda: graph.subscriptions(user.id),
+            self.fallback.get_user_subscriptions, user,
+        )
+
+    def get_user_friends(self, user: User) -> QuerySet:
+        graph = self.index.graph
+        return self._get_users(
+            min(len(graph.followers(user.id)), len(graph.following(user.id))),
+            lambda: graph.friends(user.id),
+            self.fallback.get_user_friends, user,
+        )
+
+    def _get_users(self, max_size: int, get_ids: Callable[[], List[int]],
+                   fallback: Callable, user: User) -> QuerySet:
+        # The rows bound the merged set, a user with rows longer than
+        # MAX_IDS goes to SQL before they are merged.
+        if max_size > self.index.options['MAX_IDS']:
+            return fallback(user)
+        return User.objects.filter(id__in=get_ids())
+
+
+class CacheEngine(SubqueryEngine):
+    '''
+    Reads the subscription sets from the relationship cache.
+
+    The sets are computed from the cached follower and following ids of
+    the user, loaded on a miss, and sent as an `IN` list. Users too
+    large for the cache and sets longer than its `max_list_ids` are
+    left to the SQL `fallback` engine.
+    '''
+
+    def __init__(self, cache: BaseRelationshipCache,
+                 fallback: SubqueryEngine) -> None:
+        self.cache = cache
+        self.fallback = fallback
+
+    def get_user_subscribers(self, user: User) -> QuerySet:
+        return self._get_users(
+            lambda relationships: (relationships.followers
+                                   - relationships.following),
+            self.fallback.get_user_subscribers, user,
+        )
+
+    def get_user_subscriptions(self, user: User) -> QuerySet:
+        return self._get_users(
+            lambda relationships: (relationships.following
+                                   - relationships.followers),
+            self.fallback.get_user_subscriptions, user,
+        )
+
+    def get_user_friends(self, user: User) -> QuerySet:
+        return self._get_users(
+            lambda relationships: (relationships.followers
+                                   & relationships.following),
+            self.fallback.get_user_friends, user,
+        )
+
+    def _get_users(self, get_ids: Callable[[Relationships], frozenset],
+                   fallback: Callable, user: User) -> QuerySet:
+        relationships = get_relationships(user.id)
+        if relationships is None:
+            return fallback(user)
+        user_ids = get_ids(relationships)
+        if len(user_ids) > self.cache.max_list_ids:
+            return fallback(user)
+        return User.objects.filter(id__in=user_ids)
+
+
+# SQLite materializes `IN` subqueries into sorted ephemeral indexes,
+# which also serve `ORDER BY id`, so it keeps the subquery engine.
+# PostgreSQL and MySQL turn `NOT EXISTS` into hash or merge anti-joins
+# but run `NOT IN` as a filter over the subquery result.
+SUBSCRIPTION_QUERY_ENGINES: Dict[str, str] = {
+    'default': 'users.services.SubqueryEngine',
+    'postgresql': 'users.services.JoinEngine',
+    'mysql': 'users.services.JoinEngine',
+}
+
+
+def get_subscription_query_engine(
+        using: str = DEFAULT_DB_ALIAS,
+        relationship_cache: bool = True,
+        follow_graph: bool = True) -> SubqueryEngine:
+    """
+    Return the engine for the vendor of the `using` database.
+
+    `settings.SUBSCRIPTION_QUERY_ENGINES` maps vendors to dotted engine
+    paths and overrides `SUBSCRIPTION_QUERY_ENGINES`, the `default`
+    entry covers the other vendors. With `settings.FOLLOW_GRAPH` set
+    and `follow_graph` true the engine is wrapped in a `GraphEngine`,
+    otherwise with `settings.RELATIONSHIP_CACHE` set and
+    `relationship_cache` true in a `CacheEngine`. Both load from the
+    database synchronously, the async views turn them off.
+    """
+    engines = {**SUBSCRIPTION_QUERY_ENGINES,
+               **getattr(settings, 'SUBSCRIPTION_QUERY_ENGINES', {})}
+    vendor = connections[using].vendor
+    engine = import_string(engines.get(vendor, engines['default']))()
+    index = get_follow_graph_index()
+    if index is not None and follow_graph:
+        return GraphEngine(index, engine)
+    cache = get_relationship_cache()
+    if cache is not None and relationship_cache:
+        return CacheEngine(cache, engine)
+    return engine
+
+
+class SubscriptionQuerySet:
+    def __init__(self, user: User,
+                 engine: Optional[SubqueryEngine] = None) -> None:
+        self.user = user
+        self.engine = engine or get_subscription_query_engine()
+
+    def get_user_subscribers(self) -> QuerySet:
+        return self.engine.get_user_subscribers(self.user)
+
+    def get_user_subscriptions(self) -> QuerySet:
+        return self.engine.get_user_subscriptions(self.user)
+
     def get_user_friends(self) -> QuerySet:
-        user_all_subscribers = self.user.following.values('user')
-        friends = self.user.follower.filter(
-            Q(following__in=user_all_subscribers)
-        ).values('following')
-        return User.objects.filter(id__in=friends)
+        return self.engine.get_user_friends(self.user)
 
 
 class SubsriptionCreateDelete:
@@ -94,43 +422,508 @@ class SubsriptionCreateDelete:
         self.user_queryset: QuerySet = user_queryset
         self.following_user_id: Optional[int] = following_user_id
 
+    @transaction.atomic
     def create_subscribe(self) -> Response:
+        if str(self.following_user_id) == str(self.user.id):
+            return Response(
+                {ERRORS_KEY: self.CANNOT_SUBSCRIBE_TO_YOURSELF},
+                status.HTTP_400_BAD_REQUEST,
+            )
         following = self._get_following_or_404()
-        if self.user == following:
+        if following.id == self.user.id:
+            # The id of the request was spelled differently, as `01`.
             return Response(
                 {ERRORS_KEY: self.CANNOT_SUBSCRIBE_TO_YOURSELF},
                 status.HTTP_400_BAD_REQUEST,
             )
-        if self._is_follow_exists(following):
+        # A stored follow is told by the annotation without an insert,
+        # one stored concurrently since is skipped by the insert.
+        edges = [(self.user.id, following.id)]
+        if following.is_following or not _insert_follows(edges):
             return Response(
                 {ERRORS_KEY: self.CANNOT_SUBSCRIBE_TWICE},
                 status.HTTP_400_BAD_REQUEST,
             )
-
-        Follow.objects.create(user=self.user, following=following)
-        following = self._get_following_or_404()
+        sync_created_follows(edges)
+        following.is_following = True
         serializer = UserSerializer(instance=following,
                                     context={'request': self.request})
         return Response(serializer.data, status.HTTP_201_CREATED)
 
+    @transaction.atomic
     def delete_subscribe(self) -> Response:
-        following = self._get_following_or_404()
-        if not self._is_follow_exists(following):
+        deleted = _delete_follows(Follow.objects.filter(
+            user=self.user, following=self.following_user_id
+        ))
+        if not deleted:
+            if not self.user_queryset.filter(
+                    id=self.following_user_id).exists():
+                raise Http404
             return Response(
                 {ERRORS_KEY: self.CANNOT_UNSUBSCRIBED_IF_NOT_SUBSCRIBED},
                 status.HTTP_400_BAD_REQUEST,
             )
-        Follow.objects.get(user=self.user, following=following).delete()
+        sync_deleted_follows(deleted)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
-    def _is_follow_exists(self, following: User) -> bool:
-        return Follow.objects.filter(
-            user=self.user,
-            following=following
-        ).exists()
-
     def _get_following_or_404(self) -> User:
-        return get_object_or_404(
-            self.user_queryset,
-            id=self.following_user_id,
+        """
+        Return the followed user with `is_follower` annotated, the
+        friendship status of the response needs no other query.
+        """
+        queryset = self.user_queryset
+        if 'is_follower' not in queryset.query.annotations:
+            queryset = annotate_follower_and_following_on_request_user(
+                queryset, self.user
+            )
+        return get_object_or_404(queryset, id=self.following_user_id)
+
+
+class BulkSubscriptionCreateDelete:
+    """
+    Subscribe to or unsubscribe from many users in one request.
+
+    Every id gets its own outcome with the status code and error
+    message the single-user `SubsriptionCreateDelete` would return.
+    """
+    USER_NOT_FOUND: str = 'Пользователь не найден!'
+
+    def __init__(self, request: Request, user_queryset: QuerySet,
+                 following_user_ids: List[int]) -> None:
+        self.user: User = request.user
+        self.user_queryset: QuerySet = user_queryset
+        self.following_user_ids: List[int] = list(
+            dict.fromkeys(following_user_ids)
+        )
+
+    @transaction.atomic
+    def create_subscribes(self) -> Response:
+        existing = self._get_existing_followings()
+        results = {}
+        edges = []
+        for following_id in self.following_user_ids:
+            if following_id not in existing:
+                results[following_id] = self._error(
+                    following_id, status.HTTP_404_NOT_FOUND,
+                    self.USER_NOT_FOUND
+                )
+            elif following_id == self.user.id:
+                results[following_id] = self._error(
+                    following_id, status.HTTP_400_BAD_REQUEST,
+                    SubsriptionCreateDelete.CANNOT_SUBSCRIBE_TO_YOURSELF
+                )
+            elif existing[following_id]:
+                results[following_id] = self._twice_error(following_id)
+            else:
+                edges.append((self.user.id, following_id))
+        # A concurrent request may have stored some of the follows since
+        # the check, only the inserted ones are synced and reported.
+        inserted = _insert_follows(edges)
+        for _, following_id in inserted:
+            results[following_id] = {'id': following_id,
+                                     'status': status.HTTP_201_CREATED}
+        for following_id in self.following_user_ids:
+            if following_id not in results:
+                results[following_id] = self._twice_error(following_id)
+        sync_created_follows(inserted)
+        return Response(
+            {'results': [results[following_id]
+                         for following_id in self.following_user_ids]},
+            status.HTTP_200_OK,
+        )
+
+    @transaction.atomic
+    def delete_subscribes(self) -> Response:
+        existing = self._get_existing_followings()
+        results = {}
+        following_ids = []
+        for following_id in self.following_user_ids:
+            if following_id not in existing:
+                results[following_id] = self._error(
+                    following_id, status.HTTP_404_NOT_FOUND,
+                    self.USER_NOT_FOUND
+                )
+            elif not existing[following_id]:
+                results[following_id] = self._not_subscribed_error(
+                    following_id
+                )
+            else:
+                following_ids.append(following_id)
+        deleted = []
+        if following_ids:
+            # A concurrent request may have deleted some of the follows
+            # since the check, only the deleted ones are synced.
+            deleted = _delete_follows(Follow.objects.filter(
+                user=self.user, following__in=following_ids
+            ))
+        for _, following_id in deleted:
+            results[following_id] = {'id': following_id,
+                                     'status': status.HTTP_204_NO_CONTENT}
+        for following_id in self.following_user_ids:
+            if following_id not in results:
+                results[following_id] = self._not_subscribed_error(
+                    following_id
+                )
+        sync_deleted_follows(deleted)
+        return Response(
+            {'results': [results[following_id]
+                         for following_id in self.following_user_ids]},
+            status.HTTP_200_OK,
         )
+
+    def _get_existing_followings(self) -> Dict[int, bool]:
+        """Map every existing requested id to `is_following`."""
+        followings = self.user_queryset.filter(
+            id__in=self.following_user_ids
+        ).annotate(is_following=Exists(
+            Follow.objects.filter(user=self.user, following=OuterRef('pk'))
+        )).values_list('id', 'is_following')
+        return dict(followings)
+
+    @staticmethod
+    def _error(following_id: int, status_code: int,
+               message: str) -> Dict[str, Any]:
+        return {'id': following_id, 'status': status_code,
+                ERRORS_KEY: message}
+
+    @classmethod
+    def _twice_error(cls, following_id: int) -> Dict[str, Any]:
+        return cls._error(following_id, status.HTTP_400_BAD_REQUEST,
+                          SubsriptionCreateDelete.CANNOT_SUBSCRIBE_TWICE)
+
+    @classmethod
+    def _not_subscribed_error(cls, following_id: int) -> Dict[str, Any]:
+        return cls._error(
+            following_id, status.HTTP_400_BAD_REQUEST,
+            SubsriptionCreateDelete.CANNOT_UNSUBSCRIBED_IF_NOT_SUBSCRIBED
+        )
+
+
+def sync_created_follows(edges: Iterable[Edge]) -> None:
+    """
+    Update the denormalized relations and append the follow events
+    after `edges` were inserted.
+
+    Edges are `(user_id, following_id)` pairs that are already stored
+    in `Follow`. Called by `users.signals` for single follows; bulk
+    writes that bypass signals must call it themselves.
+    """
+    _sync_follows(list(edges), created=True)
+
+
+def sync_deleted_follows(edges: Iterable[Edge]) -> None:
+    """
+    Update the denormalized relations after `edges` were deleted.
+
+    See `sync_created_follows`.
+    """
+    _sync_follows(list(edges), created=False)
+
+
+def rebuild_user_counters(batch_size: int = 1000) -> int:
+    """
+    Recompute `UserCounters` of every user from `Follow` in bulk.
+
+    Returns the number of written counters rows.
+    """
+    counters: Dict[int, Dict[str, int]] = defaultdict(
+        lambda: {'subscribers_count': 0,
+                 'subscriptions_count': 0,
+                 'friends_count': 0}
+    )
+    followers = Follow.objects.values('following').annotate(
+        total=Count('id')
+    ).values_list('following', 'total')
+    for user_id, total in followers.iterator():
+        counters[user_id]['subscribers_count'] += total
+    followings = Follow.objects.values('user').annotate(
+        total=Count('id')
+    ).values_list('user', 'total')
+    for user_id, total in followings.iterator():
+        counters[user_id]['subscriptions_count'] += total
+    reverse_follow = Follow.objects.filter(
+        user=OuterRef('following'), following=OuterRef('user')
+    )
+    mutual = Follow.objects.filter(Exists(reverse_follow)).values(
+        'user'
+    ).annotate(total=Count('id')).values_list('user', 'total')
+    for user_id, total in mutual.iterator():
+        counters[user_id]['friends_count'] += total
+        counters[user_id]['subscribers_count'] -= total
+        counters[user_id]['subscriptions_count'] -= total
+
+    with transaction.atomic():
+        # The follows may have changed without events, so every version
+        # moves on: the change feeds answer the older cursors as stale
+        # and the stamps of the relationship lists change.
+        versions = dict(UserCounters.objects.select_for_update().values_list(
+            'user_id', 'relationships_version'
+        ))
+        UserCounters.objects.all().delete()
+        UserCounters.objects.bulk_create(
+            (UserCounters(user_id=user_id,
+                          relationships_version=versions.get(user_id, 0) + 1,
+                          **counters[user_id])
+             for user_id in counters.keys() | versions.keys()),
+            batch_size=batch_size,
+        )
+    return len(counters)
+
+
+def rebuild_friendships(batch_size: int = 1000) -> int:
+    """
+    Recompute `Friendship` from the mutual follows in bulk.
+
+    Returns the number of written friendship rows (two per friendship).
+    """
+    reverse_follow = Follow.objects.filter(
+        user=OuterRef('following'), following=OuterRef('user')
+    )
+    mutual_follows = Follow.objects.filter(
+        Exists(reverse_follow)
+    ).values_list('user', 'following')
+    with transaction.atomic():
+        Friendship.objects.all().delete()
+        friendships = Friendship.objects.bulk_create(
+            (Friendship(user_id=user_id, friend_id=friend_id)
+             for user_id, friend_id in mutual_follows.iterator()),
+            batch_size=batch_size,
+        )
+    return len(friendships)
+
+
+def clear_follow_caches() -> None:
+    """
+    Drop the cached relationships and the follow graph.
+
+    Writes that skip `sync_created_follows` and `sync_deleted_follows`,
+    like the bulk loads, must call it once they are done.
+    """
+    cache = get_relationship_cache()
+    if cache is not None:
+        cache.clear()
+    index = get_follow_graph_index()
+    if index is not None:
+        index.clear()
+
+
+def _insert_follows(edges: List[Edge]) -> List[Edge]:
+    """
+    Insert the follows of `edges` that are not stored yet, without
+    signals, and return the inserted edges.
+
+    Backends that return rows from a bulk insert run one
+    `INSERT ... ON CONFLICT DO NOTHING RETURNING`, the skipped follows
+    are left out of its rows. Others insert every follow in a savepoint
+    and skip the ones failing `unique_follow`.
+    """
+    if not edges:
+        return []
+    if _can_return_rows():
+        quote_name = connection.ops.quote_name
+        user_column = quote_name(Follow._meta.get_field('user').column)
+        following_column = quote_name(
+            Follow._meta.get_field('following').column
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {quote_name(Follow._meta.db_table)} '
+                f'({user_column}, {following_column}) VALUES '
+                f'{", ".join(["(%s, %s)"] * len(edges))} '
+                f'ON CONFLICT DO NOTHING '
+                f'RETURNING {user_column}, {following_column}',
+                [user_id for edge in edges for user_id in edge],
+            )
+            inserted = set(cursor.fetchall())
+        return [edge for edge in edges if edge in inserted]
+    inserted = []
+    for user_id, following_id in edges:
+        try:
+            with transaction.atomic():
+                Follow.objects.bulk_create([
+                    Follow(user_id=user_id, following_id=following_id)
+                ])
+        except IntegrityError:
+            continue
+        inserted.append((user_id, following_id))
+    return inserted
+
+
+def _delete_follows(follows: QuerySet) -> List[Edge]:
+    """
+    Delete the follows of the `follows` queryset without signals, and
+    return the deleted edges.
+
+    `QuerySet.delete` would select the rows to send a post_delete per
+    follow, the callers sync the returned edges in one batch instead.
+    Backends that return rows from a statement run one
+    `DELETE ... RETURNING`, rows deleted concurrently are left out of
+    its rows. Others lock the rows with `SELECT ... FOR UPDATE` and
+    delete them by id.
+    """
+    quote_name = connection.ops.quote_name
+    table = quote_name(Follow._meta.db_table)
+    id_column = quote_name(Follow._meta.pk.column)
+    if _can_return_rows():
+        user_column = quote_name(Follow._meta.get_field('user').column)
+        following_column = quote_name(
+            Follow._meta.get_field('following').column
+        )
+        sql, params = follows.values('pk').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {table} WHERE {id_column} IN ({sql}) '
+                f'RETURNING {user_column}, {following_column}',
+                params,
+            )
+            return [tuple(edge) for edge in cursor.fetchall()]
+    rows = list(follows.select_for_update().values_list(
+        'pk', 'user', 'following'
+    ))
+    if rows:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {table} WHERE {id_column} IN '
+                f'({", ".join(["%s"] * len(rows))})',
+                [follow_id for follow_id, _, _ in rows],
+            )
+    return [(user_id, following_id) for _, user_id, following_id in rows]
+
+
+def _can_return_rows() -> bool:
+    # SQLite returns rows from 3.35, PostgreSQL always. Other backends
+    # lack either `RETURNING` or `ON CONFLICT`.
+    return (connection.features.can_return_rows_from_bulk_insert
+            and connection.vendor in ('postgresql', 'sqlite'))
+
+
+def _sync_follows(edges: List[Edge], created: bool) -> None:
+    if not edges:
+        return
+    mutual_edges = _get_mutual_edges(edges, created)
+    sign = 1 if created else -1
+    deltas: CountersDeltas = defaultdict(lambda: defaultdict(int))
+    for user_id, following_id in edges:
+        if (user_id, following_id) in mutual_edges:
+            # The follow answers (or breaks) an incoming request,
+            # so the pair moves between friends and subscribers.
+            deltas[user_id]['friends_count'] += sign
+            deltas[user_id]['subscribers_count'] -= sign
+            deltas[following_id]['friends_count'] += sign
+            deltas[following_id]['subscriptions_count'] -= sign
+        else:
+            deltas[user_id]['subscriptions_count'] += sign
+            deltas[following_id]['subscribers_count'] += sign
+    # The events take their positions from the counters rows, which
+    # stay locked by the update until the commit. A follow saved in
+    # autocommit mode gets a transaction for its sync here.
+    with transaction.atomic(savepoint=False):
+        _apply_counters_deltas(deltas, count_changes(edges))
+        _apply_friendships(mutual_edges, created)
+        _invalidate_relationships(deltas)
+        _apply_to_follow_graph(edges, created)
+        record_follow_events(edges, created)
+
+
+def _get_mutual_edges(edges: List[Edge], created: bool) -> set:
+    """
+    Return the edges whose reverse follow existed when they were written.
+
+    Edges of one batch are treated as applied in order: a created edge
+    sees the earlier edges of the batch, a deleted edge sees the later
+    ones as still present.
+    """
+    stored_edges = set()
+    for chunk in _chunks(edges):
+        reverse_filter = Q()
+        for user_id, following_id in chunk:
+            reverse_filter |= Q(user=following_id, following=user_id)
+        stored_edges.update(
+            Follow.objects.filter(reverse_filter).values_list('user',
+                                                              'following')
+        )
+    position = {edge: index for index, edge in enumerate(edges)}
+    mutual_edges = set()
+    for index, (user_id, following_id) in enumerate(edges):
+        reverse = (following_id, user_id)
+        if reverse not in position:
+            if reverse in stored_edges:
+                mutual_edges.add((user_id, following_id))
+            continue
+        if (position[reverse] < index) == created:
+            mutual_edges.add((user_id, following_id))
+    return mutual_edges
+
+
+def _apply_counters_deltas(deltas: CountersDeltas,
+                           changes: Dict[int, int]) -> None:
+    UserCounters.objects.bulk_create(
+        (UserCounters(user_id=user_id) for user_id in deltas),
+        ignore_conflicts=True,
+    )
+    changed_at = timezone.now()
+    for user_ids in _chunks(list(deltas)):
+        fields = {field for user_id in user_ids for field in deltas[user_id]}
+        # Every user of the deltas gained or lost a follow, so the stamps
+        # validating their relationship lists change as well.
+        UserCounters.objects.filter(user_id__in=user_ids).update(
+            relationships_version=F('relationships_version') + Case(
+                *(When(user_id=user_id, then=Value(changes[user_id]))
+                  for user_id in user_ids),
+                default=Value(0),
+            ),
+            relationships_changed_at=changed_at,
+            **{
+                field: F(field) + Case(
+                    *(When(user_id=user_id,
+                           then=Value(deltas[user_id][field]))
+                      for user_id in user_ids if deltas[user_id][field]),
+                    default=Value(0),
+                )
+                for field in fields
+            },
+        )
+
+
+def _apply_friendships(mutual_edges: set, created: bool) -> None:
+    if not mutual_edges:
+        return
+    if created:
+        Friendship.objects.bulk_create(
+            (Friendship(user_id=user_id, friend_id=friend_id)
+             for edge in mutual_edges
+             for user_id, friend_id in (edge, edge[::-1])),
+            ignore_conflicts=True,
+        )
+        return
+    friendships = [friendship for edge in mutual_edges
+                   for friendship in (edge, edge[::-1])]
+    for chunk in _chunks(friendships):
+        friendships_filter = Q()
+        for user_id, friend_id in chunk:
+            friendships_filter |= Q(user=user_id, friend=friend_id)
+        Friendship.objects.filter(friendships_filter).delete()
+
+
+def _chunks(items: list) -> Iterator[list]:
+    for start in range(0, len(items), SYNC_CHUNK_SIZE):
+        yield items[start:start + SYNC_CHUNK_SIZE]
+
+
+def _invalidate_relationships(user_ids: Iterable[int]) -> None:
+    cache = get_relationship_cache()
+    if cache is None:
+        return
+    user_ids = list(user_ids)
+    cache.invalidate(user_ids)
+    # A reader may have cached the pre-commit state in the meantime.
+    transaction.on_commit(lambda: cache.invalidate(user_ids))
+
+
+def _apply_to_follow_graph(edges: List[Edge], created: bool) -> None:
+    index = get_follow_graph_index()
+    if index is None:
+        return
+    # Only committed follows reach the graph, readers of other
+    # transactions must not see a follow that may be rolled back.
+    transaction.on_commit(lambda: index.apply(edges, created))
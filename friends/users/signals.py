@@ -0,0 +1,61 @@
+from django.contrib.auth import get_user_model
+from django.db.backends.signals import connection_created
+from django.db.models import Q
+from django.db.models.query import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from users.authentication import invalidate_tokens
+from users.models import Follow
+from users.services import sync_created_follows, sync_deleted_follows
+from users.sqlite import apply_sqlite_pragmas
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        sync_created_follows([(instance.user_id, instance.following_id)])
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, QuerySet):
+        origin = origin.model
+    if isinstance(origin, User) or origin is User:
+        # Already synced as one batch by `user_deleted`.
+        return
+    sync_deleted_follows([(instance.user_id, instance.following_id)])
+
+
+@receiver(pre_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    '''
+    Sync all follows of the user as one batch before the cascade.
+
+    Synced one by one after the cascade, both directions of a
+    friendship would already be gone and the friends of the user would
+    lose a subscriber instead of a friend.
+    '''
+    edges = Follow.objects.filter(
+        Q(user=instance) | Q(following=instance)
+    ).values_list('user', 'following')
+    sync_deleted_follows(edges)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    invalidate_tokens(keys=[instance.key])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    invalidate_tokens(user_ids=[instance.pk])
+
+
+@receiver(connection_created)
+def database_connected(sender, connection, **kwargs):
+    apply_sqlite_pragmas(connection)
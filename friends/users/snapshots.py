@@ -0,0 +1,247 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+from contextlib import closing
+from itertools import chain
+from typing import Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Field, Max, Model
+from django.db.models.query import QuerySet
+
+from users.models import Follow, Friendship, UserCounters
+from users.services import clear_follow_caches
+from users.synthetic import SyntheticGraph, generate_follow_graph
+
+User = get_user_model()
+
+# Tables of a synthetic graph, in insertion order.
+SNAPSHOT_MODELS = (User, Follow, Friendship, UserCounters)
+
+# Table of the `SyntheticGraph` fields not found in the model tables.
+GRAPH_TABLE = 'synthetic_graph'
+
+# Bump when the snapshot layout changes to ignore the older files.
+SNAPSHOT_VERSION = 1
+
+# Fields stored as they are, the others go through the field
+# conversions of the target database when they are loaded.
+RAW_FIELD_TYPES = {
+    'AutoField', 'BigAutoField', 'ForeignKey', 'OneToOneField',
+    'IntegerField', 'BigIntegerField', 'PositiveIntegerField',
+    'CharField',
+}
+
+Converter = Optional[Callable[[object], object]]
+
+
+def get_snapshot_directory() -> str:
+    return getattr(settings, 'SYNTHETIC_GRAPH_CACHE_DIR', os.path.join(
+        tempfile.gettempdir(), 'friends-synthetic-graphs'
+    ))
+
+
+def get_snapshot_path(**parameters) -> str:
+    '''
+    Path of the snapshot of the graph generated with `parameters`.
+
+    The name covers the columns of the snapshot tables, so a schema
+    change leaves the old snapshots unused.
+    '''
+    schema = [(model._meta.db_table,
+               [field.column for field in model._meta.concrete_fields])
+              for model in SNAPSHOT_MODELS]
+    key = repr((SNAPSHOT_VERSION, schema, sorted(parameters.items())))
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    return os.path.join(get_snapshot_directory(), f'graph-{digest}.sqlite3')
+
+
+def get_synthetic_graph(users: int, avg_degree: float,
+                        distribution: str = 'uniform',
+                        power_law_exponent: float = 1.0,
+                        reciprocity: float = 0.0,
+                        seed: int = 0,
+                        username_prefix: str = 'synthetic'
+                        ) -> SyntheticGraph:
+    """
+    Return the graph of `generate_follow_graph` with these arguments,
+    loaded from its SQLite snapshot when one was saved before.
+
+    The first call generates the graph and saves the snapshot, later
+    calls (of any process) copy its rows. Users and follows get new
+    ids above the ones in the database, but the usernames are kept:
+    load a graph once per database or give it its own prefix.
+    """
+    parameters = {
+        'users': users, 'avg_degree': avg_degree,
+        'distribution': distribution,
+        'power_law_exponent': power_law_exponent,
+        'reciprocity': reciprocity, 'seed': seed,
+        'username_prefix': username_prefix,
+    }
+    path = get_snapshot_path(**parameters)
+    if os.path.exists(path):
+        return load_snapshot(path)
+    graph = generate_follow_graph(**parameters)
+    save_snapshot(path, graph, username_prefix)
+    return graph
+
+
+def get_snapshot_queryset(model: Model, username_prefix: str) -> QuerySet:
+    if model is User:
+        return User.objects.filter(username__startswith=username_prefix)
+    return model.objects.filter(user__username__startswith=username_prefix)
+
+
+def save_snapshot(path: str, graph: SyntheticGraph,
+                  username_prefix: str) -> None:
+    '''
+    Copy `graph`, the users with `username_prefix` and their relations,
+    to a new SQLite file at `path`.
+
+    The file is written aside and moved in place, so concurrent test
+    runs never read a partial snapshot.
+    '''
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(
+        dir=os.path.dirname(path), suffix='.tmp'
+    )
+    os.close(descriptor)
+    try:
+        with closing(sqlite3.connect(temporary)) as snapshot:
+            for model in SNAPSHOT_MODELS:
+                fields = model._meta.concrete_fields
+                table = model._meta.db_table
+                columns = ', '.join(f'"{field.column}"' for field in fields)
+                snapshot.execute(f'CREATE TABLE "{table}" ({columns})')
+                rows = get_snapshot_queryset(
+                    model, username_prefix
+                ).order_by('pk').values_list(
+                    *(field.attname for field in fields)
+                )
+                snapshot.executemany(
+                    f'INSERT INTO "{table}" VALUES '
+                    f'({", ".join("?" * len(fields))})',
+                    (tuple(_to_snapshot(value) for value in row)
+                     for row in rows.iterator(chunk_size=10000)),
+                )
+            snapshot.execute(f'CREATE TABLE "{GRAPH_TABLE}" ("edges")')
+            snapshot.execute(f'INSERT INTO "{GRAPH_TABLE}" VALUES (?)',
+                             (graph.edges,))
+            snapshot.commit()
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+def load_snapshot(path: str, batch_size: int = 10000) -> SyntheticGraph:
+    """
+    Copy the rows of the snapshot at `path` into the database.
+
+    Primary keys are shifted above the largest key of every table and
+    the user references follow the users, so the rows never collide
+    with existing ones. Sequences are reset afterwards.
+    """
+    with closing(sqlite3.connect(path)) as snapshot, transaction.atomic():
+        offsets: Dict[Model, int] = {
+            model: model.objects.aggregate(last=Max('pk'))['last'] or 0
+            for model in SNAPSHOT_MODELS
+            if not model._meta.pk.is_relation
+        }
+        for model in SNAPSHOT_MODELS:
+            _load_table(snapshot, model, offsets, batch_size)
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(
+                    no_style(), list(offsets)):
+                cursor.execute(sql)
+        user_ids = [user_id + offsets[User] for user_id, in snapshot.execute(
+            f'SELECT "id" FROM "{User._meta.db_table}" ORDER BY "id"'
+        )]
+        edges, = snapshot.execute(
+            f'SELECT "edges" FROM "{GRAPH_TABLE}"'
+        ).fetchone()
+    clear_follow_caches()
+    return SyntheticGraph(user_ids, edges)
+
+
+def _load_table(snapshot: sqlite3.Connection, model: Model,
+                offsets: Dict[Model, int], batch_size: int) -> None:
+    fields = model._meta.concrete_fields
+    table = model._meta.db_table
+    converters = [_get_converter(field) for field in fields]
+    quote_name = connection.ops.quote_name
+    insert = (f'INSERT INTO {quote_name(table)} '
+              f'({", ".join(quote_name(field.column) for field in fields)}) '
+              f'VALUES ')
+    placeholders = f'({", ".join(["%s"] * len(fields))})'
+    # The snapshot shifts the keys itself, in C.
+    rows = snapshot.execute(
+        f'SELECT {", ".join(_select_column(field) for field in fields)} '
+        f'FROM "{table}"',
+        [offset for field in fields
+         for offset in _get_offsets(field, offsets)],
+    )
+    convert = any(converters)
+    # SQLite runs `executemany` in C, other backends get one
+    # multi-row INSERT per chunk, within the parameters limit.
+    chunk_size = 1 if connection.vendor == 'sqlite' else max(
+        (connection.features.max_query_params or 1000) // len(fields), 1
+    )
+    with connection.cursor() as cursor:
+        while True:
+            batch = rows.fetchmany(batch_size)
+            if not batch:
+                break
+            if convert:
+                batch = [_convert_row(row, converters) for row in batch]
+            if chunk_size == 1:
+                cursor.executemany(insert + placeholders, batch)
+                continue
+            for start in range(0, len(batch), chunk_size):
+                chunk = batch[start:start + chunk_size]
+                cursor.execute(
+                    insert + ', '.join([placeholders] * len(chunk)),
+                    list(chain.from_iterable(chunk)),
+                )
+
+
+def _select_column(field: Field) -> str:
+    if field.is_relation and field.related_model is User or (
+            field.primary_key):
+        return f'"{field.column}" + ?'
+    return f'"{field.column}"'
+
+
+def _get_offsets(field: Field, offsets: Dict[Model, int]) -> List[int]:
+    if field.is_relation and field.related_model is User:
+        return [offsets[User]]
+    if field.primary_key:
+        return [offsets[field.model]]
+    return []
+
+
+def _get_converter(field: Field) -> Converter:
+    if field.is_relation or field.primary_key or (
+            field.get_internal_type() in RAW_FIELD_TYPES):
+        return None
+    return lambda value: field.get_db_prep_save(field.to_python(value),
+                                                connection)
+
+
+def _convert_row(row: Tuple, converters: List[Converter]) -> Tuple:
+    return tuple(
+        value if converter is None or value is None else converter(value)
+        for value, converter in zip(row, converters)
+    )
+
+
+def _to_snapshot(value: object) -> object:
+    '''Store the values SQLite has no type for as text.'''
+    if value is None or isinstance(value, (int, float, str, bytes)):
+        return value
+    return value.isoformat()
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.db.backends.base.base import BaseDatabaseWrapper
+
+
+def get_sqlite_pragmas() -> dict:
+    return getattr(settings, 'SQLITE_PRAGMAS', None) or {}
+
+
+def apply_sqlite_pragmas(connection: BaseDatabaseWrapper) -> None:
+    '''
+    Run the `PRAGMA` statements of `settings.SQLITE_PRAGMAS` on a new
+    SQLite connection.
+
+    `journal_mode = wal` lets readers go on while a follow is written,
+    the other pragmas only last as long as the connection. In-memory
+    databases (the test database) keep their `memory` journal.
+    '''
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = get_sqlite_pragmas()
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
@@ -0,0 +1,132 @@
+from typing import List, Tuple
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db.models import Count, Exists, OuterRef
+from django.db.models.query import QuerySet
+
+from users.graph import get_follow_graph_index
+from users.models import Follow, Friendship, UserCounters
+from users.services import SubscriptionQuerySet
+
+User = get_user_model()
+
+# (user id, number of mutual friends) pairs, best first.
+Suggestions = List[Tuple[int, int]]
+
+FRIEND_SUGGESTIONS_DEFAULTS = {
+    # Friends of the user the candidates are collected from, the most
+    # recent friendships first.
+    'MAX_FRIENDS': 100,
+    # Friends with more friends than this are skipped, a celebrity in
+    # the friend list would turn every suggestion into a scan of its
+    # whole friend list.
+    'MAX_FRIEND_FRIENDS': 500,
+    # Suggestions computed and cached per user, `limit` may not exceed it.
+    'MAX_SUGGESTIONS': 100,
+    'CACHE_ALIAS': 'default',
+    # Lifetime of the cached suggestions and the `max-age` of both
+    # endpoints, in seconds.
+    'TIMEOUT': 300,
+}
+
+
+def get_suggestion_settings() -> dict:
+    return {**FRIEND_SUGGESTIONS_DEFAULTS,
+            **getattr(settings, 'FRIEND_SUGGESTIONS', {})}
+
+
+def get_mutual_friends(user: User, other: User) -> QuerySet:
+    """
+    Return the friends `user` and `other` have in common.
+
+    The friends of the user with fewer friends are read and each of
+    them is probed in the friendships of the other one, so the cost
+    follows the smaller friend list even when the other is a celebrity.
+    With the follow graph enabled the sorted friend ids of both users
+    are intersected in memory instead.
+    """
+    index = get_follow_graph_index()
+    if index is not None:
+        friend_ids = index.graph.mutual_friends(user.id, other.id)
+        if len(friend_ids) <= index.options['MAX_IDS']:
+            return User.objects.filter(id__in=friend_ids)
+    friends_counts = dict(UserCounters.objects.filter(
+        user__in=(user.id, other.id)
+    ).values_list('user', 'friends_count'))
+    if friends_counts.get(other.id, 0) < friends_counts.get(user.id, 0):
+        user, other = other, user
+    return SubscriptionQuerySet(user).get_user_friends().filter(
+        Exists(Friendship.objects.filter(user=other, friend=OuterRef('pk')))
+    )
+
+
+def get_expanded_friends(user_id: int, max_friends: int,
+                         max_friend_friends: int) -> QuerySet:
+    """
+    Return ids of up to `max_friends` friends of the user with at most
+    `max_friend_friends` friends each, the most recent friendships first.
+    """
+    return Friendship.objects.filter(
+        user=user_id,
+        friend__counters__friends_count__lte=max_friend_friends,
+    ).order_by('-id').values_list('friend', flat=True)[:max_friends]
+
+
+def get_friends_of_friends(user_id: int, friend_ids: List[int]) -> QuerySet:
+    """
+    Return (user id, mutual friends) of the friends of `friend_ids`,
+    most mutual friends first.
+
+    Users the user already follows (friends included) are left out.
+    """
+    return Friendship.objects.filter(
+        user__in=friend_ids
+    ).exclude(
+        friend=user_id
+    ).filter(
+        ~Exists(Follow.objects.filter(user=user_id,
+                                      following=OuterRef('friend')))
+    ).values('friend').annotate(
+        mutual_friends=Count('id')
+    ).order_by('-mutual_friends', 'friend').values_list(
+        'friend', 'mutual_friends'
+    )
+
+
+def rank_friends_of_friends(user_id: int, max_friends: int,
+                            max_friend_friends: int,
+                            limit: int) -> Suggestions:
+    """
+    Rank the friends of the friends of the user by mutual friends.
+
+    Only the friends of `get_expanded_friends` are expanded, which
+    bounds the rows read by one call to
+    `max_friends * max_friend_friends`.
+    """
+    friend_ids = list(get_expanded_friends(user_id, max_friends,
+                                           max_friend_friends))
+    if not friend_ids:
+        return []
+    return list(get_friends_of_friends(user_id, friend_ids)[:limit])
+
+
+def get_friend_suggestions(user_id: int, limit: int) -> Suggestions:
+    """
+    Return up to `limit` "people you may know" of the user.
+
+    The ranking is cached for `TIMEOUT` seconds. It is not invalidated
+    by follows, a new friend of a friend shows up after the timeout.
+    """
+    options = get_suggestion_settings()
+    cache = caches[options['CACHE_ALIAS']]
+    key = f'friend-suggestions:{user_id}'
+    suggestions = cache.get(key)
+    if suggestions is None:
+        suggestions = rank_friends_of_friends(
+            user_id, options['MAX_FRIENDS'], options['MAX_FRIEND_FRIENDS'],
+            options['MAX_SUGGESTIONS'],
+        )
+        cache.set(key, suggestions, options['TIMEOUT'])
+    return suggestions[:limit]
@@ -0,0 +1,107 @@
+import random
+from itertools import accumulate
+from typing import List, NamedTuple
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX
+from django.db import transaction
+
+from users.models import Follow
+from users.services import (clear_follow_caches, rebuild_friendships,
+                            rebuild_user_counters)
+
+User = get_user_model()
+
+GRAPH_DISTRIBUTIONS = ('uniform', 'power_law')
+
+
+class SyntheticGraph(NamedTuple):
+    user_ids: List[int]
+    edges: int
+
+
+def generate_follow_graph(users: int, avg_degree: float,
+                          distribution: str = 'uniform',
+                          power_law_exponent: float = 1.0,
+                          reciprocity: float = 0.0,
+                          seed: int = 0,
+                          username_prefix: str = 'synthetic',
+                          batch_size: int = 5000) -> SyntheticGraph:
+    '''
+    Create `users` users and about `users * avg_degree` follows.
+
+    `uniform` picks every followed user with the same probability.
+    `power_law` picks the user of popularity rank `r` with probability
+    proportional to `r ** -power_law_exponent`, so a few celebrity
+    users get most of the followers.
+
+    Every follow is followed back with probability `reciprocity`, which
+    sets the share of friends among the relations: random picks almost
+    never meet, so without it the graph has next to no friendships.
+
+    Follows are written with `bulk_create`, then the friendships and
+    counters are rebuilt in bulk.
+    '''
+    if distribution not in GRAPH_DISTRIBUTIONS:
+        raise ValueError(f'Unknown graph distribution: {distribution}')
+    if not 0 <= reciprocity <= 1:
+        raise ValueError(f'Reciprocity must be between 0 and 1: '
+                         f'{reciprocity}')
+    rng = random.Random(seed)
+    with transaction.atomic():
+        created_users = User.objects.bulk_create(
+            (User(username=f'{username_prefix}{index}',
+                  password=UNUSABLE_PASSWORD_PREFIX)
+             for index in range(users)),
+            batch_size=batch_size,
+        )
+        user_ids = _get_user_ids(created_users, username_prefix)
+        weights = None
+        if distribution == 'power_law':
+            popularity = user_ids[:]
+            rng.shuffle(popularity)
+            weights = list(accumulate(
+                (rank + 1) ** -power_law_exponent
+                for rank in range(len(popularity))
+            ))
+        else:
+            popularity = user_ids
+
+        follows_before = Follow.objects.count()
+        batch = []
+        for user_id in user_ids:
+            degree = min(round(rng.expovariate(1 / avg_degree)),
+                         len(user_ids) - 1) if avg_degree else 0
+            following_ids = set(
+                rng.choices(popularity, cum_weights=weights, k=degree)
+            )
+            following_ids.discard(user_id)
+            batch.extend(Follow(user_id=user_id, following_id=following_id)
+                         for following_id in following_ids)
+            if reciprocity:
+                batch.extend(
+                    Follow(user_id=following_id, following_id=user_id)
+                    for following_id in sorted(following_ids)
+                    if rng.random() < reciprocity
+                )
+            if len(batch) >= batch_size:
+                # A follow back may meet a follow picked on its own.
+                Follow.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        Follow.objects.bulk_create(batch, ignore_conflicts=True)
+        edges = Follow.objects.count() - follows_before
+
+        rebuild_friendships(batch_size=batch_size)
+        rebuild_user_counters(batch_size=batch_size)
+    clear_follow_caches()
+    return SyntheticGraph(user_ids, edges)
+
+
+def _get_user_ids(created_users: List[User],
+                  username_prefix: str) -> List[int]:
+    if all(user.pk is not None for user in created_users):
+        return [user.pk for user in created_users]
+    # Backends without RETURNING leave the primary keys unset.
+    return list(User.objects.filter(
+        username__startswith=username_prefix
+    ).order_by('id').values_list('id', flat=True))
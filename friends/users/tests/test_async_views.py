@@ -0,0 +1,176 @@
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.test import AsyncClient, TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.test import APIClient
+
+from friends.asgi import AsyncURLConfASGIHandler
+from users.async_views import AsyncSubscribersView
+from users.models import Follow
+
+User = get_user_model()
+
+
+@override_settings(ROOT_URLCONF='friends.asgi_urls')
+class AsyncViewsTestCase(TestCase):
+    '''
+    Model:
+    user1 <-> user2     user1 and user2 friends
+    user1 <- user3      user3 subscriber of user1
+    user4 <- user1      user1 subscribed to user4
+    '''
+
+    def setUp(self):
+        self.user1 = User.objects.create(username='user1')
+        self.user2 = User.objects.create(username='user2')
+        self.user3 = User.objects.create(username='user3')
+        self.user4 = User.objects.create(username='user4')
+        Follow.objects.create(user=self.user1, following=self.user2)
+        Follow.objects.create(user=self.user2, following=self.user1)
+        Follow.objects.create(user=self.user3, following=self.user1)
+        Follow.objects.create(user=self.user1, following=self.user4)
+        token = Token.objects.create(user=self.user2)
+        self.headers = {'Authorization': f'Token {token.key}'}
+        self.async_client = AsyncClient()
+        self.sync_client = APIClient(
+            HTTP_AUTHORIZATION=f'Token {token.key}'
+        )
+
+    def get_urls(self):
+        user_ids = (self.user1.id, self.user4.id + 1)
+        for user_id in user_ids:
+            yield reverse('users-detail', args=(user_id,))
+            for name in ('subscribers-list', 'subscriptions-list',
+                         'friends-list'):
+                yield reverse(name, args=(user_id,))
+        yield reverse('users-list')
+
+    async def test_same_responses_as_sync_views(self):
+        for url in self.get_urls():
+            with self.subTest(url=url):
+                sync_response = await self.get_sync_response(url)
+                response = await self.async_client.get(
+                    url, headers=self.headers
+                )
+                self.assertEqual(response.status_code,
+                                 sync_response.status_code)
+                self.assertEqual(response.content, sync_response.content)
+
+    async def test_pages(self):
+        url = reverse('users-list')
+        with mock.patch.object(PageNumberPagination, 'page_size', 3):
+            for query in ('', '?page=2', '?page=last', '?page=3'):
+                with self.subTest(query=query):
+                    sync_response = await self.get_sync_response(url + query)
+                    response = await self.async_client.get(
+                        url + query, headers=self.headers
+                    )
+                    self.assertEqual(response.status_code,
+                                     sync_response.status_code)
+                    self.assertEqual(response.content, sync_response.content)
+
+    @override_settings(FOLLOW_GRAPH={'MAX_AGE': 60})
+    async def test_lists_skip_follow_graph(self):
+        urls = [reverse(name, args=(self.user1.id,))
+                for name in ('subscribers-list', 'subscriptions-list',
+                             'friends-list')]
+        # Read before the sync views load the graph, loading it in the
+        # event loop would fail.
+        responses = [await self.async_client.get(url, headers=self.headers)
+                     for url in urls]
+        for url, response in zip(urls, responses):
+            with self.subTest(url=url):
+                sync_response = await self.get_sync_response(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(response.content, sync_response.content)
+
+    async def test_authentication(self):
+        url = reverse('friends-list', args=(self.user1.id,))
+        response = await AsyncClient().get(url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response['WWW-Authenticate'], 'Token')
+        response = await AsyncClient().get(
+            url, headers={'Authorization': 'Token invalid'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response.json(), {'detail': 'Invalid token.'})
+
+        response = await AsyncClient().get(reverse('users-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            {user['friendship_status'] for user in response.json()['results']},
+            {'нет ничего'}
+        )
+
+    async def test_other_methods_use_sync_views(self):
+        url = reverse('users-subscribe', args=(self.user3.id,))
+        response = await self.async_client.post(url, headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = await self.async_client.get(
+            reverse('users-list') + '?pagination=cursor', headers=self.headers
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('next', response.json())
+        self.assertNotIn('count', response.json())
+
+    async def test_conditional_requests(self):
+        for name in ('subscribers-list', 'subscriptions-list',
+                     'friends-list'):
+            url = reverse(name, args=(self.user1.id,))
+            with self.subTest(url=url):
+                sync_response = await self.get_sync_response(url)
+                response = await self.async_client.get(
+                    url, headers=self.headers
+                )
+                self.assertEqual(response['ETag'], sync_response['ETag'])
+                self.assertEqual(response['Last-Modified'],
+                                 sync_response['Last-Modified'])
+                self.assertIn('private', response['Cache-Control'])
+
+                patcher = mock.patch('users.async_views.SubscriptionQuerySet')
+                with patcher as relations:
+                    response = await self.async_client.get(
+                        url, headers={**self.headers,
+                                      'If-None-Match': response['ETag']}
+                    )
+                self.assertEqual(response.status_code,
+                                 status.HTTP_304_NOT_MODIFIED)
+                relations.assert_not_called()
+                self.assertEqual(response['ETag'], sync_response['ETag'])
+                self.assertEqual(response.content, b'')
+
+        await Follow.objects.acreate(user=self.user2, following=self.user3)
+        response = await self.async_client.get(
+            url, headers={**self.headers,
+                          'If-None-Match': sync_response['ETag']}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], sync_response['ETag'])
+
+    async def get_sync_response(self, url):
+        with override_settings(ROOT_URLCONF='friends.urls'):
+            return await sync_to_async(self.sync_client.get)(url)
+
+
+class AsyncUserRelationsViewTestCase(TestCase):
+    def test_stamps_per_view(self):
+        view, other_view = AsyncSubscribersView(), AsyncSubscribersView()
+        view.stamps[1] = None
+        self.assertEqual(other_view.stamps, {})
+
+
+class AsyncURLConfASGIHandlerTestCase(TestCase):
+    def test_request_urlconf(self):
+        request, _ = AsyncURLConfASGIHandler().create_request({
+            'type': 'http',
+            'method': 'GET',
+            'path': '/api/users/',
+            'query_string': b'',
+            'headers': [],
+        }, None)
+        self.assertEqual(request.urlconf, 'friends.asgi_urls')
@@ -0,0 +1,78 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from users.async_views import authenticate
+from users.authentication import get_token_cache
+
+User = get_user_model()
+
+
+class CachedTokenAuthenticationTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='user1')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.url = reverse('users-detail', args=(self.user.id,))
+
+    def tearDown(self):
+        caches['tokens'].clear()
+
+    def test_token_is_cached(self):
+        with self.assertNumQueries(2):
+            # token and user, then the user page
+            self.client.get(self.url)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['username'], 'user1')
+
+    def test_logout_invalidates_token(self):
+        self.client.get(self.url)
+        response = self.client.post(reverse('logout'))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_saved_user_is_invalidated(self):
+        self.client.get(self.url)
+        self.user.username = 'renamed'
+        self.user.save()
+        self.assertIsNone(get_token_cache().get(self.token.key))
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['username'], 'renamed')
+
+    def test_inactive_user_is_rejected(self):
+        self.client.get(self.url)
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIsNone(get_token_cache().get(self.token.key))
+
+    def test_deleted_user_is_invalidated(self):
+        self.client.get(self.url)
+        self.user.delete()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(TOKEN_CACHE=None)
+    def test_cache_disabled(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    async def test_async_authenticate_uses_cache(self):
+        request = AsyncRequestFactory().get(
+            self.url, headers={'Authorization': f'Token {self.token.key}'}
+        )
+        user = await authenticate(request)
+        self.assertEqual(user.id, self.user.id)
+        cached = await get_token_cache().aget(self.token.key)
+        self.assertEqual(cached.user_id, self.user.id)
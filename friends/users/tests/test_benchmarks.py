@@ -0,0 +1,195 @@
+import os
+import random
+import sqlite3
+import tempfile
+from io import StringIO
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F, Sum
+from django.test import TestCase, TransactionTestCase
+
+from users.benchmarks.api import api_benchmark, parse_mix
+from users.benchmarks.base import percentile
+from users.benchmarks.changes import follow_changes_benchmark
+from users.benchmarks.queries import queries_benchmark
+from users.benchmarks.server import copy_database
+from users.benchmarks.writes import get_worker_counts, sample_new_follows
+from users.management.commands.explain_follow_queries import find_table_scans
+from users.models import Follow, Friendship, UserCounters
+from users.services import SubscriptionQuerySet
+from users.synthetic import generate_follow_graph
+
+User = get_user_model()
+
+BENCHMARK_OPTIONS = {
+    'users': 30,
+    'degree': 5,
+    'graph': 'power_law',
+    'requests': 40,
+    'clients': 3,
+    'mix': 'users-list=1,subscribers-list=1,friends-list=1,users-subscribe=1',
+    'repeat': 3,
+    'seed': 0,
+}
+
+
+class SyntheticGraphTestCase(TestCase):
+    def test_generate_uniform_graph(self):
+        graph = generate_follow_graph(50, 4, 'uniform', seed=1)
+        self.assertEqual(len(graph.user_ids), 50)
+        self.assertEqual(Follow.objects.count(), graph.edges)
+        self.assertFalse(Follow.objects.filter(
+            user=F('following')
+        ).exists())
+
+    def test_generate_power_law_graph_keeps_relations_in_sync(self):
+        graph = generate_follow_graph(50, 4, 'power_law', seed=1)
+        user = User.objects.get(id=graph.user_ids[0])
+        friends = SubscriptionQuerySet(user).get_user_friends()
+        self.assertEqual(
+            Friendship.objects.filter(user=user).count(), friends.count()
+        )
+        followers = Follow.objects.filter(following=user).count()
+        counters = UserCounters.objects.filter(user=user).first()
+        if counters is not None:
+            self.assertEqual(
+                counters.subscribers_count + counters.friends_count,
+                followers
+            )
+
+    def test_same_seed_same_graph(self):
+        generate_follow_graph(20, 3, 'power_law', seed=7,
+                              username_prefix='first')
+        generate_follow_graph(20, 3, 'power_law', seed=7,
+                              username_prefix='second')
+        first = Follow.objects.filter(user__username__startswith='first')
+        second = Follow.objects.filter(user__username__startswith='second')
+        self.assertEqual(first.count(), second.count())
+
+    def test_reciprocity(self):
+        graph = generate_follow_graph(40, 4, 'uniform', reciprocity=1,
+                                      seed=1)
+        self.assertEqual(Follow.objects.count(), graph.edges)
+        self.assertEqual(Friendship.objects.count(), graph.edges)
+        counters = UserCounters.objects.aggregate(
+            subscribers=Sum('subscribers_count'),
+            subscriptions=Sum('subscriptions_count'),
+        )
+        self.assertEqual(counters, {'subscribers': 0, 'subscriptions': 0})
+
+    def test_partial_reciprocity(self):
+        graph = generate_follow_graph(60, 5, 'uniform', reciprocity=0.5,
+                                      seed=1)
+        friendships = Friendship.objects.count()
+        self.assertGreater(friendships, graph.edges // 4)
+        self.assertLess(friendships, graph.edges)
+
+    def test_invalid_reciprocity(self):
+        with self.assertRaises(ValueError):
+            generate_follow_graph(10, 2, reciprocity=2)
+
+
+class BenchmarkTestCase(TestCase):
+    def test_percentile(self):
+        values = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
+        self.assertEqual(percentile(values, 50), 5)
+        self.assertEqual(percentile(values, 95), 10)
+        self.assertEqual(percentile([], 50), 0)
+
+    def test_parse_mix(self):
+        self.assertEqual(parse_mix('users-list=2,friends-list'),
+                         {'users-list': 2, 'friends-list': 1})
+
+    def test_api_benchmark(self):
+        results = api_benchmark(BENCHMARK_OPTIONS)
+        self.assertEqual(results['total']['count'], 40)
+        for endpoint in results['endpoints'].values():
+            self.assertGreater(endpoint['queries_per_request'], 0)
+            self.assertIn('p99_ms', endpoint)
+
+    def test_queries_benchmark(self):
+        results = queries_benchmark(BENCHMARK_OPTIONS)
+        self.assertEqual(results['friends']['count'], 3)
+        self.assertEqual(results['is_follower']['queries_per_call'], 1)
+
+    def test_follow_changes_benchmark(self):
+        results = follow_changes_benchmark(BENCHMARK_OPTIONS)
+        self.assertGreater(results['full_listing']['items'], 0)
+        self.assertEqual(results['changes_10']['items'], 10)
+        self.assertEqual(results['changes_10']['requests'], 1)
+        self.assertNotIn('changes_100', results)
+        self.assertEqual(
+            results['write_with_events']['queries_per_call'],
+            results['write_without_events']['queries_per_call'] + 4,
+        )
+
+    def test_get_worker_counts(self):
+        self.assertEqual(get_worker_counts(1), [1])
+        self.assertEqual(get_worker_counts(8), [1, 2, 4, 8])
+        self.assertEqual(get_worker_counts(20), [1, 2, 4, 8, 16, 20])
+
+    def test_sample_new_follows(self):
+        graph = generate_follow_graph(20, 3, 'uniform', seed=0)
+        pairs = sample_new_follows(graph.user_ids, 30, random.Random(0))
+        self.assertEqual(len(set(pairs)), 30)
+        for user_id, following_id in pairs:
+            self.assertNotEqual(user_id, following_id)
+            self.assertFalse(Follow.objects.filter(
+                user=user_id, following=following_id
+            ).exists())
+
+
+class ServerBenchmarkTestCase(TransactionTestCase):
+    def test_copy_database(self):
+        generate_follow_graph(10, 2, 'uniform', seed=0)
+        with tempfile.TemporaryDirectory() as directory:
+            name = copy_database(directory)
+            if connection.vendor != 'sqlite':
+                self.assertEqual(name, connection.settings_dict['NAME'])
+                return
+            self.assertEqual(name, os.path.join(directory, 'db.sqlite3'))
+            copy = sqlite3.connect(name)
+            try:
+                (users,), = copy.execute('SELECT COUNT(*) FROM auth_user')
+            finally:
+                copy.close()
+        self.assertEqual(users, User.objects.count())
+
+
+class ExplainFollowQueriesTestCase(TestCase):
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite plans')
+    def test_find_table_scans(self):
+        sql = (
+            'SELECT "auth_user"."id" FROM "auth_user" WHERE "auth_user"."id" '
+            'IN (SELECT U0."user_id" FROM "users_follow" U0 '
+            'WHERE U0."following_id" = %s)'
+        )
+        self.assertEqual(
+            find_table_scans(sql, '2 0 0 SCAN auth_user\n5 2 0 SCAN U0'),
+            {'users_follow'}
+        )
+        self.assertEqual(find_table_scans(
+            sql, '5 0 0 SEARCH U0 USING COVERING INDEX '
+                 'follow_following_user_idx (following_id=?)'
+        ), set())
+
+    @skipUnless(connection.vendor == 'postgresql', 'PostgreSQL plans')
+    def test_find_table_scans_postgresql(self):
+        self.assertEqual(find_table_scans('', (
+            'Hash Join\n'
+            '  ->  Seq Scan on auth_user\n'
+            '  ->  Seq Scan on users_follow u0'
+        )), {'users_follow'})
+        self.assertEqual(find_table_scans('', (
+            'Index Only Scan using follow_following_user_idx on users_follow'
+        )), set())
+
+    def test_no_table_scans(self):
+        generate_follow_graph(30, 5, 'power_law')
+        output = StringIO()
+        call_command('explain_follow_queries', '--check', stdout=output)
+        self.assertIn('No follow-graph query scans a whole table.',
+                      output.getvalue())
@@ -0,0 +1,236 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APIRequestFactory
+
+from users.cache import (DjangoRelationshipCache, LocMemRelationshipCache,
+                         Relationships, get_relationship_cache)
+from users.models import Follow
+from users.services import BulkSubscriptionCreateDelete, get_relationships
+
+User = get_user_model()
+
+LOCMEM_RELATIONSHIP_CACHE = {
+    'BACKEND': 'users.cache.LocMemRelationshipCache',
+    'OPTIONS': {'MAX_ENTRIES': 100, 'MAX_IDS': 1000},
+}
+
+
+def relationships(followers=(), following=()):
+    return Relationships(frozenset(followers), frozenset(following))
+
+
+class LocMemRelationshipCacheTestCase(TestCase):
+    def test_lru_eviction(self):
+        cache = LocMemRelationshipCache(MAX_ENTRIES=2)
+        cache.set(1, relationships({2}))
+        cache.set(2, relationships({3}))
+        cache.get(1)
+        cache.set(3, relationships({4}))
+        self.assertIsNotNone(cache.get(1))
+        self.assertIsNone(cache.get(2))
+        self.assertIsNotNone(cache.get(3))
+
+    def test_memory_bound(self):
+        cache = LocMemRelationshipCache(MAX_IDS=4)
+        cache.set(1, relationships({2, 3}, {4}))
+        cache.set(2, relationships({1}, {3}))
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.get(2), relationships({1}, {3}))
+        cache.set(3, relationships(range(10)))
+        self.assertIsNone(cache.get(3))
+        self.assertEqual(len(cache), 1)
+
+    def test_timeout(self):
+        cache = LocMemRelationshipCache(TIMEOUT=60)
+        with mock.patch('users.cache.time.monotonic', return_value=100):
+            cache.set(1, relationships({2}))
+        with mock.patch('users.cache.time.monotonic', return_value=159):
+            self.assertEqual(cache.get(1), relationships({2}))
+        with mock.patch('users.cache.time.monotonic', return_value=160):
+            self.assertIsNone(cache.get(1))
+        self.assertEqual(len(cache), 0)
+
+    def test_no_timeout(self):
+        cache = LocMemRelationshipCache(TIMEOUT=None)
+        cache.set(1, relationships({2}))
+        with mock.patch('users.cache.time.monotonic', return_value=10 ** 9):
+            self.assertEqual(cache.get(1), relationships({2}))
+
+    def test_invalidate(self):
+        cache = LocMemRelationshipCache()
+        cache.set(1, relationships({2}))
+        cache.set(2, relationships(following={1}))
+        cache.invalidate([1, 3])
+        self.assertIsNone(cache.get(1))
+        self.assertIsNotNone(cache.get(2))
+
+
+class DjangoRelationshipCacheTestCase(TestCase):
+    def test_get_set_invalidate(self):
+        cache = DjangoRelationshipCache(KEY_PREFIX='test-relationships')
+        cache.set(1, relationships({2}, {3}))
+        self.assertEqual(cache.get(1), relationships({2}, {3}))
+        cache.invalidate([1])
+        self.assertIsNone(cache.get(1))
+
+
+@override_settings(RELATIONSHIP_CACHE=LOCMEM_RELATIONSHIP_CACHE)
+class RelationshipCacheInvalidationTestCase(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create(username='user1')
+        self.user2 = User.objects.create(username='user2')
+        self.user3 = User.objects.create(username='user3')
+
+    def tearDown(self):
+        get_relationship_cache().clear()
+
+    def test_get_relationships_caches_entry(self):
+        Follow.objects.create(user=self.user2, following=self.user1)
+        Follow.objects.create(user=self.user1, following=self.user3)
+        with self.assertNumQueries(2):
+            # counters of the user and its follows
+            get_relationships(self.user1.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_relationships(self.user1.id),
+                             relationships({self.user2.id}, {self.user3.id}))
+
+    @override_settings(RELATIONSHIP_CACHE={
+        **LOCMEM_RELATIONSHIP_CACHE, 'OPTIONS': {'MAX_IDS': 2},
+    })
+    def test_oversized_user_not_loaded(self):
+        Follow.objects.create(user=self.user2, following=self.user1)
+        Follow.objects.create(user=self.user1, following=self.user3)
+        Follow.objects.create(user=self.user3, following=self.user1)
+        for _ in range(2):
+            with self.assertNumQueries(1):
+                self.assertIsNone(get_relationships(self.user1.id))
+        self.assertEqual(get_relationships(self.user2.id),
+                         relationships(following={self.user1.id}))
+
+    def test_signals_invalidate(self):
+        get_relationships(self.user1.id)
+        follow = Follow.objects.create(user=self.user2, following=self.user1)
+        self.assertEqual(get_relationships(self.user1.id).followers,
+                         {self.user2.id})
+        follow.delete()
+        self.assertEqual(get_relationships(self.user1.id).followers,
+                         frozenset())
+
+    def test_bulk_subscribe_invalidates(self):
+        get_relationships(self.user2.id)
+        request = APIRequestFactory().post('/bulk-subscribe/')
+        request.user = self.user1
+        BulkSubscriptionCreateDelete(
+            request, User.objects.all(), [self.user2.id]
+        ).create_subscribes()
+        self.assertEqual(get_relationships(self.user2.id).followers,
+                         {self.user1.id})
+        BulkSubscriptionCreateDelete(
+            request, User.objects.all(), [self.user2.id]
+        ).delete_subscribes()
+        self.assertEqual(get_relationships(self.user2.id).followers,
+                         frozenset())
+
+
+@override_settings(RELATIONSHIP_CACHE=LOCMEM_RELATIONSHIP_CACHE)
+class RelationshipCacheViewsTestCase(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create(username='user1')
+        self.user2 = User.objects.create(username='user2')
+        self.user3 = User.objects.create(username='user3')
+        Follow.objects.create(user=self.user1, following=self.user2)
+        Follow.objects.create(user=self.user2, following=self.user1)
+        Follow.objects.create(user=self.user3, following=self.user1)
+
+        self.client = APIClient()
+        token = Token.objects.create(user=self.user1)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def tearDown(self):
+        get_relationship_cache().clear()
+
+    def test_list_users_from_cache(self):
+        url = reverse('users-list')
+        self.client.get(url)
+        with self.assertNumQueries(2):
+            # count and page without annotations, the token is cached
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [user['friendship_status'] for user in response.data['results']],
+            ['нет ничего', 'уже друзья', 'есть входящая заявка']
+        )
+
+    def test_relationship_lists_from_cache(self):
+        # Caches the token.
+        self.client.get(reverse('users-list'))
+        # stamps, count and page, the ids come from the cache; an empty
+        # id list needs no queries
+        for basename, usernames, queries in (
+                ('subscribers', ['user3'], 3),
+                ('subscriptions', [], 1),
+                ('friends', ['user2'], 3)):
+            get_relationships(self.user1.id)
+            url = reverse(f'{basename}-list', args=(self.user1.id,))
+            with self.assertNumQueries(queries):
+                response = self.client.get(url)
+            self.assertEqual(
+                [user['username'] for user in response.data['results']],
+                usernames
+            )
+
+    @override_settings(RELATIONSHIP_CACHE={
+        **LOCMEM_RELATIONSHIP_CACHE, 'OPTIONS': {'MAX_IDS': 2},
+    })
+    def test_oversized_user_annotated(self):
+        response = self.client.get(reverse('users-list'))
+        self.assertEqual(
+            [user['friendship_status'] for user in response.data['results']],
+            ['нет ничего', 'уже друзья', 'есть входящая заявка']
+        )
+        response = self.client.get(
+            reverse('subscribers-list', args=(self.user1.id,))
+        )
+        self.assertEqual(
+            [user['username'] for user in response.data['results']],
+            ['user3']
+        )
+
+    def test_relationships_read_once(self):
+        relationships = get_relationships(self.user1.id)
+        # A second read would find the entry evicted.
+        with mock.patch('users.views.get_relationships',
+                        side_effect=[relationships, None]) as read:
+            response = self.client.get(reverse('users-list'))
+        self.assertEqual(read.call_count, 1)
+        self.assertEqual(
+            [user['friendship_status'] for user in response.data['results']],
+            ['нет ничего', 'уже друзья', 'есть входящая заявка']
+        )
+
+    def test_recent_change_not_validated(self):
+        url = reverse('subscribers-list', args=(self.user1.id,))
+        # Other processes may cache the lists for TIMEOUT after a change.
+        self.assertNotIn('ETag', self.client.get(url))
+        with override_settings(RELATIONSHIP_CACHE={
+            **LOCMEM_RELATIONSHIP_CACHE,
+            'OPTIONS': {**LOCMEM_RELATIONSHIP_CACHE['OPTIONS'],
+                        'TIMEOUT': None},
+        }):
+            self.assertIn('ETag', self.client.get(url))
+
+    def test_subscribers_after_unsubscribe(self):
+        url = reverse('subscribers-list', args=(self.user1.id,))
+        response = self.client.get(url)
+        self.assertEqual(len(response.data['results']), 1)
+        self.client.delete(reverse('users-subscribe', args=(self.user2.id,)))
+        response = self.client.get(url)
+        self.assertEqual(
+            [user['friendship_status'] for user in response.data['results']],
+            ['есть входящая заявка', 'есть входящая заявка']
+        )
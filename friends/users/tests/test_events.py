@@ -0,0 +1,227 @@
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITestCase
+
+from users.events import (StaleCursorError, compact_follow_events, get_changes,
+                          get_current_cursor)
+from users.models import Follow, FollowEvent
+from users.services import rebuild_user_counters
+
+User = get_user_model()
+
+
+class FollowEventsTestCase(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create(username='user1')
+        self.user2 = User.objects.create(username='user2')
+        self.user3 = User.objects.create(username='user3')
+
+    def get_events(self, events):
+        return [(event.user_id, event.following_id, event.created)
+                for event in events]
+
+    def test_events_recorded(self):
+        Follow.objects.create(user=self.user1, following=self.user2)
+        Follow.objects.create(user=self.user3, following=self.user2)
+        Follow.objects.filter(user=self.user1).delete()
+        events = FollowEvent.objects.order_by('id')
+        self.assertEqual(
+            self.get_events(events),
+            [(self.user1.id, self.user2.id, True),
+             (self.user3.id, self.user2.id, True),
+             (self.user1.id, self.user2.id, False)],
+        )
+        self.assertEqual(
+            [(event.user_position, event.following_position)
+             for event in events],
+            [(1, 1), (1, 2), (2, 3)],
+        )
+        self.assertEqual(get_current_cursor(self.user2.id), 3)
+
+    @override_settings(FOLLOW_EVENTS={'ENABLED': False})
+    def test_events_disabled(self):
+        Follow.objects.create(user=self.user1, following=self.user2)
+        self.assertFalse(FollowEvent.objects.exists())
+        with self.assertRaises(StaleCursorError):
+            get_changes(self.user1.id, 0, 10)
+
+    def test_deleted_user_events_kept(self):
+        Follow.objects.create(user=self.user1, following=self.user2)
+        Follow.objects.create(user=self.user3, following=self.user1)
+        user_id = self.user1.id
+        self.user1.delete()
+        page = get_changes(self.user2.id, 0, 10)
+        self.assertEqual(
+            self.get_events(page.events),
+            [(user_id, self.user2.id, True), (user_id, self.user2.id, False)],
+        )
+
+    def test_changes_pages(self):
+        Follow.objects.create(user=self.user1, following=self.user2)
+        Follow.objects.create(user=self.user3, following=self.user1)
+        Follow.objects.create(user=self.user2, following=self.user3)
+        Follow.objects.filter(user=self.user1).delete()
+
+        page = get_changes(self.user1.id, 0, 2)
+        self.assertTrue(page.has_more)
+        self.assertEqual(
+            self.get_events(page.events),
+            [(self.user1.id, self.user2.id, True),
+             (self.user3.id, self.user1.id, True)],
+        )
+        self.assertEqual([event.position for event in page.events], [1, 2])
+        self.assertEqual(page.cursor, 2)
+        page = get_changes(self.user1.id, page.cursor, 2)
+        self.assertFalse(page.has_more)
+        self.assertEqual(self.get_events(page.events),
+                         [(self.user1.id, self.user2.id, False)])
+        self.assertEqual(page.cursor, get_current_cursor(self.user1.id))
+        self.assertEqual(get_changes(self.user1.id, page.cursor, 2),
+                         ([], page.cursor, False))
+
+    def test_quiet_user(self):
+        Follow.objects.create(user=self.user1, following=self.user2)
+        self.assertEqual(get_current_cursor(self.user3.id), 0)
+        self.assertEqual(get_changes(self.user3.id, 0, 10), ([], 0, False))
+
+    def test_unknown_cursor_stale(self):
+        Follow.objects.create(user=self.user1, following=self.user2)
+        with self.assertRaises(StaleCursorError):
+            get_changes(self.user1.id, 2, 10)
+
+    def test_rebuild_makes_cursors_stale(self):
+        Follow.objects.create(user=self.user1, following=self.user2)
+        cursor = get_current_cursor(self.user2.id)
+        Follow.objects.bulk_create([Follow(user=self.user3,
+                                           following=self.user2)])
+        rebuild_user_counters()
+        self.assertEqual(get_current_cursor(self.user2.id), cursor + 1)
+        with self.assertRaises(StaleCursorError):
+            get_changes(self.user2.id, cursor, 10)
+        # The feed goes on from the cursor after the rebuild.
+        Follow.objects.create(user=self.user1, following=self.user3)
+        self.assertEqual(get_changes(self.user3.id, 1, 10).cursor, 2)
+
+    def test_compaction(self):
+        Follow.objects.create(user=self.user1, following=self.user2)
+        Follow.objects.create(user=self.user2, following=self.user1)
+        first, second = FollowEvent.objects.order_by('id')
+        FollowEvent.objects.filter(id=first.id).update(
+            created_at=timezone.now() - timedelta(days=40)
+        )
+
+        output = StringIO()
+        call_command('compact_follow_events', stdout=output)
+        self.assertIn('Deleted 1 follow events', output.getvalue())
+        self.assertEqual(list(FollowEvent.objects.all()), [second])
+        self.assertEqual(compact_follow_events(timezone.now()), 1)
+        self.assertEqual(compact_follow_events(timezone.now()), 0)
+
+        with self.assertRaises(StaleCursorError):
+            get_changes(self.user1.id, 0, 10)
+        # A cursor past the compacted events is still valid.
+        self.assertEqual(get_changes(self.user1.id, 2, 10).events, [])
+
+
+@skipUnless(connection.vendor == 'postgresql', 'PostgreSQL only')
+class InterleavedTransactionsTestCase(TransactionTestCase):
+    def test_later_commit_not_skipped(self):
+        user1, user2, user3, user4 = (
+            User.objects.create(username=f'user{number}')
+            for number in range(1, 5)
+        )
+        Follow.objects.create(user=user3, following=user2)
+        cursor = get_current_cursor(user2.id)
+        followed, release = threading.Event(), threading.Event()
+
+        def follow():
+            try:
+                with transaction.atomic():
+                    Follow.objects.create(user=user1, following=user2)
+                    followed.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=follow)
+        thread.start()
+        try:
+            self.assertTrue(followed.wait(10))
+            # Commits an event with a larger id before the first one.
+            Follow.objects.create(user=user3, following=user4)
+            page = get_changes(user2.id, cursor, 10)
+            self.assertEqual(page, ([], cursor, False))
+        finally:
+            release.set()
+            thread.join()
+        page = get_changes(user2.id, page.cursor, 10)
+        self.assertEqual(
+            [(event.user_id, event.following_id) for event in page.events],
+            [(user1.id, user2.id)],
+        )
+        self.assertLess(page.events[0].id, FollowEvent.objects.get(
+            user=user3, following=user4
+        ).id)
+
+
+class ChangesViewTestCase(APITestCase):
+    def setUp(self):
+        self.user1 = User.objects.create(username='user1')
+        self.user2 = User.objects.create(username='user2')
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user1)}'
+        )
+        self.url = reverse('users-changes', args=(self.user1.id,))
+
+    def test_changes(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data,
+                         {'cursor': 0, 'has_more': False, 'results': []})
+
+        self.client.post(reverse('users-subscribe', args=(self.user2.id,)))
+        self.client.delete(reverse('users-subscribe', args=(self.user2.id,)))
+        response = self.client.get(self.url, {'since': 0, 'limit': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['has_more'])
+        event = response.data['results'][0]
+        self.assertEqual(
+            (event['position'], event['type'], event['user'],
+             event['following']),
+            (1, 'follow', self.user1.id, self.user2.id),
+        )
+        response = self.client.get(self.url,
+                                   {'since': response.data['cursor']})
+        self.assertFalse(response.data['has_more'])
+        self.assertEqual([event['type'] for event in response.data['results']],
+                         ['unfollow'])
+
+    def test_stale_cursor(self):
+        Follow.objects.create(user=self.user1, following=self.user2)
+        Follow.objects.create(user=self.user2, following=self.user1)
+        compact_follow_events(timezone.now())
+        response = self.client.get(self.url, {'since': 0})
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+        cursor = self.client.get(self.url).data['cursor']
+        response = self.client.get(self.url, {'since': cursor})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_validation(self):
+        response = self.client.get(self.url, {'since': 0, 'limit': 5000})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(
+            reverse('users-changes', args=(self.user2.id + 1,)), {'since': 0}
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,242 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from users.graph import (FollowGraph, FollowGraphIndex, difference_sorted,
+                         get_follow_graph_index, intersect_sorted)
+from users.models import Follow
+from users.services import (GraphEngine, SubscriptionQuerySet,
+                            get_relationships, get_subscription_query_engine)
+from users.suggestions import get_mutual_friends
+
+User = get_user_model()
+
+FOLLOW_GRAPH = {'MAX_AGE': None}
+
+
+class SortedIdsTestCase(TestCase):
+    def test_intersect_sorted(self):
+        self.assertEqual(intersect_sorted([1, 3, 5, 7], [2, 3, 4, 7]),
+                         [3, 7])
+        self.assertEqual(intersect_sorted([], [1]), [])
+
+    def test_intersect_sorted_skewed(self):
+        self.assertEqual(intersect_sorted(range(0, 1000, 2), [3, 4, 998]),
+                         [4, 998])
+
+    def test_difference_sorted(self):
+        self.assertEqual(difference_sorted([1, 3, 5, 7], [2, 3, 7, 9]),
+                         [1, 5])
+
+
+class FollowGraphTestCase(TestCase):
+    def setUp(self):
+        # 1 and 2 are friends, 3 follows 1, 1 follows 4.
+        self.graph = FollowGraph.from_edges(
+            [(1, 2), (2, 1), (3, 1), (1, 4)], max_pending=100
+        )
+
+    def test_sets(self):
+        self.assertEqual(list(self.graph.following(1)), [2, 4])
+        self.assertEqual(list(self.graph.followers(1)), [2, 3])
+        self.assertEqual(self.graph.friends(1), [2])
+        self.assertEqual(self.graph.subscribers(1), [3])
+        self.assertEqual(self.graph.subscriptions(1), [4])
+        self.assertEqual(list(self.graph.following(100)), [])
+        self.assertEqual(len(self.graph), 4)
+
+    def test_is_follower_and_is_following(self):
+        self.assertTrue(self.graph.is_follower(1, 3))
+        self.assertFalse(self.graph.is_following(1, 3))
+        self.assertTrue(self.graph.is_following(1, 4))
+
+    def test_add_and_remove(self):
+        self.graph.add([(4, 1), (5, 1), (4, 1)])
+        self.graph.remove([(1, 2), (6, 1)])
+        self.assertEqual(self.graph.friends(1), [4])
+        self.assertEqual(self.graph.subscribers(1), [2, 3, 5])
+        self.assertEqual(len(self.graph), 5)
+
+    def test_compact(self):
+        self.graph.add([(3, 2), (7, 1)])
+        self.graph.remove([(2, 1)])
+        self.graph.compact()
+        self.assertEqual(list(self.graph.followers(1)), [3, 7])
+        self.assertEqual(list(self.graph.followers(2)), [1, 3])
+        self.assertEqual(list(self.graph.following(7)), [1])
+        self.assertEqual(len(self.graph), 5)
+
+    def test_compacted_when_pending_exceeded(self):
+        self.graph.max_pending = 2
+        self.graph.add([(5, 6), (6, 7)])
+        self.assertEqual(self.graph._following_overlay, {})
+        self.assertEqual(list(self.graph.following(6)), [7])
+
+    def test_mutual_friends(self):
+        self.graph.add([(3, 2), (2, 3), (1, 3)])
+        self.assertEqual(self.graph.mutual_friends(1, 2), [3])
+
+
+@override_settings(FOLLOW_GRAPH=FOLLOW_GRAPH)
+class FollowGraphIndexTestCase(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create(username='user1')
+        self.user2 = User.objects.create(username='user2')
+        self.user3 = User.objects.create(username='user3')
+        Follow.objects.create(user=self.user1, following=self.user2)
+        Follow.objects.create(user=self.user2, following=self.user1)
+        Follow.objects.create(user=self.user3, following=self.user1)
+        get_follow_graph_index().clear()
+
+    def tearDown(self):
+        get_follow_graph_index().clear()
+
+    def test_engine(self):
+        engine = get_subscription_query_engine()
+        self.assertIsInstance(engine, GraphEngine)
+        subscriptions = SubscriptionQuerySet(self.user1, engine)
+        self.assertQuerysetEqual(subscriptions.get_user_friends(),
+                                 [self.user2])
+        self.assertQuerysetEqual(subscriptions.get_user_subscribers(),
+                                 [self.user3])
+        self.assertFalse(subscriptions.get_user_subscriptions().exists())
+
+    @override_settings(FOLLOW_GRAPH={**FOLLOW_GRAPH, 'MAX_IDS': 0})
+    def test_falls_back_to_sql_for_large_sets(self):
+        subscribers = SubscriptionQuerySet(self.user1).get_user_subscribers()
+        self.assertIn('users_follow', str(subscribers.query))
+        self.assertQuerysetEqual(subscribers, [self.user3])
+
+    @override_settings(FOLLOW_GRAPH={**FOLLOW_GRAPH, 'MAX_IDS': 1})
+    def test_long_rows_not_merged(self):
+        get_follow_graph_index().graph
+        with mock.patch.object(FollowGraph, 'subscribers') as subscribers:
+            queryset = SubscriptionQuerySet(self.user1).get_user_subscribers()
+        subscribers.assert_not_called()
+        self.assertQuerysetEqual(queryset, [self.user3])
+
+    def test_relationships(self):
+        get_relationships(self.user1.id)
+        with self.assertNumQueries(0):
+            relationships = get_relationships(self.user1.id,
+                                              [self.user3.id])
+        self.assertEqual(relationships.followers, {self.user3.id})
+        self.assertEqual(relationships.following, frozenset())
+
+    def test_commits_are_applied(self):
+        graph = get_follow_graph_index().graph
+        with self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.create(user=self.user1, following=self.user3)
+        self.assertEqual(graph.friends(self.user1.id),
+                         [self.user2.id, self.user3.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.filter(user=self.user2).delete()
+        self.assertEqual(graph.friends(self.user1.id), [self.user3.id])
+
+    def test_rollback_is_not_applied(self):
+        graph = get_follow_graph_index().graph
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(ValueError):
+                with transaction.atomic():
+                    Follow.objects.create(user=self.user1,
+                                          following=self.user3)
+                    raise ValueError
+        self.assertFalse(graph.follows(self.user1.id, self.user3.id))
+
+    def test_mutual_friends(self):
+        Follow.objects.create(user=self.user3, following=self.user2)
+        Follow.objects.create(user=self.user2, following=self.user3)
+        get_follow_graph_index().clear()
+        self.assertQuerysetEqual(get_mutual_friends(self.user1, self.user3),
+                                 [self.user2])
+
+
+class FollowGraphReloadTestCase(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create(username='user1')
+        self.user2 = User.objects.create(username='user2')
+        self.user3 = User.objects.create(username='user3')
+        Follow.objects.create(user=self.user1, following=self.user2)
+        self.index = FollowGraphIndex(MAX_AGE=60)
+        self.graph = self.index.graph
+
+    def test_reload_in_background(self):
+        self.index._loaded_at -= 61
+        with mock.patch('users.graph.threading.Thread') as thread:
+            self.assertIs(self.index.graph, self.graph)
+            self.assertIs(self.index.graph, self.graph)
+        # One reload at a time.
+        thread.return_value.start.assert_called_once_with()
+        self.assertTrue(self.index._load_lock.locked())
+
+        load = FollowGraph.from_database
+
+        def from_database(**kwargs):
+            # Committed while the follows are read, after the snapshot.
+            self.index.apply([(self.user3.id, self.user1.id)], True)
+            return load(**kwargs)
+
+        with mock.patch.object(FollowGraph, 'from_database',
+                               from_database):
+            self.index._load()
+        self.index._load_lock.release()
+        graph = self.index.graph
+        self.assertIsNot(graph, self.graph)
+        self.assertEqual(list(graph.followers(self.user1.id)),
+                         [self.user3.id])
+        self.assertEqual(list(self.graph.followers(self.user1.id)),
+                         [self.user3.id])
+
+    def test_stale_graph_waited_for(self):
+        self.index._loaded_at -= 121
+        with mock.patch('users.graph.threading.Thread') as thread:
+            graph = self.index.graph
+        thread.assert_not_called()
+        self.assertIsNot(graph, self.graph)
+        self.assertIs(self.index.graph, graph)
+
+
+@override_settings(FOLLOW_GRAPH=FOLLOW_GRAPH)
+class FollowGraphViewsTestCase(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create(username='user1')
+        self.user2 = User.objects.create(username='user2')
+        self.user3 = User.objects.create(username='user3')
+        Follow.objects.create(user=self.user1, following=self.user2)
+        Follow.objects.create(user=self.user2, following=self.user1)
+        Follow.objects.create(user=self.user3, following=self.user1)
+        get_follow_graph_index().clear()
+
+        self.client = APIClient()
+        token = Token.objects.create(user=self.user1)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def tearDown(self):
+        get_follow_graph_index().clear()
+
+    def test_list_users(self):
+        url = reverse('users-list')
+        self.client.get(url)
+        with self.assertNumQueries(2):
+            # count and page without annotations, the token is cached
+            response = self.client.get(url)
+        self.assertEqual(
+            [user['friendship_status'] for user in response.data['results']],
+            ['нет ничего', 'уже друзья', 'есть входящая заявка']
+        )
+
+    def test_subscribers(self):
+        url = reverse('subscribers-list', args=(self.user1.id,))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [{
+            'id': self.user3.id,
+            'username': 'user3',
+            'friendship_status': 'есть входящая заявка',
+        }])
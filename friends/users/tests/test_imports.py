@@ -0,0 +1,177 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+
+from users.events import StaleCursorError, get_changes, get_current_cursor
+from users.imports import (EdgeFormatError, get_follow_indexes_present,
+                           import_edges, read_edges)
+from users.models import Follow, Friendship, UserCounters
+
+User = get_user_model()
+
+CSV_EDGES = (
+    'user,following\n'
+    'alice,bob\n'
+    'bob,alice\n'
+    'carol,carol\n'
+    'carol,alice\n'
+    'alice,bob\n'
+)
+
+
+class ImportFollowsMixin:
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as file:
+            file.write(content)
+        return path
+
+    def get_follows(self):
+        return set(Follow.objects.values_list('user__username',
+                                              'following__username'))
+
+
+class ReadEdgesTestCase(TestCase):
+    def test_csv(self):
+        self.assertEqual(list(read_edges(StringIO(CSV_EDGES), 'csv'))[:2],
+                         [('alice', 'bob'), ('bob', 'alice')])
+
+    def test_ndjson(self):
+        lines = '{"user": "alice", "following": "bob"}\n\n'
+        self.assertEqual(list(read_edges(StringIO(lines), 'ndjson')),
+                         [('alice', 'bob')])
+
+    def test_missing_field(self):
+        with self.assertRaisesMessage(EdgeFormatError, 'Edge 1'):
+            list(read_edges(StringIO('{"user": "alice"}\n'), 'ndjson'))
+
+
+class ImportEdgesTestCase(TestCase):
+    def test_creates_users_and_skips_self_follows(self):
+        User.objects.create(username='alice')
+        result = import_edges([('alice', 'bob'), ('bob', 'bob')])
+        self.assertEqual(tuple(result), (1, 1, 1))
+        self.assertTrue(Follow.objects.filter(
+            user__username='alice', following__username='bob'
+        ).exists())
+
+    def test_duplicates_are_ignored(self):
+        import_edges([('alice', 'bob')])
+        result = import_edges([('alice', 'bob'), ('bob', 'alice'),
+                               ('bob', 'alice')])
+        self.assertEqual(tuple(result), (0, 1, 0))
+        self.assertEqual(Follow.objects.count(), 2)
+
+    def test_users_created_meanwhile_not_counted(self):
+        bulk_create = User.objects.bulk_create
+
+        def create_concurrently(objs, **kwargs):
+            User.objects.create(username='bob')
+            return bulk_create(objs, **kwargs)
+
+        with mock.patch.object(User.objects, 'bulk_create',
+                               side_effect=create_concurrently):
+            result = import_edges([('alice', 'bob')])
+        self.assertEqual(tuple(result), (1, 1, 0))
+        self.assertEqual(User.objects.count(), 2)
+
+    def test_lookups_chunked(self):
+        import_edges([('alice', 'bob'), ('carol', 'dave')])
+        with mock.patch('users.imports.LOOKUP_CHUNK_SIZE', 2):
+            result = import_edges([
+                ('alice', 'bob'), ('carol', 'dave'), ('alice', 'dave'),
+                ('erin', 'bob'), ('carol', 'dave'),
+            ])
+        self.assertEqual(tuple(result), (1, 2, 0))
+        self.assertEqual(Follow.objects.count(), 4)
+
+
+class ImportFollowsCommandTestCase(ImportFollowsMixin, TestCase):
+    def test_import_csv(self):
+        path = self.write('edges.csv', CSV_EDGES)
+        output = StringIO()
+        call_command('import_follows', path, '--batch-size', '2',
+                     stdout=output)
+        self.assertEqual(self.get_follows(), {
+            ('alice', 'bob'), ('bob', 'alice'), ('carol', 'alice'),
+        })
+        self.assertEqual(Friendship.objects.count(), 2)
+        alice = UserCounters.objects.get(user__username='alice')
+        self.assertEqual((alice.friends_count, alice.subscribers_count),
+                         (1, 1))
+        self.assertIn('1 self-follows skipped', output.getvalue())
+        self.assertIn('Imported 5 edges: 3 follows written',
+                      output.getvalue())
+
+    def test_import_makes_feed_cursors_stale(self):
+        alice = User.objects.create(username='alice')
+        bob = User.objects.create(username='bob')
+        Follow.objects.create(user=alice, following=bob)
+        cursor = get_current_cursor(bob.id)
+        path = self.write('edges.csv', 'user,following\ncarol,bob\n')
+        call_command('import_follows', path, stdout=StringIO())
+        with self.assertRaises(StaleCursorError):
+            get_changes(bob.id, cursor, 10)
+
+    def test_import_ndjson(self):
+        path = self.write('edges.ndjson',
+                          '{"user": "alice", "following": "bob"}\n')
+        call_command('import_follows', path, stdout=StringIO())
+        self.assertEqual(self.get_follows(), {('alice', 'bob')})
+
+    def test_resume_from_checkpoint(self):
+        path = self.write('edges.csv', CSV_EDGES)
+        checkpoint = self.write('edges.checkpoint', json.dumps(
+            {'path': os.path.abspath(path), 'edges': 3}
+        ))
+        output = StringIO()
+        call_command('import_follows', path, '--checkpoint', checkpoint,
+                     stdout=output)
+        self.assertIn('Resuming after 3 edges', output.getvalue())
+        self.assertEqual(self.get_follows(), {('carol', 'alice'),
+                                              ('alice', 'bob')})
+        self.assertFalse(os.path.exists(checkpoint))
+
+    def test_checkpoint_written_per_batch(self):
+        path = self.write('edges.csv', CSV_EDGES + 'dave\n')
+        checkpoint = os.path.join(self.directory, 'edges.checkpoint')
+        with self.assertRaises(CommandError):
+            call_command('import_follows', path, '--batch-size', '2',
+                         '--checkpoint', checkpoint, stdout=StringIO())
+        with open(checkpoint) as file:
+            self.assertEqual(json.load(file)['edges'], 4)
+
+    def test_unknown_format(self):
+        path = self.write('edges.txt', CSV_EDGES)
+        with self.assertRaisesMessage(CommandError, '--format'):
+            call_command('import_follows', path, stdout=StringIO())
+
+
+class ImportFollowsIndexesTestCase(ImportFollowsMixin, TransactionTestCase):
+    def test_drop_indexes(self):
+        path = self.write('edges.csv', CSV_EDGES)
+        indexes = get_follow_indexes_present()
+        self.assertTrue(indexes)
+        call_command('import_follows', path, '--drop-indexes',
+                     stdout=StringIO())
+        self.assertEqual(get_follow_indexes_present(), indexes)
+        self.assertEqual(len(self.get_follows()), 3)
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, Follow._meta.db_table
+            )
+        self.assertTrue(any(constraint['unique']
+                            for constraint in constraints.values()))
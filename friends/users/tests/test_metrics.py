@@ -0,0 +1,74 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from users.metrics import Histogram, registry
+
+User = get_user_model()
+
+
+class HistogramTestCase(TestCase):
+    def test_observe(self):
+        histogram = Histogram((1, 10))
+        for value in (0.5, 1, 5, 50):
+            histogram.observe(value)
+        self.assertEqual(histogram.as_dict(), {
+            'count': 4,
+            'sum': 56.5,
+            'buckets': {'1': 2, '10': 1, '+Inf': 1},
+        })
+
+
+class RequestMetricsMiddlewareTestCase(TestCase):
+    def setUp(self):
+        registry.reset()
+        self.user = User.objects.create(username='user')
+        self.admin = User.objects.create(username='admin', is_staff=True)
+        self.client = APIClient()
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.admin_client = APIClient()
+        token = Token.objects.create(user=self.admin)
+        self.admin_client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def test_server_timing_and_histograms(self):
+        response = self.admin_client.get(reverse('friends-list',
+                                                 args=(self.user.id,)))
+        self.assertRegex(
+            response['Server-Timing'],
+            r'^db;dur=[\d.]+;desc="\d+ queries", '
+            r'render;dur=[\d.]+, total;dur=[\d.]+$'
+        )
+        self.client.post(reverse('users-subscribe', args=(self.admin.id,)))
+
+        response = self.admin_client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('FriendsViewSet.list', response.data)
+        subscribe = response.data['UserViewSet.subscribe']
+        self.assertEqual(subscribe['duration_ms']['count'], 1)
+        self.assertGreater(subscribe['queries']['sum'], 0)
+        self.assertGreater(subscribe['response_bytes']['sum'], 0)
+        self.assertIn('render_ms', subscribe)
+
+    def test_server_timing_only_for_staff(self):
+        response = self.client.get(reverse('friends-list',
+                                           args=(self.user.id,)))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(
+            registry.snapshot()['FriendsViewSet.list']['queries']['count'], 1
+        )
+        response = APIClient().get(reverse('users-list'))
+        self.assertNotIn('Server-Timing', response)
+
+    def test_metrics_only_for_admins(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    @override_settings(REQUEST_METRICS={'SAMPLE_RATE': 0})
+    def test_sampling_disabled(self):
+        response = self.client.get(reverse('users-list'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(registry.snapshot(), {})
@@ -0,0 +1,69 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITestCase
+
+from users.models import Follow
+from users.pagination import IdCursorPagination, UserListPagination
+
+User = get_user_model()
+
+
+@mock.patch.object(UserListPagination, 'page_size', 2)
+@mock.patch.object(IdCursorPagination, 'page_size', 2)
+class UserListPaginationTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='user', password='password')
+        self.followers = [
+            User.objects.create(username=f'follower{i}', password='password')
+            for i in range(5)
+        ]
+        for follower in self.followers:
+            Follow.objects.create(user=follower, following=self.user)
+
+        self.client = APIClient()
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def walk_cursor_pages(self, url):
+        usernames = []
+        url = f'{url}?pagination=cursor'
+        while url is not None:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            usernames.extend(
+                user['username'] for user in response.data['results']
+            )
+            url = response.data['next']
+        return usernames
+
+    def test_page_number_pagination_is_default(self):
+        response = self.client.get(reverse('users-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 6)
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_cursor_pagination_users(self):
+        usernames = self.walk_cursor_pages(reverse('users-list'))
+        self.assertEqual(
+            usernames,
+            ['user'] + [follower.username for follower in self.followers]
+        )
+
+    def test_cursor_pagination_subscribers(self):
+        url = reverse('subscribers-list', args=(self.user.id,))
+        usernames = self.walk_cursor_pages(url)
+        self.assertEqual(
+            usernames, [follower.username for follower in self.followers]
+        )
+
+    def test_cursor_pagination_does_not_count(self):
+        url = reverse('subscribers-list', args=(self.user.id,))
+        with self.assertNumQueries(3):
+            # token authentication, user lookup and the page itself
+            response = self.client.get(f'{url}?pagination=cursor')
+        self.assertEqual(len(response.data['results']), 2)
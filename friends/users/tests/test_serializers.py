@@ -3,10 +3,14 @@ from django.db.models import Exists, OuterRef, Subquery
 from django.test import TestCase
 from django.urls import reverse
 from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIRequestFactory
 
+from users.cache import Relationships
 from users.models import Follow
-from users.serializers import UserCreateSerializer, UserSerializer
+from users.serializers import (UserCreateSerializer, UserSerializer,
+                               serialize_user_values)
+from users.services import annotate_follower_and_following_on_request_user
 
 User = get_user_model()
 
@@ -118,3 +122,58 @@ class UserSerializerTestCase(TestCase):
         })
         with self.assertRaises(ValidationError):
             serializer.is_valid(raise_exception=True)
+
+
+class SerializeUserValuesTestCase(TestCase):
+    '''
+    Model:
+    user1 <-> user2     user1 and user2 friends
+    user1 <- user3      user3 subscriber of user1
+    user4 <- user1      user1 subscribed to user4
+    '''
+
+    def setUp(self):
+        self.user1 = User.objects.create(username='user1')
+        self.user2 = User.objects.create(username='user2')
+        self.user3 = User.objects.create(username='user3')
+        self.user4 = User.objects.create(username='user4')
+        Follow.objects.create(user=self.user1, following=self.user2)
+        Follow.objects.create(user=self.user2, following=self.user1)
+        Follow.objects.create(user=self.user3, following=self.user1)
+        Follow.objects.create(user=self.user1, following=self.user4)
+        self.request = APIRequestFactory().get('/')
+        self.request.user = self.user1
+        self.users = annotate_follower_and_following_on_request_user(
+            User.objects.order_by('id'), self.user1
+        )
+
+    def render_serializer(self):
+        return JSONRenderer().render(UserSerializer(
+            self.users, many=True, context={'request': self.request}
+        ).data)
+
+    def test_annotated_values(self):
+        rows = self.users.values('id', 'username', 'is_follower',
+                                 'is_following')
+        self.assertEqual(JSONRenderer().render(serialize_user_values(rows)),
+                         self.render_serializer())
+
+    def test_cached_relationships(self):
+        relationships = Relationships(
+            frozenset((self.user2.id, self.user3.id)),
+            frozenset((self.user2.id, self.user4.id)),
+        )
+        rows = User.objects.order_by('id').values('id', 'username')
+        self.assertEqual(
+            JSONRenderer().render(serialize_user_values(rows, relationships)),
+            self.render_serializer()
+        )
+
+    def test_status_by_flags(self):
+        self.assertEqual(
+            [UserSerializer.get_status_by_flags(is_follower, is_following)
+             for is_follower, is_following in ((1, 1), (0, 1), (1, 0),
+                                               (0, 0))],
+            ['уже друзья', 'есть исходящая заявка', 'есть входящая заявка',
+             'нет ничего']
+        )
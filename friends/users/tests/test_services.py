@@ -1,13 +1,23 @@
+from unittest import mock
+
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.db import connection
+from django.http import Http404
+from django.test import TestCase, override_settings
 from rest_framework import status
 from rest_framework.test import APIRequestFactory
 
-from users.models import Follow
+from users.models import Follow, FollowEvent, Friendship, UserCounters
 from users.serializers import UserSerializer
-from users.services import (SubscriptionQuerySet, SubsriptionCreateDelete,
+from users.services import (BulkSubscriptionCreateDelete, JoinEngine,
+                            SubqueryEngine, SubscriptionQuerySet,
+                            SubsriptionCreateDelete, _delete_follows,
+                            _insert_follows,
                             annotate_follower_and_following_on_request_user,
-                            destroy_from_subscribers)
+                            destroy_from_subscribers,
+                            get_subscription_query_engine, rebuild_friendships,
+                            rebuild_user_counters, sync_created_follows)
+from users.synthetic import generate_follow_graph
 
 User = get_user_model()
 
@@ -23,8 +33,10 @@ class SubscriptionCreateDeleteTestCase(TestCase):
     def test_create_subscribe(self):
         request = self.factory.post('/subscribe/', {'user_id': self.user2.id})
         request.user = self.user1
-        response = SubsriptionCreateDelete(request, User.objects.all(),
-                                           self.user2.id).create_subscribe()
+        subscription = SubsriptionCreateDelete(request, User.objects.all(),
+                                               self.user2.id)
+        with self.assertNumQueries(9):
+            response = subscription.create_subscribe()
         self.assertEqual(response.status_code, 201)
         self.assertTrue(Follow.objects.filter(
             user=self.user1, following=self.user2
@@ -37,8 +49,11 @@ class SubscriptionCreateDeleteTestCase(TestCase):
         Follow.objects.create(user=self.user1, following=self.user2)
         request = self.factory.post('/subscribe/', {'user_id': self.user2.id})
         request.user = self.user1
-        response = SubsriptionCreateDelete(request, User.objects.all(),
-                                           self.user2.id).create_subscribe()
+        subscription = SubsriptionCreateDelete(request, User.objects.all(),
+                                               self.user2.id)
+        with self.assertNumQueries(3):
+            # savepoint, the annotated user and the savepoint release
+            response = subscription.create_subscribe()
         self.assertEqual(response.status_code, 400)
         self.assertEqual(response.data,
                          {'errors': 'Нельзя подписаться дважды!'})
@@ -46,8 +61,10 @@ class SubscriptionCreateDeleteTestCase(TestCase):
     def test_create_subscribe_cannot_subscribe_to_yourself(self):
         request = self.factory.post('/subscribe/', {'user_id': self.user1.id})
         request.user = self.user1
-        response = SubsriptionCreateDelete(request, User.objects.all(),
-                                           self.user1.id).create_subscribe()
+        subscription = SubsriptionCreateDelete(request, User.objects.all(),
+                                               self.user1.id)
+        with self.assertNumQueries(2):
+            response = subscription.create_subscribe()
         self.assertEqual(response.status_code, 400)
         self.assertEqual(response.data,
                          {'errors': 'Нельзя подписаться на самого себя!'})
@@ -57,22 +74,214 @@ class SubscriptionCreateDeleteTestCase(TestCase):
         request = self.factory.delete('/subscribe/',
                                       {'user_id': self.user2.id})
         request.user = self.user1
-        response = SubsriptionCreateDelete(request, User.objects.all(),
-                                           self.user2.id).delete_subscribe()
+        subscription = SubsriptionCreateDelete(request, User.objects.all(),
+                                               self.user2.id)
+        with self.assertNumQueries(8):
+            response = subscription.delete_subscribe()
         self.assertEqual(response.status_code, 204)
         self.assertFalse(Follow.objects.filter(user=self.user1,
                                                following=self.user2).exists())
 
+    def test_create_subscribe_concurrent_follow(self):
+        request = self.factory.post('/subscribe/')
+        request.user = self.user1
+        subscription = SubsriptionCreateDelete(request, User.objects.all(),
+                                               self.user2.id)
+
+        def insert_follows(edges):
+            # Stored by another request after the user was loaded.
+            Follow.objects.create(user=self.user1, following=self.user2)
+            return _insert_follows(edges)
+
+        with mock.patch('users.services._insert_follows', insert_follows):
+            response = subscription.create_subscribe()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            UserCounters.objects.get(user=self.user2).subscribers_count, 1
+        )
+
+    def test_subscribe_to_yourself_spelled_differently(self):
+        request = self.factory.post('/subscribe/')
+        request.user = self.user1
+        subscription = SubsriptionCreateDelete(request, User.objects.all(),
+                                               f'0{self.user1.id}')
+        response = subscription.create_subscribe()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data,
+                         {'errors': 'Нельзя подписаться на самого себя!'})
+
     def test_delete_subscribe_cannot_unsubscribe_if_not_subscribed(self):
         request = self.factory.delete('/subscribe/',
                                       {'user_id': self.user2.id})
         request.user = self.user1
-        response = SubsriptionCreateDelete(request, User.objects.all(),
-                                           self.user2.id).delete_subscribe()
+        subscription = SubsriptionCreateDelete(request, User.objects.all(),
+                                               self.user2.id)
+        with self.assertNumQueries(4):
+            response = subscription.delete_subscribe()
         self.assertEqual(response.status_code, 400)
         self.assertEqual(response.data,
                          {'errors': 'Нельзя отписаться, если не подписан!'})
 
+    def test_subscribe_missing_user(self):
+        request = self.factory.post('/subscribe/')
+        request.user = self.user1
+        subscription = SubsriptionCreateDelete(request, User.objects.all(),
+                                               self.user2.id + 1)
+        with self.assertRaises(Http404):
+            subscription.create_subscribe()
+        with self.assertRaises(Http404):
+            subscription.delete_subscribe()
+
+
+class BulkSubscriptionCreateDeleteTestCase(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.user1 = User.objects.create_user(username='user1',
+                                              password='user1password')
+        self.user2 = User.objects.create_user(username='user2',
+                                              password='user2password')
+        self.user3 = User.objects.create_user(username='user3',
+                                              password='user3password')
+        self.others = User.objects.bulk_create(
+            User(username=f'other{i}') for i in range(20)
+        )
+        self.missing_id = User.objects.order_by('id').last().id + 1
+
+    def get_subscription(self, ids):
+        request = self.factory.post('/bulk-subscribe/', {'ids': ids})
+        request.user = self.user1
+        return BulkSubscriptionCreateDelete(request, User.objects.all(), ids)
+
+    def test_create_subscribes(self):
+        Follow.objects.create(user=self.user1, following=self.user3)
+        Follow.objects.create(user=self.user2, following=self.user1)
+        ids = [self.user2.id, self.user3.id, self.user1.id, self.missing_id]
+        response = self.get_subscription(ids).create_subscribes()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [
+            {'id': self.user2.id, 'status': 201},
+            {'id': self.user3.id, 'status': 400,
+             'errors': 'Нельзя подписаться дважды!'},
+            {'id': self.user1.id, 'status': 400,
+             'errors': 'Нельзя подписаться на самого себя!'},
+            {'id': self.missing_id, 'status': 404,
+             'errors': 'Пользователь не найден!'},
+        ])
+        self.assertQuerysetEqual(
+            SubscriptionQuerySet(self.user1).get_user_friends(), [self.user2]
+        )
+        self.assertEqual(self.user1.counters.friends_count, 1)
+        self.assertEqual(self.user1.counters.subscriptions_count, 1)
+
+    def test_create_subscribes_concurrent_follow(self):
+        subscription = self.get_subscription([self.user2.id, self.user3.id])
+
+        def insert_follows(edges):
+            # Stored by another request between the check and the insert.
+            Follow.objects.create(user=self.user1, following=self.user3)
+            return _insert_follows(edges)
+
+        with mock.patch('users.services._insert_follows', insert_follows):
+            response = subscription.create_subscribes()
+        self.assertEqual(response.data['results'], [
+            {'id': self.user2.id, 'status': 201},
+            {'id': self.user3.id, 'status': 400,
+             'errors': 'Нельзя подписаться дважды!'},
+        ])
+        self.user1.counters.refresh_from_db()
+        self.assertEqual(self.user1.counters.subscriptions_count, 2)
+        self.assertEqual(
+            UserCounters.objects.get(user=self.user3).subscribers_count, 1
+        )
+        self.assertEqual(FollowEvent.objects.filter(
+            following=self.user3
+        ).count(), 1)
+
+    def test_insert_follows_without_returning(self):
+        Follow.objects.create(user=self.user1, following=self.user3)
+        edges = [(self.user1.id, self.user2.id),
+                 (self.user1.id, self.user3.id)]
+        # The other backends insert the follows one by one.
+        with mock.patch.object(connection, 'vendor', 'mysql'):
+            self.assertEqual(_insert_follows(edges), edges[:1])
+        self.assertEqual(self.user1.follower.count(), 2)
+
+    def test_delete_follows_without_returning(self):
+        Follow.objects.create(user=self.user1, following=self.user2)
+        Follow.objects.create(user=self.user1, following=self.user3)
+        follows = Follow.objects.filter(user=self.user1,
+                                        following__in=[self.user2, self.user3])
+        # The other backends lock the follows and delete them by id.
+        with mock.patch.object(connection, 'vendor', 'mysql'):
+            self.assertEqual(
+                sorted(_delete_follows(follows)),
+                [(self.user1.id, self.user2.id),
+                 (self.user1.id, self.user3.id)],
+            )
+            self.assertEqual(_delete_follows(follows), [])
+        self.assertFalse(self.user1.follower.exists())
+
+    def test_delete_subscribes_concurrent_unfollow(self):
+        Follow.objects.create(user=self.user1, following=self.user2)
+        Follow.objects.create(user=self.user1, following=self.user3)
+        subscription = self.get_subscription([self.user2.id, self.user3.id])
+
+        def delete_follows(follows):
+            # Deleted by another request between the check and the delete.
+            Follow.objects.filter(user=self.user1,
+                                  following=self.user3).delete()
+            return _delete_follows(follows)
+
+        with mock.patch('users.services._delete_follows', delete_follows):
+            response = subscription.delete_subscribes()
+        self.assertEqual(response.data['results'], [
+            {'id': self.user2.id, 'status': 204},
+            {'id': self.user3.id, 'status': 400,
+             'errors': 'Нельзя отписаться, если не подписан!'},
+        ])
+        self.user1.counters.refresh_from_db()
+        self.assertEqual(self.user1.counters.subscriptions_count, 0)
+        self.assertEqual(
+            UserCounters.objects.get(user=self.user3).subscribers_count, 0
+        )
+
+    def test_create_subscribes_query_count(self):
+        subscription = self.get_subscription(
+            [user.id for user in self.others]
+        )
+        with self.assertNumQueries(9):
+            subscription.create_subscribes()
+        self.assertEqual(self.user1.follower.count(), len(self.others))
+
+    def test_delete_subscribes(self):
+        Follow.objects.create(user=self.user1, following=self.user2)
+        Follow.objects.create(user=self.user2, following=self.user1)
+        ids = [self.user2.id, self.user3.id, self.missing_id]
+        response = self.get_subscription(ids).delete_subscribes()
+        self.assertEqual(response.data['results'], [
+            {'id': self.user2.id, 'status': 204},
+            {'id': self.user3.id, 'status': 400,
+             'errors': 'Нельзя отписаться, если не подписан!'},
+            {'id': self.missing_id, 'status': 404,
+             'errors': 'Пользователь не найден!'},
+        ])
+        self.assertFalse(self.user1.follower.exists())
+        self.assertFalse(self.user1.friendships.exists())
+        self.user1.counters.refresh_from_db()
+        self.assertEqual(self.user1.counters.subscribers_count, 1)
+        self.assertEqual(self.user1.counters.friends_count, 0)
+
+    def test_delete_subscribes_query_count(self):
+        Follow.objects.bulk_create(
+            Follow(user=self.user1, following=user) for user in self.others
+        )
+        subscription = self.get_subscription(
+            [user.id for user in self.others]
+        )
+        with self.assertNumQueries(9):
+            subscription.delete_subscribes()
+        self.assertFalse(self.user1.follower.exists())
+
 
 class AnnotateFollowerAndFollowingOnRequestUserTest(TestCase):
     def setUp(self):
@@ -145,6 +354,37 @@ class SubscriptionQuerySetTestCase(TestCase):
         self.assertQuerysetEqual(friends, [self.user2])
 
 
+class SubscriptionQueryEngineTestCase(TestCase):
+    def setUp(self):
+        self.graph = generate_follow_graph(60, 6, 'power_law', seed=1)
+
+    def test_engines_return_same_sets(self):
+        for user in User.objects.filter(id__in=self.graph.user_ids):
+            subqueries = SubscriptionQuerySet(user, SubqueryEngine())
+            joins = SubscriptionQuerySet(user, JoinEngine())
+            for method in ('get_user_subscribers', 'get_user_subscriptions',
+                           'get_user_friends'):
+                with self.subTest(user=user.id, method=method):
+                    expected = list(getattr(subqueries, method)().order_by(
+                        'id'
+                    ).values_list('id', flat=True))
+                    self.assertEqual(
+                        list(getattr(joins, method)().order_by(
+                            'id'
+                        ).values_list('id', flat=True)),
+                        expected
+                    )
+
+    def test_engine_for_database_vendor(self):
+        self.assertIsInstance(get_subscription_query_engine(),
+                              SubqueryEngine)
+        with override_settings(SUBSCRIPTION_QUERY_ENGINES={
+            connection.vendor: 'users.services.JoinEngine'
+        }):
+            self.assertIsInstance(get_subscription_query_engine(),
+                                  JoinEngine)
+
+
 class DestroyFromSubscribersTestCase(TestCase):
     def setUp(self):
         self.user1 = User.objects.create(username='user1')
@@ -167,6 +407,177 @@ class DestroyFromSubscribersTestCase(TestCase):
         is returned when the request_user
         is not the same as the user specified by user_id.
         '''
-        response = destroy_from_subscribers(self.user1, self.user2.id,
-                                            self.user1.id)
+        with self.assertNumQueries(0):
+            response = destroy_from_subscribers(self.user1, self.user2.id,
+                                                self.user1.id)
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_destroy_from_subscribers_queries(self):
+        with self.assertNumQueries(8):
+            response = destroy_from_subscribers(self.user2, self.user2.id,
+                                                self.user1.id)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Follow.objects.filter(
+            user=self.user1, following=self.user2
+        ).exists())
+        self.assertEqual(UserCounters.objects.get(
+            user=self.user2
+        ).subscribers_count, 0)
+        with self.assertNumQueries(4):
+            response = destroy_from_subscribers(self.user2, self.user2.id,
+                                                self.user3.id)
+        self.assertEqual(
+            response.data['errors'],
+            'Пользователь user3, не является подписчиком user2!'
+        )
+
+    def test_destroy_friend_from_subscribers(self):
+        Follow.objects.create(user=self.user2, following=self.user1)
+        response = destroy_from_subscribers(self.user2, self.user2.id,
+                                            self.user1.id)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(Follow.objects.filter(
+            user=self.user1, following=self.user2
+        ).exists())
+
+    def test_destroy_missing_user_from_subscribers(self):
+        with self.assertRaises(Http404):
+            destroy_from_subscribers(self.user2, self.user2.id, 0)
+
+
+class UserCountersTestCase(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.user1 = User.objects.create(username='user1')
+        self.user2 = User.objects.create(username='user2')
+        self.user3 = User.objects.create(username='user3')
+
+    def subscribe(self, user, following):
+        request = self.factory.post('/subscribe/')
+        request.user = user
+        return SubsriptionCreateDelete(request, User.objects.all(),
+                                       following.id).create_subscribe()
+
+    def unsubscribe(self, user, following):
+        request = self.factory.delete('/subscribe/')
+        request.user = user
+        return SubsriptionCreateDelete(request, User.objects.all(),
+                                       following.id).delete_subscribe()
+
+    def get_counters(self, user):
+        counters = UserCounters.objects.filter(user=user).first()
+        if counters is None:
+            return (0, 0, 0)
+        return (counters.subscribers_count, counters.subscriptions_count,
+                counters.friends_count)
+
+    def assert_counters_rebuild_equal(self):
+        counters = {user.id: self.get_counters(user)
+                    for user in User.objects.all()}
+        rebuild_user_counters()
+        self.assertEqual(
+            counters,
+            {user.id: self.get_counters(user) for user in User.objects.all()}
+        )
+
+    def test_counters_follow_unfollow(self):
+        self.subscribe(self.user1, self.user2)
+        self.assertEqual(self.get_counters(self.user1), (0, 1, 0))
+        self.assertEqual(self.get_counters(self.user2), (1, 0, 0))
+        self.assert_counters_rebuild_equal()
+
+        self.subscribe(self.user2, self.user1)
+        self.subscribe(self.user3, self.user1)
+        self.assertEqual(self.get_counters(self.user1), (1, 0, 1))
+        self.assertEqual(self.get_counters(self.user2), (0, 0, 1))
+        self.assertEqual(self.get_counters(self.user3), (0, 1, 0))
+        self.assert_counters_rebuild_equal()
+
+        self.unsubscribe(self.user1, self.user2)
+        self.assertEqual(self.get_counters(self.user1), (2, 0, 0))
+        self.assertEqual(self.get_counters(self.user2), (0, 1, 0))
+        self.assert_counters_rebuild_equal()
+
+    def test_counters_destroy_from_subscribers(self):
+        self.subscribe(self.user2, self.user1)
+        destroy_from_subscribers(self.user1, self.user1.id, self.user2.id)
+        self.assertEqual(self.get_counters(self.user1), (0, 0, 0))
+        self.assertEqual(self.get_counters(self.user2), (0, 0, 0))
+
+    def test_counters_failed_subscribe_is_not_counted(self):
+        self.subscribe(self.user1, self.user2)
+        self.subscribe(self.user1, self.user2)
+        self.subscribe(self.user1, self.user1)
+        self.assertEqual(self.get_counters(self.user1), (0, 1, 0))
+        self.assertEqual(self.get_counters(self.user2), (1, 0, 0))
+
+    def test_counters_user_deleted(self):
+        self.subscribe(self.user1, self.user2)
+        self.subscribe(self.user2, self.user1)
+        self.subscribe(self.user1, self.user3)
+        self.subscribe(self.user3, self.user2)
+        self.user1.delete()
+        self.assertEqual(self.get_counters(self.user2), (1, 0, 0))
+        self.assertEqual(self.get_counters(self.user3), (0, 1, 0))
+        self.assert_counters_rebuild_equal()
+
+    def test_user_with_many_followers_deleted(self):
+        followers = User.objects.bulk_create(
+            User(username=f'follower{i}') for i in range(3000)
+        )
+        follows = [Follow(user=follower, following=self.user1)
+                   for follower in followers]
+        follows += [Follow(user=self.user1, following=follower)
+                    for follower in followers[:700]]
+        sync_created_follows(
+            (follow.user_id, follow.following_id)
+            for follow in Follow.objects.bulk_create(follows)
+        )
+        self.assertEqual(self.get_counters(self.user1), (2300, 0, 700))
+        self.user1.delete()
+        self.assertEqual(self.get_counters(followers[0]), (0, 0, 0))
+        self.assertEqual(self.get_counters(followers[-1]), (0, 0, 0))
+        self.assertFalse(Friendship.objects.exists())
+        self.assert_counters_rebuild_equal()
+
+    def test_sync_created_follows_batch(self):
+        follows = Follow.objects.bulk_create([
+            Follow(user=self.user1, following=self.user2),
+            Follow(user=self.user2, following=self.user1),
+            Follow(user=self.user3, following=self.user1),
+        ])
+        sync_created_follows(
+            (follow.user_id, follow.following_id) for follow in follows
+        )
+        self.assert_counters_rebuild_equal()
+
+
+class FriendshipTestCase(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create(username='user1')
+        self.user2 = User.objects.create(username='user2')
+        self.user3 = User.objects.create(username='user3')
+
+    def get_friendships(self):
+        return set(Friendship.objects.values_list('user', 'friend'))
+
+    def test_friendship_follows_mutual_follow(self):
+        Follow.objects.create(user=self.user1, following=self.user2)
+        self.assertEqual(self.get_friendships(), set())
+        follow = Follow.objects.create(user=self.user2, following=self.user1)
+        self.assertEqual(self.get_friendships(), {
+            (self.user1.id, self.user2.id), (self.user2.id, self.user1.id)
+        })
+        follow.delete()
+        self.assertEqual(self.get_friendships(), set())
+
+    def test_rebuild_friendships(self):
+        Follow.objects.bulk_create([
+            Follow(user=self.user1, following=self.user2),
+            Follow(user=self.user2, following=self.user1),
+            Follow(user=self.user3, following=self.user1),
+        ])
+        self.assertEqual(rebuild_friendships(), 2)
+        self.assertEqual(self.get_friendships(), {
+            (self.user1.id, self.user2.id), (self.user2.id, self.user1.id)
+        })
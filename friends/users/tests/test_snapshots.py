@@ -0,0 +1,96 @@
+import os
+import tempfile
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+from users.graph import FollowGraph
+from users.models import Follow, Friendship, UserCounters
+from users.services import SubqueryEngine, SubscriptionQuerySet
+from users.snapshots import get_snapshot_path, get_synthetic_graph
+
+User = get_user_model()
+
+GRAPH = {'users': 40, 'avg_degree': 4, 'distribution': 'power_law',
+         'reciprocity': 0.5, 'seed': 3}
+
+
+def get_follows():
+    return set(Follow.objects.values_list('user__username',
+                                          'following__username'))
+
+
+def delete_graph():
+    for model in (Follow, Friendship, UserCounters, User):
+        queryset = model.objects.all()
+        queryset._raw_delete(queryset.db)
+
+
+class SnapshotTestCase(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(SYNTHETIC_GRAPH_CACHE_DIR=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_snapshot_is_saved_and_loaded(self):
+        generated = get_synthetic_graph(**GRAPH)
+        self.assertTrue(os.path.exists(get_snapshot_path(
+            **GRAPH, power_law_exponent=1.0, username_prefix='synthetic'
+        )))
+        follows = get_follows()
+        friendships = Friendship.objects.count()
+        delete_graph()
+
+        with mock.patch('users.snapshots.generate_follow_graph') as generate:
+            loaded = get_synthetic_graph(**GRAPH)
+        generate.assert_not_called()
+        self.assertEqual(loaded.edges, generated.edges)
+        self.assertEqual(len(loaded.user_ids), GRAPH['users'])
+        self.assertEqual(get_follows(), follows)
+        self.assertEqual(Friendship.objects.count(), friendships)
+        user = User.objects.get(id=loaded.user_ids[0])
+        self.assertEqual(user.username, 'synthetic0')
+        self.assertFalse(user.has_usable_password())
+
+    def test_loaded_ids_follow_existing_rows(self):
+        get_synthetic_graph(**GRAPH)
+        delete_graph()
+        existing = User.objects.create(username='existing')
+        graph = get_synthetic_graph(**GRAPH)
+        self.assertGreater(min(graph.user_ids), existing.id)
+        self.assertGreater(User.objects.create(username='new').id,
+                           max(graph.user_ids))
+        counters = UserCounters.objects.get(user=graph.user_ids[0])
+        self.assertEqual(
+            counters.friends_count,
+            Friendship.objects.filter(user=graph.user_ids[0]).count()
+        )
+
+    def test_parameters_change_the_snapshot(self):
+        self.assertNotEqual(get_snapshot_path(**GRAPH),
+                            get_snapshot_path(**{**GRAPH, 'seed': 4}))
+
+
+class SyntheticGraphQueriesTestCase(TestCase):
+    '''The follow graph agrees with SQL on a cached power-law graph.'''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.graph = get_synthetic_graph(300, 8, 'power_law', reciprocity=0.3,
+                                        seed=5, username_prefix='cached')
+
+    def test_follow_graph_matches_sql(self):
+        follow_graph = FollowGraph.from_database()
+        for user_id in self.graph.user_ids[::25]:
+            subscriptions = SubscriptionQuerySet(User(id=user_id),
+                                                 SubqueryEngine())
+            for name in ('subscribers', 'subscriptions', 'friends'):
+                queryset = getattr(subscriptions, f'get_user_{name}')()
+                self.assertEqual(
+                    getattr(follow_graph, name)(user_id),
+                    list(queryset.order_by('id').values_list('id',
+                                                             flat=True)),
+                )
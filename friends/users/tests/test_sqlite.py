@@ -0,0 +1,46 @@
+from unittest import skipUnless
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from users.backends.sqlite3.base import DatabaseWrapper
+from users.sqlite import apply_sqlite_pragmas
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite only')
+class SQLitePragmasTestCase(TestCase):
+    def get_pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_applied_on_connection(self):
+        self.assertEqual(self.get_pragma('busy_timeout'), 5000)
+        self.assertEqual(self.get_pragma('cache_size'), -64 * 1024)
+
+    @override_settings(SQLITE_PRAGMAS={'busy_timeout': 1234})
+    def test_apply_sqlite_pragmas(self):
+        timeout = self.get_pragma('busy_timeout')
+        self.addCleanup(connection.cursor().execute,
+                        f'PRAGMA busy_timeout = {timeout}')
+        apply_sqlite_pragmas(connection)
+        self.assertEqual(self.get_pragma('busy_timeout'), 1234)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite only')
+class TransactionModeTestCase(TransactionTestCase):
+    def test_immediate_transactions(self):
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic():
+                pass
+        self.assertEqual(queries[0]['sql'], 'BEGIN IMMEDIATE')
+
+    def test_invalid_transaction_mode(self):
+        wrapper = DatabaseWrapper({
+            **connection.settings_dict,
+            'OPTIONS': {'transaction_mode': 'LAZY'},
+        })
+        with self.assertRaises(ImproperlyConfigured):
+            wrapper.get_connection_params()
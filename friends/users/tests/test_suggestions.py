@@ -0,0 +1,137 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from users.models import Follow
+from users.suggestions import (get_friend_suggestions, get_mutual_friends,
+                               rank_friends_of_friends)
+
+User = get_user_model()
+
+
+def befriend(user, friend):
+    Follow.objects.create(user=user, following=friend)
+    Follow.objects.create(user=friend, following=user)
+
+
+class SuggestionsTestCase(TestCase):
+    '''
+    user1 is friends with user2 and user3, who are both friends with
+    user4. user5 is a friend of user2 only, user6 is followed by user1.
+    '''
+
+    def setUp(self):
+        self.users = [User.objects.create(username=f'user{number}')
+                      for number in range(1, 8)]
+        user1, user2, user3, user4, user5, user6, _ = self.users
+        befriend(user1, user2)
+        befriend(user1, user3)
+        befriend(user2, user4)
+        befriend(user3, user4)
+        befriend(user2, user5)
+        befriend(user2, user6)
+        Follow.objects.create(user=user1, following=user6)
+
+    def tearDown(self):
+        caches['default'].clear()
+
+    def test_mutual_friends(self):
+        user1, user2, user3, user4 = self.users[:4]
+        self.assertQuerysetEqual(
+            get_mutual_friends(user1, user4).order_by('id'), [user2, user3]
+        )
+        self.assertQuerysetEqual(
+            get_mutual_friends(user4, user1).order_by('id'), [user2, user3]
+        )
+        self.assertFalse(get_mutual_friends(user1, user2).exists())
+
+    def test_rank_friends_of_friends(self):
+        user1, _, _, user4, user5 = self.users[:5]
+        self.assertEqual(rank_friends_of_friends(user1.id, 100, 500, 10),
+                         [(user4.id, 2), (user5.id, 1)])
+
+    def test_friend_with_too_many_friends_is_skipped(self):
+        user1, _, _, user4 = self.users[:4]
+        # user2 has 4 friends, user3 has 2.
+        self.assertEqual(rank_friends_of_friends(user1.id, 100, 2, 10),
+                         [(user4.id, 1)])
+
+    def test_max_friends(self):
+        user1 = self.users[0]
+        self.assertEqual(
+            len(rank_friends_of_friends(user1.id, 1, 500, 10)), 1
+        )
+
+    def test_no_friends(self):
+        self.assertEqual(rank_friends_of_friends(self.users[6].id, 100, 500,
+                                                 10), [])
+
+    def test_suggestions_are_cached(self):
+        user1 = self.users[0]
+        get_friend_suggestions(user1.id, 10)
+        with self.assertNumQueries(0):
+            suggestions = get_friend_suggestions(user1.id, 1)
+        self.assertEqual(suggestions, [(self.users[3].id, 2)])
+
+
+class SuggestionsViewsTestCase(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create(username='user1')
+        self.user2 = User.objects.create(username='user2')
+        self.user3 = User.objects.create(username='user3')
+        befriend(self.user1, self.user2)
+        befriend(self.user2, self.user3)
+        Follow.objects.create(user=self.user3, following=self.user1)
+
+        self.client = APIClient()
+        token = Token.objects.create(user=self.user1)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def tearDown(self):
+        caches['default'].clear()
+
+    def test_mutual_friends(self):
+        url = reverse('mutual-friends-list',
+                      args=(self.user1.id, self.user3.id))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [{
+            'id': self.user2.id,
+            'username': 'user2',
+            'friendship_status': 'уже друзья',
+        }])
+        self.assertIn('max-age=300', response['Cache-Control'])
+
+    def test_mutual_friends_not_found(self):
+        url = reverse('mutual-friends-list', args=(self.user1.id, 0))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_friend_suggestions(self):
+        url = reverse('users-friend-suggestions', args=(self.user1.id,))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [{
+            'id': self.user3.id,
+            'username': 'user3',
+            'friendship_status': 'есть входящая заявка',
+            'mutual_friends': 1,
+        }])
+        self.assertIn('private', response['Cache-Control'])
+
+    @override_settings(FRIEND_SUGGESTIONS={'MAX_SUGGESTIONS': 5})
+    def test_friend_suggestions_limit(self):
+        url = reverse('users-friend-suggestions', args=(self.user1.id,))
+        response = self.client.get(url, {'limit': 6})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(url, {'limit': 0})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_friend_suggestions_not_found(self):
+        url = reverse('users-friend-suggestions', args=(0,))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
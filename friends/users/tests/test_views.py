@@ -1,10 +1,16 @@
+import json
+from unittest import mock
+
 from django.contrib.auth import get_user_model
+from django.test import override_settings
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient, APITestCase
 
 from users.models import Follow
+from users.services import SubscriptionQuerySet
+from users.views import SubscribersViewSet
 
 User = get_user_model()
 
@@ -62,6 +68,76 @@ class UserViewSetTestCase(APITestCase):
         response = self.authenticated_client.delete(url)
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
 
+    def test_bulk_subscribe_and_unsubscribe(self):
+        url = reverse('users-bulk-subscribe')
+        data = {'ids': [self.user2.id, self.user3.id]}
+        response = self.unauthenticated_client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.authenticated_client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [result['status'] for result in response.data['results']],
+            [status.HTTP_201_CREATED, status.HTTP_201_CREATED]
+        )
+        response = self.authenticated_client.delete(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [result['status'] for result in response.data['results']],
+            [status.HTTP_204_NO_CONTENT, status.HTTP_204_NO_CONTENT]
+        )
+
+    def test_user_counters(self):
+        Follow.objects.create(user=self.user1, following=self.user2)
+        Follow.objects.create(user=self.user2, following=self.user1)
+        Follow.objects.create(user=self.user3, following=self.user1)
+        url = reverse('users-counters', args=(self.user1.id,))
+        response = self.unauthenticated_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.authenticated_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {
+            'subscribers_count': 1,
+            'subscriptions_count': 0,
+            'friends_count': 1,
+        })
+
+    def test_user_counters_without_follows(self):
+        url = reverse('users-counters', args=(self.user2.id,))
+        response = self.authenticated_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['subscribers_count'], 0)
+        url = reverse('users-counters', args=(0,))
+        response = self.authenticated_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_relationships(self):
+        Follow.objects.create(user=self.user1, following=self.user2)
+        Follow.objects.create(user=self.user3, following=self.user1)
+        url = reverse('users-relationships')
+        data = {'ids': [self.user2.id, self.user3.id, self.user3.id + 1]}
+        response = self.unauthenticated_client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        with self.assertNumQueries(2):
+            response = self.authenticated_client.post(url, data,
+                                                      format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(user['id'], user['friendship_status'])
+             for user in response.data],
+            [(self.user2.id, 'есть исходящая заявка'),
+             (self.user3.id, 'есть входящая заявка')]
+        )
+
+    def test_relationships_validation(self):
+        url = reverse('users-relationships')
+        response = self.authenticated_client.post(url, {'ids': []},
+                                                  format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.authenticated_client.post(
+            url, {'ids': list(range(1, 102))}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
 
 class SubscribersViewSetTestCase(APITestCase):
     def setUp(self):
@@ -91,6 +167,38 @@ class SubscribersViewSetTestCase(APITestCase):
         self.assertEqual(response.data['results'][0]['username'], 'user2')
         self.assertEqual(response.data['results'][1]['username'], 'user3')
 
+    def test_list_subscribers_unpaginated(self):
+        url = reverse('subscribers-list', args=(self.user1.id,))
+        with mock.patch.object(SubscribersViewSet, 'pagination_class', None):
+            response = self.authenticated_client1.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(user['username'], user['friendship_status'])
+             for user in response.data],
+            [('user2', 'есть входящая заявка'),
+             ('user3', 'есть входящая заявка')],
+        )
+
+    def test_export_subscribers(self):
+        url = reverse('subscribers-export', args=(self.user1.id,))
+        response = self.unauthenticated_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        with mock.patch.object(SubscribersViewSet, 'export_chunk_size', 1):
+            response = self.authenticated_client2.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        list_response = self.authenticated_client2.get(
+            reverse('subscribers-list', args=(self.user1.id,))
+        )
+        self.assertEqual([json.loads(line) for line in lines],
+                         list_response.json()['results'])
+
+        response = self.authenticated_client1.get(
+            reverse('subscribers-export', args=(self.user3.id + 1,))
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_destroy_subscriber(self):
         url = reverse('subscribers-detail',
                       args=(self.user1.id, self.user2.id))
@@ -148,3 +256,100 @@ class FriendsViewSetTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data['results']), 1)
         self.assertEqual(response.data['results'][0]['username'], 'user2')
+
+    def test_export_friends(self):
+        url = reverse('friends-export', args=(self.user1.id,))
+        response = self.authenticated_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            b''.join(response.streaming_content).decode(),
+            f'{{"id":{self.user2.id},"username":"user2",'
+            f'"friendship_status":"уже друзья"}}\n'
+        )
+
+
+class ConditionalListTestCase(APITestCase):
+    def setUp(self):
+        self.user1 = User.objects.create(username='user1', password='password')
+        self.user2 = User.objects.create(username='user2', password='password')
+        self.user3 = User.objects.create(username='user3', password='password')
+        Follow.objects.create(user=self.user2, following=self.user1)
+        Follow.objects.create(user=self.user1, following=self.user2)
+
+        self.client = APIClient()
+        token = Token.objects.create(user=self.user3)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.url = reverse('subscribers-list', args=(self.user1.id,))
+
+    def test_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('W/"'))
+        self.assertIn('Last-Modified', response)
+        self.assertIn('private', response['Cache-Control'])
+
+        with mock.patch.object(SubscriptionQuerySet,
+                               'get_user_subscribers') as subscribers:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+        subscribers.assert_not_called()
+
+        response = self.client.get(
+            self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_follows_change_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url + '?page_size=1',
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        Follow.objects.create(user=self.user3, following=self.user2)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        # A follow of the request user changes the friendship statuses.
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+        etag = response['ETag']
+        Follow.objects.filter(user=self.user2, following=self.user1).delete()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['results'], [])
+
+    def test_stamps_per_view(self):
+        view, other_view = SubscribersViewSet(), SubscribersViewSet()
+        view.stamps[self.user1.id] = None
+        self.assertEqual(other_view.stamps, {})
+
+    def test_users_without_follows(self):
+        url = reverse('subscribers-list', args=(self.user3.id,))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('ETag', response)
+        response = self.client.get(
+            reverse('subscribers-list', args=(self.user3.id + 1,))
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_mutual_friends(self):
+        url = reverse('mutual-friends-list',
+                      args=(self.user1.id, self.user2.id))
+        etag = self.client.get(url)['ETag']
+        Follow.objects.create(user=self.user2, following=self.user3)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_follow_graph(self):
+        with override_settings(FOLLOW_GRAPH={'MAX_AGE': 60}):
+            response = self.client.get(self.url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            # Other processes may not have reloaded their graphs yet.
+            self.assertNotIn('ETag', response)
+        with override_settings(FOLLOW_GRAPH={'MAX_AGE': None}):
+            self.assertIn('ETag', self.client.get(self.url))
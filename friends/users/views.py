@@ -1,29 +1,123 @@
+import json
+
 from django.contrib.auth import get_user_model
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from rest_framework import status
 from rest_framework.decorators import action
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from users.serializers import UserCreateSerializer, UserSerializer
-from users.services import (SubscriptionQuerySet, SubsriptionCreateDelete,
+from users.cache import get_relationship_cache
+from users.events import (StaleCursorError, get_changes, get_current_cursor,
+                          get_follow_event_settings)
+from users.graph import get_follow_graph_index
+from users.metrics import registry
+from users.models import UserCounters
+from users.serializers import (FollowChangesQuerySerializer,
+                               FollowEventSerializer,
+                               FriendSuggestionsQuerySerializer,
+                               UserCountersSerializer, UserCreateSerializer,
+                               UserIdsSerializer, UserSerializer,
+                               serialize_user_values)
+from users.services import (ERRORS_KEY, BulkSubscriptionCreateDelete,
+                            SubscriptionQuerySet, SubsriptionCreateDelete,
                             annotate_follower_and_following_on_request_user,
-                            destroy_from_subscribers)
+                            destroy_from_subscribers, get_list_validators,
+                            get_relationship_stamps, get_relationships)
+from users.suggestions import (get_friend_suggestions, get_mutual_friends,
+                               get_suggestion_settings)
 from users.viewsets import CreateListRetrieveModelViewSet, ListModelViewSet
 
 User = get_user_model()
 
 
-class UserViewSet(CreateListRetrieveModelViewSet):
+class RelationshipStatusMixin:
+    '''
+    Provides the data for `UserSerializer.friendship_status`.
+
+    With the follow graph or the relationship cache enabled the
+    serializer reads the id sets of the request user from them,
+    otherwise the queryset is annotated with `is_follower` and
+    `is_following`. So is it for request users too large for the
+    cache.
+    '''
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._cached_relationships = None
+        self._cached_relationships_read = False
+
+    def annotate_relationships(self, queryset):
+        if (self.request.user.is_anonymous
+                or get_follow_graph_index() is not None):
+            return queryset
+        if (get_relationship_cache() is not None
+                and self.get_request_relationships() is not None):
+            return queryset
+        return annotate_follower_and_following_on_request_user(
+            queryset, self.request.user
+        )
+
+    def get_request_relationships(self, user_ids=None):
+        '''
+        Relationships of the request user for the serializer, None for
+        anonymous users and for the annotated querysets.
+
+        The graph is read on every call, narrowed to `user_ids`. The
+        cache entry is read once per request: whether the queryset was
+        annotated and what the serializer reads must agree, even when
+        the entry is evicted in between.
+        '''
+        if self.request.user.is_anonymous:
+            return None
+        if get_follow_graph_index() is not None:
+            return get_relationships(self.request.user.id, user_ids)
+        if not self._cached_relationships_read:
+            self._cached_relationships = get_relationships(
+                self.request.user.id
+            )
+            self._cached_relationships_read = True
+        return self._cached_relationships
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.request.user.is_authenticated:
+            context['relationships'] = self.get_request_relationships()
+        return context
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(self.get_values(queryset))
+        if page is not None:
+            return self.get_paginated_response(self.serialize_values(page))
+        return Response(self.serialize_values(self.get_values(queryset)))
+
+    def get_values(self, queryset):
+        '''Rows of the `serialize_user_values` fast path.'''
+        fields = ('id', 'username')
+        if 'is_follower' in queryset.query.annotations:
+            fields += ('is_follower', 'is_following')
+        return queryset.values(*fields)
+
+    def serialize_values(self, rows):
+        rows = list(rows)
+        return serialize_user_values(rows, self.get_request_relationships(
+            [row['id'] for row in rows]
+        ))
+
+
+class UserViewSet(RelationshipStatusMixin, CreateListRetrieveModelViewSet):
     queryset = User.objects.all().order_by('id')
     serializer_class = UserSerializer
     lookup_url_kwarg = 'user_id'
 
     def get_queryset(self):
         queryset = super().get_queryset()
-        if self.request.user.is_anonymous:
-            return queryset
-        return annotate_follower_and_following_on_request_user(
-            queryset, self.request.user
-        )
+        return self.annotate_relationships(queryset)
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -45,48 +139,261 @@ class UserViewSet(CreateListRetrieveModelViewSet):
             return subscription.create_subscribe()
         return subscription.delete_subscribe()
 
+    @action(methods=('post', 'delete'), detail=False,
+            url_path='bulk-subscribe')
+    def bulk_subscribe(self, request, *args, **kwargs):
+        ids_serializer = UserIdsSerializer(data=request.data)
+        ids_serializer.is_valid(raise_exception=True)
+        subscription = BulkSubscriptionCreateDelete(
+            request, User.objects.all(),
+            ids_serializer.validated_data['ids']
+        )
+        if request.method == 'POST':
+            return subscription.create_subscribes()
+        return subscription.delete_subscribes()
 
-class SubscribersViewSet(ListModelViewSet):
-    serializer_class = UserSerializer
-    lookup_url_kwarg = 'subscriber_id'
-
-    def destroy(self, request, user_id, subscriber_id):
-        return destroy_from_subscribers(request.user, user_id, subscriber_id)
+    @action(methods=('get',), detail=True)
+    def counters(self, request, *args, **kwargs):
+        user_id = self.kwargs.get(self.lookup_url_kwarg)
+        counters = UserCounters.objects.filter(user_id=user_id).first()
+        if counters is None:
+            # Users without any follows have no counters row yet.
+            counters = UserCounters(
+                user=get_object_or_404(User, id=user_id)
+            )
+        return Response(UserCountersSerializer(counters).data)
 
-    def get_queryset(self):
-        user = get_object_or_404(User, id=self.kwargs.get('user_id'))
-        queryset = SubscriptionQuerySet(user).get_user_subscribers()
-        queryset = queryset.order_by('id')
-        if self.request.user.is_anonymous:
-            return queryset
-        return annotate_follower_and_following_on_request_user(
-            queryset, self.request.user
+    @action(methods=('post',), detail=False)
+    def relationships(self, request, *args, **kwargs):
+        ids_serializer = UserIdsSerializer(data=request.data)
+        ids_serializer.is_valid(raise_exception=True)
+        users = self.get_queryset().filter(
+            id__in=ids_serializer.validated_data['ids']
         )
+        return Response(self.serialize_values(self.get_values(users)))
 
+    @action(methods=('get',), detail=True)
+    def changes(self, request, *args, **kwargs):
+        '''
+        Follow events of the user after the `since` cursor.
 
-class SubscriptionsViewSet(ListModelViewSet):
-    serializer_class = UserSerializer
+        Without `since` only the current cursor is returned, to follow
+        the feed from. Cursors are positions in the feed of this user.
+        A cursor before missing events is answered with 410: the
+        consumer lists the relationships again and starts over.
+        '''
+        options = get_follow_event_settings()
+        query_serializer = FollowChangesQuerySerializer(
+            data=request.query_params,
+            context={'max_limit': options['MAX_PAGE_SIZE']},
+        )
+        query_serializer.is_valid(raise_exception=True)
+        user = get_object_or_404(User,
+                                 id=self.kwargs.get(self.lookup_url_kwarg))
+        query = query_serializer.validated_data
+        if 'since' not in query:
+            return Response({'cursor': get_current_cursor(user.id),
+                             'has_more': False, 'results': []})
+        try:
+            page = get_changes(user.id, query['since'],
+                               query.get('limit', options['PAGE_SIZE']))
+        except StaleCursorError as error:
+            return Response({ERRORS_KEY: str(error)}, status.HTTP_410_GONE)
+        return Response({
+            'cursor': page.cursor,
+            'has_more': page.has_more,
+            'results': FollowEventSerializer(page.events, many=True).data,
+        })
 
-    def get_queryset(self):
-        user = get_object_or_404(User, id=self.kwargs.get('user_id'))
-        queryset = SubscriptionQuerySet(user).get_user_subscriptions()
-        queryset = queryset.order_by('id')
-        if self.request.user.is_anonymous:
-            return queryset
-        return annotate_follower_and_following_on_request_user(
-            queryset, self.request.user
+    @action(methods=('get',), detail=True, url_path='friend-suggestions')
+    def friend_suggestions(self, request, *args, **kwargs):
+        options = get_suggestion_settings()
+        query_serializer = FriendSuggestionsQuerySerializer(
+            data=request.query_params,
+            context={'max_limit': options['MAX_SUGGESTIONS']},
         )
+        query_serializer.is_valid(raise_exception=True)
+        user = get_object_or_404(User,
+                                 id=self.kwargs.get(self.lookup_url_kwarg))
+        suggestions = get_friend_suggestions(
+            user.id, query_serializer.validated_data['limit']
+        )
+        users = self.get_queryset().filter(
+            id__in=[user_id for user_id, _ in suggestions]
+        )
+        rows = {row['id']: row
+                for row in self.serialize_values(self.get_values(users))}
+        response = Response([
+            {**rows[user_id], 'mutual_friends': mutual_friends}
+            for user_id, mutual_friends in suggestions if user_id in rows
+        ])
+        patch_cache_control(response, private=True,
+                            max_age=options['TIMEOUT'])
+        return response
+
 
+class UserRelationsViewSet(RelationshipStatusMixin, ListModelViewSet):
+    '''
+    Lists the users related to the user of the url, with a streaming
+    NDJSON `export` of the whole list.
 
-class FriendsViewSet(ListModelViewSet):
+    Subclasses implement `get_relation_queryset`.
+    '''
     serializer_class = UserSerializer
+    export_chunk_size = 2000
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # Relationship stamps read by the validators of this request.
+        self.stamps = {}
+
+    def get_relation_queryset(self):
+        raise NotImplementedError
+
+    def get_user(self):
+        return self.get_stamped_user(self.kwargs.get('user_id'))
+
+    def get_stamped_user(self, user_id):
+        '''
+        Return the user, without a query when the validators found its
+        stamp: only existing users have one.
+        '''
+        if int(user_id) in self.stamps:
+            return User(id=int(user_id))
+        return get_object_or_404(User, id=user_id)
 
     def get_queryset(self):
-        user = get_object_or_404(User, id=self.kwargs.get('user_id'))
-        queryset = SubscriptionQuerySet(user).get_user_friends()
-        queryset = queryset.order_by('id')
-        if self.request.user.is_anonymous:
-            return queryset
-        return annotate_follower_and_following_on_request_user(
-            queryset, self.request.user
+        queryset = self.get_relation_queryset().order_by('id')
+        return self.annotate_relationships(queryset)
+
+    def get_stamped_user_ids(self):
+        '''Users whose follows make the list, the user of the url.'''
+        return [int(self.kwargs.get('user_id'))]
+
+    def list(self, request, *args, **kwargs):
+        '''
+        Answer `If-None-Match` and `If-Modified-Since` with 304 when no
+        follow of the listed users or of the request user changed.
+
+        The check reads the relationship stamps of these users with one
+        query, before any query of the list itself. Username changes do
+        not change the stamps, hence the weak ETag: a validated list may
+        show a username changed since.
+        '''
+        validators = self.get_validators()
+        if validators is None:
+            return super().list(request, *args, **kwargs)
+        response = get_conditional_response(request, *validators)
+        if response is None:
+            response = super().list(request, *args, **kwargs)
+        etag, last_modified = validators
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True)
+        return response
+
+    def get_validators(self):
+        '''
+        Return the ETag and the Last-Modified timestamp of the list, see
+        `get_list_validators`.
+        '''
+        user_ids = self.get_stamped_user_ids()
+        request_user_id = self.request.user.id
+        self.stamps = get_relationship_stamps([*user_ids, request_user_id])
+        return get_list_validators(
+            self.stamps, user_ids, request_user_id,
+            (self.request.get_full_path(), self.request.accepted_media_type),
+        )
+
+    @action(methods=('get',), detail=False)
+    def export(self, request, *args, **kwargs):
+        rows = annotate_follower_and_following_on_request_user(
+            self.get_relation_queryset().order_by('id'), request.user
+        ).values_list('id', 'username', 'is_follower', 'is_following')
+        response = StreamingHttpResponse(
+            iter_ndjson_users(rows, self.export_chunk_size),
+            content_type='application/x-ndjson',
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="{self.basename}-'
+            f'{self.kwargs.get("user_id")}.ndjson"'
         )
+        return response
+
+
+class SubscribersViewSet(UserRelationsViewSet):
+    lookup_url_kwarg = 'subscriber_id'
+
+    def destroy(self, request, user_id, subscriber_id):
+        return destroy_from_subscribers(request.user, user_id, subscriber_id)
+
+    def get_relation_queryset(self):
+        return SubscriptionQuerySet(self.get_user()).get_user_subscribers()
+
+
+class SubscriptionsViewSet(UserRelationsViewSet):
+    def get_relation_queryset(self):
+        return SubscriptionQuerySet(self.get_user()).get_user_subscriptions()
+
+
+class FriendsViewSet(UserRelationsViewSet):
+    def get_relation_queryset(self):
+        return SubscriptionQuerySet(self.get_user()).get_user_friends()
+
+
+class MutualFriendsViewSet(UserRelationsViewSet):
+    def get_relation_queryset(self):
+        other = self.get_stamped_user(self.kwargs.get('other_id'))
+        return get_mutual_friends(self.get_user(), other)
+
+    def get_stamped_user_ids(self):
+        return [*super().get_stamped_user_ids(),
+                int(self.kwargs.get('other_id'))]
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        patch_cache_control(response, private=True,
+                            max_age=get_suggestion_settings()['TIMEOUT'])
+        return response
+
+
+def iter_ndjson_users(rows, chunk_size):
+    '''
+    Yield `UserSerializer` output of `(id, username, is_follower,
+    is_following)` rows as NDJSON, one chunk of lines at a time.
+
+    Rows are read with `.iterator(chunk_size)`, so memory does not grow
+    with the number of users.
+    '''
+    lines = []
+    rows = rows.iterator(chunk_size=chunk_size)
+    for user_id, username, is_follower, is_following in rows:
+        lines.append(json.dumps({
+            'id': user_id,
+            'username': username,
+            'friendship_status': UserSerializer.get_status_by_flags(
+                is_follower, is_following
+            ),
+        }, ensure_ascii=False, separators=(',', ':')))
+        if len(lines) == chunk_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+class MetricsView(APIView):
+    """
+    Aggregated request metrics recorded by `RequestMetricsMiddleware`.
+
+    The registry belongs to the process: under several workers every
+    request reports the requests of the worker that served it.
+    """
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(registry.snapshot())
+
+    def delete(self, request):
+        registry.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)